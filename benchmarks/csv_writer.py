@@ -0,0 +1,98 @@
+"""Compare writing global rows with the frictionless writer and the tuple writer.
+
+Synthetic rows shaped like the global HNO resource with admin 2 locations are written
+with save_iterable (used by Dataset.generate_resource) and write_csv. The files are
+checked to be identical before the median times are reported. Run from the repository
+root:
+
+    python benchmarks/csv_writer.py [--sizes 10000,100000] [--runs 3]
+"""
+
+import argparse
+import logging
+from os.path import join
+from random import Random
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from hdx.utilities.loader import load_yaml
+from hdx.utilities.path import script_dir_plus_file
+from hdx.utilities.saver import save_iterable
+
+from hdx.scraper.hno.csv_writer import get_admin_headers, write_csv
+from hdx.scraper.hno.plan import Plan
+
+
+def generate_rows(size: int) -> dict:
+    random = Random(size)
+    rows = {}
+    for i in range(size):
+        countryiso3 = f"X{i // 10000:02d}"
+        key = (countryiso3, f"{i % 50:02d}", f"{i:06d}", "EDU", "")
+        rows[key] = {
+            "Country ISO3": countryiso3,
+            "Admin 1 PCode": f"{countryiso3}{i % 50:02d}",
+            "Admin 1 Name": f"Admin 1, {i % 50}",
+            "Admin 2 PCode": f"{countryiso3}{i:06d}",
+            "Admin 2 Name": f"Admin 2 {i}",
+            "Description": "Education",
+            "Cluster": "EDU",
+            "Category": "",
+            "Population": random.randint(0, 1000000),
+            "In Need": random.randint(0, 100000),
+            "Targeted": None,
+            "Reached": random.randint(0, 10000),
+            "Info": "",
+        }
+    return rows
+
+
+def time_writer(write, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = perf_counter()
+        write()
+        times.append(perf_counter() - start)
+    return median(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    configuration = load_yaml(
+        script_dir_plus_file(join("config", "project_configuration.yaml"), Plan)
+    )
+    headers = get_admin_headers(
+        tuple(configuration["headers"]), 2, int(configuration["max_admin"])
+    )
+    print(f"{'rows':>8} {'frictionless (ms)':>18} {'tuples (ms)':>12} {'speedup':>8}")
+    with TemporaryDirectory() as tempdir:
+        frictionless_path = join(tempdir, "frictionless.csv")
+        tuples_path = join(tempdir, "tuples.csv")
+        for size in args.sizes.split(","):
+            rows = generate_rows(int(size))
+            frictionless_time = time_writer(
+                lambda: save_iterable(
+                    frictionless_path,
+                    (rows[key] for key in sorted(rows)),
+                    list(headers),
+                ),
+                args.runs,
+            )
+            tuples_time = time_writer(
+                lambda: write_csv(tuples_path, headers, rows), args.runs
+            )
+            with open(frictionless_path, "rb") as fp, open(tuples_path, "rb") as tp:
+                if fp.read() != tp.read():
+                    raise ValueError(f"Writers give different files for {size} rows!")
+            print(
+                f"{size:>8} {frictionless_time * 1000:>18.1f} {tuples_time * 1000:>12.1f} {frictionless_time / tuples_time:>7.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
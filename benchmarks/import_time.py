@@ -0,0 +1,61 @@
+"""Report the time taken to import the pipeline's entry point.
+
+Runs python -X importtime in fresh interpreters and reports the median total along
+with the slowest modules by cumulative time. Run from the repository root:
+
+    python benchmarks/import_time.py [--module hdx.scraper.hno.__main__] [--runs 5]
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+from statistics import median
+
+line_pattern = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def get_import_times(module: str) -> tuple[float, dict[str, tuple[float, int]]]:
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    total = 0
+    modules = {}
+    for line in output.splitlines():
+        match = line_pattern.match(line)
+        if not match:
+            continue
+        self_time, cumulative, indent, name = match.groups()
+        total += int(self_time)
+        modules[name] = (int(cumulative) / 1000, len(indent) // 2)
+    return total / 1000, modules
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="hdx.scraper.hno.__main__")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+    totals = []
+    runs = []
+    for _ in range(args.runs):
+        total, modules = get_import_times(args.module)
+        totals.append(total)
+        runs.append(modules)
+    print(f"{args.module}: median {median(totals):.1f} ms over {args.runs} runs")
+    cumulative = {
+        name: median(run[name][0] for run in runs if name in run)
+        for name in runs[0]
+        if runs[0][name][1] <= 1
+    }
+    print("Slowest top level imports by cumulative time (ms):")
+    for name in sorted(cumulative, key=cumulative.get, reverse=True)[: args.top]:
+        print(f"{cumulative[name]:10.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
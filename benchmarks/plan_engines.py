@@ -0,0 +1,151 @@
+"""Compare the loop and columnar engines that transform caseloads into rows.
+
+Synthetic plans are generated with a number of admin 1 locations each with admin 2
+locations under them and caseloads disaggregated by category for every location. The
+rows from both engines are checked to be identical before the median times are
+reported. Run from the repository root:
+
+    python benchmarks/plan_engines.py [--scales 1,4,16] [--runs 5]
+"""
+
+import argparse
+import gc
+import logging
+from os.path import join
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from hdx.api.utilities.hdx_error_handler import HDXErrorHandler
+from hdx.utilities.loader import load_yaml
+from hdx.utilities.path import script_dir_plus_file
+
+from hdx.scraper.hno.monitor_json import MonitorJSON
+from hdx.scraper.hno.plan import Plan
+
+metric_types = ("totalPopulation", "inNeed", "target", "affected", "expectedReach")
+
+
+def generate_plan(admin1s: int, admin2s: int, clusters: int, categories: int) -> dict:
+    locations = [
+        {"id": 1, "name": "Country", "adminLevel": 0, "pcode": "XY"},
+    ]
+    for i in range(admin1s):
+        admin1_id = len(locations) + 1
+        admin1_pcode = f"XY{i:02d}"
+        locations.append(
+            {
+                "id": admin1_id,
+                "name": f"Admin 1 {i}",
+                "adminLevel": 1,
+                "pcode": admin1_pcode,
+                "parentLocationId": 1,
+            }
+        )
+        for j in range(admin2s):
+            locations.append(
+                {
+                    "id": len(locations) + 1,
+                    "name": f"Admin 2 {i} {j}",
+                    "adminLevel": 2,
+                    "pcode": f"{admin1_pcode}{j:03d}",
+                    "parentLocationId": admin1_id,
+                }
+            )
+    plan_clusters = [
+        {"planClusters": [100 + i], "globalClusterCode": f"C{i}"}
+        for i in range(clusters)
+    ]
+    caseloads = []
+    for entity_id in [None] + [100 + i for i in range(clusters)]:
+        attachments = []
+        for location in locations[1:]:
+            for k in range(categories):
+                # Admin 2 figures sum to less than those of their admin 1
+                if location["adminLevel"] == 1:
+                    value = (100 + categories) * admin2s
+                else:
+                    value = 100 + k
+                attachments.append(
+                    {
+                        "locationId": location["id"],
+                        "categoryLabel": f"Category {k}",
+                        "dataMatrix": [
+                            {"metricType": metric_type, "value": value}
+                            for metric_type in metric_types
+                        ],
+                    }
+                )
+        caseloads.append(
+            {
+                "entityId": entity_id,
+                "caseloadDescription": f"Caseload {entity_id}",
+                "inNeed": 1000,
+                "target": 500,
+                "disaggregatedAttachments": attachments,
+            }
+        )
+    return {
+        "data": {
+            "locations": locations,
+            "caseloads": caseloads,
+            "lastPublishedVersion": "1.0",
+            "lastPublishedDate": "01/01/2024",
+            "planGlobalClusters": plan_clusters,
+        }
+    }
+
+
+def time_engine(
+    configuration: dict, plan_json: dict, engine: str, runs: int
+) -> tuple[float, dict]:
+    times = []
+    with TemporaryDirectory() as tempdir:
+        with HDXErrorHandler(write_to_hdx=False) as error_handler:
+            for _ in range(runs):
+                plan = Plan(configuration, 2024, error_handler, engine=engine)
+                # Garbage from earlier runs would otherwise slow collections
+                rows = None
+                gc.collect()
+                start = perf_counter()
+                _, rows = plan.process("XYZ", "1", MonitorJSON(tempdir), plan_json)
+                times.append(perf_counter() - start)
+    return median(times), rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default="1,4,16")
+    parser.add_argument("--admin2s", type=int, default=10)
+    parser.add_argument("--clusters", type=int, default=10)
+    parser.add_argument("--categories", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    configuration = load_yaml(
+        script_dir_plus_file(join("config", "project_configuration.yaml"), Plan)
+    )
+    print(f"{'attachments':>12} {'loop (ms)':>10} {'columnar (ms)':>14} {'speedup':>8}")
+    for scale in args.scales.split(","):
+        plan_json = generate_plan(
+            int(scale) * 5, args.admin2s, args.clusters, args.categories
+        )
+        attachments = sum(
+            len(caseload["disaggregatedAttachments"])
+            for caseload in plan_json["data"]["caseloads"]
+        )
+        loop_time, loop_rows = time_engine(configuration, plan_json, "loop", args.runs)
+        columnar_time, columnar_rows = time_engine(
+            configuration, plan_json, "columnar", args.runs
+        )
+        if [list(row.items()) for row in loop_rows.values()] != [
+            list(row.items()) for row in columnar_rows.values()
+        ]:
+            raise ValueError(f"Engines give different rows for scale {scale}!")
+        print(
+            f"{attachments:>12} {loop_time * 1000:>10.1f} {columnar_time * 1000:>14.1f} {loop_time / columnar_time:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Compare uploading the HAPI global resource with uncompressed and compressed bodies.
+
+A local stand-in for the HDX resource_create action reads uploads at a limited rate
+to simulate the link to HDX. The HAPI global CSV fixture is repeated to reach a
+realistic size and uploaded through the same CKAN client used to publish datasets.
+Times include compression. Run from the repository root:
+
+    python benchmarks/upload.py [--repeat 20] [--rate 2000000] [--runs 3]
+"""
+
+import argparse
+import json
+import logging
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os.path import join
+from statistics import median
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import perf_counter, sleep
+
+from hdx.api.configuration import Configuration
+
+from hdx.scraper.hno.resource_compression import compressed_uploads
+
+input_path = join("tests", "fixtures", "hdx_hapi_humanitarian_needs_global_2024.csv")
+
+
+def get_handler(rate: int) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self) -> None:
+            remaining = int(self.headers["Content-Length"])
+            self.server.sizes.append(remaining)
+            chunk_size = max(rate // 100, 1)
+            while remaining:
+                chunk = self.rfile.read(min(chunk_size, remaining))
+                remaining -= len(chunk)
+                sleep(len(chunk) / rate)
+            body = json.dumps({"success": True, "result": {"id": "1"}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+    return Handler
+
+
+def time_upload(
+    server: ThreadingHTTPServer, path: str, method: str | None, runs: int
+) -> tuple[float, int]:
+    configuration = Configuration.read()
+    session = configuration.remoteckan().session
+    times = []
+    for _ in range(runs):
+        start = perf_counter()
+        with compressed_uploads(session, method) if method else nullcontext():
+            with open(path, "rb") as fp:
+                configuration.call_remoteckan(
+                    "resource_create",
+                    {"package_id": "1", "name": "global"},
+                    files={"upload": fp},
+                )
+        times.append(perf_counter() - start)
+    return median(times), server.sizes[-1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--rate", type=int, default=2000000)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), get_handler(args.rate))
+    server.sizes = []
+    Thread(target=server.serve_forever, daemon=True).start()
+    Configuration._create(
+        hdx_url=f"http://127.0.0.1:{server.server_port}",
+        hdx_read_only=False,
+        hdx_key="benchmark",
+        user_agent="benchmark",
+    )
+    methods = [None, "gzip"]
+    try:
+        import zstandard  # noqa: F401
+
+        methods.append("zstd")
+    except ImportError:
+        pass
+    with TemporaryDirectory() as tempdir:
+        path = join(tempdir, "hdx_hapi_humanitarian_needs_global.csv")
+        with open(input_path, "rb") as input_fp, open(path, "wb") as output_fp:
+            header = input_fp.readline()
+            body = input_fp.read()
+            output_fp.write(header)
+            for _ in range(args.repeat):
+                output_fp.write(body)
+        print(f"{'method':>8} {'bytes':>12} {'time (s)':>9} {'speedup':>8}")
+        baseline = None
+        for method in methods:
+            upload_time, size = time_upload(server, path, method, args.runs)
+            if baseline is None:
+                baseline = upload_time
+            print(
+                f"{method or 'none':>8} {size:>12} {upload_time:>9.2f} {baseline / upload_time:>7.2f}x"
+            )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,23 @@
 """Entry point to start HAPI HNO pipeline"""
 
 import logging
+from collections import deque
+from contextlib import AbstractContextManager, nullcontext
+from datetime import datetime
+from functools import partial
 from os import getenv
 from os.path import expanduser, join
+from signal import SIGINT, SIGTERM, signal
+from time import perf_counter
+from typing import TYPE_CHECKING
 
 from hdx.api.configuration import Configuration
 from hdx.api.utilities.hdx_error_handler import HDXErrorHandler
-from hdx.data.dataset import Dataset
 from hdx.data.user import User
 from hdx.facades.infer_arguments import facade
 from hdx.pipelineutils.reader import Read
 from hdx.utilities.dateparse import now_utc
+from hdx.utilities.dictandlist import dict_of_sets_add
 from hdx.utilities.easy_logging import setup_logging
 from hdx.utilities.path import (
     script_dir_plus_file,
@@ -18,14 +25,27 @@ from hdx.utilities.path import (
 )
 
 from hdx.scraper.hno._version import __version__
+from hdx.scraper.hno.checkpoint import Checkpoint
 from hdx.scraper.hno.dataset_generator import DatasetGenerator
 from hdx.scraper.hno.hapi_dataset_generator import HAPIDatasetGenerator
 from hdx.scraper.hno.hapi_output import HAPIOutput
+from hdx.scraper.hno.instrumentation import Instruments
 from hdx.scraper.hno.monitor_json import MonitorJSON
 from hdx.scraper.hno.plan import Plan
 from hdx.scraper.hno.progress_json import ProgressJSON
+from hdx.scraper.hno.rate_controller import setup_rate_controllers
 from hdx.scraper.hno.timeperiod_helper import TimePeriodHelper
 
+# Modules only needed by some stages or flags are imported where they are used so
+# that small runs start quickly
+if TYPE_CHECKING:
+    from hdx.location.adminlevel import AdminLevel
+
+    from hdx.scraper.hno.diff import RowDiff
+    from hdx.scraper.hno.pcode_index import PcodeIndex
+    from hdx.scraper.hno.scheduler import Scheduler
+    from hdx.scraper.hno.sector_mapping import SectorMapping
+
 setup_logging()
 logger = logging.getLogger(__name__)
 
@@ -37,6 +57,732 @@ generate_global_dataset = True
 generate_hapi_dataset = True
 
 
+def publish_country_dataset(
+    dataset_generator: DatasetGenerator,
+    countryiso3: str,
+    rows: dict,
+    highest_admin: int,
+    published: datetime | None,
+    folder: str,
+    batch: str,
+    country_datasets: bool,
+    checkpoint: Checkpoint | None = None,
+    key: str | None = None,
+) -> None:
+    dataset = dataset_generator.get_country_dataset(countryiso3)
+    if not dataset:
+        logger.warning(f"No dataset found for {countryiso3}, generating!")
+        dataset = dataset_generator.generate_country_dataset(
+            countryiso3, folder, rows, highest_admin
+        )
+        dataset.update_from_yaml(
+            script_dir_plus_file(join("config", "hdx_dataset_static.yaml"), main)
+        )
+        if checkpoint:
+            checkpoint.record(key, "csv_written")
+        if country_datasets:
+            dataset.create_in_hdx(
+                match_resource_order=True,
+                remove_additional_resources=False,
+                updated_by_script=updated_by_script,
+                batch=batch,
+            )
+            if checkpoint:
+                checkpoint.record(key, "published")
+    else:
+        resource = dataset_generator.add_country_resource(
+            dataset, countryiso3, rows, folder, highest_admin
+        )
+        if not resource:
+            return
+        if checkpoint:
+            checkpoint.record(key, "csv_written")
+        resource.set_date_data_updated(published)
+        if country_datasets:
+            dataset.update_in_hdx(
+                operation="patch",
+                match_resource_order=True,
+                remove_additional_resources=False,
+                updated_by_script=updated_by_script,
+                batch=batch,
+            )
+            if checkpoint:
+                checkpoint.record(key, "published")
+
+
+def process_countries(
+    plan: Plan,
+    error_handler: HDXErrorHandler,
+    dataset_generator: DatasetGenerator,
+    hapi_output: HAPIOutput,
+    plan_ids_countries: list[dict],
+    checkpoint: Checkpoint | None,
+    folder: str,
+    batch: str,
+    saved_dir: str,
+    save_test_data: bool,
+    country_datasets: bool,
+    plan_requeues: int = 0,
+    compress_test_data: bool = False,
+    scheduler: "Scheduler | None" = None,
+) -> list[str]:
+    from hdx.scraper.hno.memory_tracker import memory_snapshot
+    from hdx.scraper.hno.profiling import profile
+
+    countries_with_data = []
+    if scheduler:
+        plan_ids_countries = scheduler.order(plan_ids_countries)
+        scheduler.start()
+    # Plans whose download fails are put back at the end of the queue so that
+    # transient failures do not drop a country
+    queue = deque((plan_id_country, 0) for plan_id_country in plan_ids_countries)
+    while queue:
+        plan_id_country, requeues = queue.popleft()
+        countryiso3 = plan_id_country["iso3"]
+        plan_id = plan_id_country["id"]
+        key = Checkpoint.get_key(countryiso3, plan_id)
+        start = perf_counter()
+        timed = False
+        deferred = False
+        if checkpoint and checkpoint.is_done(key, "transformed"):
+            # The scheduler keeps the rows so they are not also in the checkpoint
+            if scheduler:
+                published, rows, highest_admin = scheduler.load(countryiso3, plan_id)
+            else:
+                published, rows, highest_admin = checkpoint.load(key, "transformed")
+            plan.restore(countryiso3, rows, highest_admin)
+        elif scheduler and scheduler.should_defer(countryiso3, plan_id):
+            # Rows of the unchanged plan from a previous run keep the global
+            # outputs complete
+            logger.info(f"Deferring unchanged {countryiso3} plan {plan_id}")
+            published, rows, highest_admin = scheduler.load(countryiso3, plan_id)
+            plan.restore(countryiso3, rows, highest_admin)
+            deferred = True
+        else:
+            if checkpoint and checkpoint.is_done(key, "fetched"):
+                json = checkpoint.load(key, "fetched")
+            else:
+                json = plan.download(plan_id)
+                if json is not None:
+                    if checkpoint:
+                        checkpoint.record(key, "fetched", json)
+                elif requeues < plan_requeues:
+                    logger.warning(f"Requeuing {countryiso3} plan {plan_id}")
+                    queue.append((plan_id_country, requeues + 1))
+                    continue
+            if json is None:
+                fallback = scheduler is not None and scheduler.has_rows(
+                    countryiso3, plan_id
+                )
+                text = f"could not download plan {plan_id} for {countryiso3}"
+                if fallback:
+                    text = f"{text} so using rows from a previous run"
+                logger.error(
+                    f"Plan {plan_id} for {countryiso3} failed after {requeues} requeues"
+                )
+                error_handler.add_message("HumanitarianNeeds", "HPC", text)
+                if not fallback:
+                    continue
+                # As for a deferred plan, the previous rows keep the global outputs
+                # complete but the country dataset is not republished
+                published, rows, highest_admin = scheduler.load(countryiso3, plan_id)
+                plan.restore(countryiso3, rows, highest_admin)
+                deferred = True
+            else:
+                monitor_json = MonitorJSON(
+                    saved_dir, save_test_data, compress_test_data
+                )
+                with profile("plan", countryiso3):
+                    published, rows = plan.process(
+                        countryiso3, plan_id, monitor_json, json
+                    )
+                highest_admin = plan.get_highest_admin(countryiso3)
+                if scheduler:
+                    scheduler.save(
+                        countryiso3, plan_id, (published, rows, highest_admin), json
+                    )
+                    timed = True
+                if checkpoint:
+                    if scheduler:
+                        checkpoint.record(key, "transformed")
+                    else:
+                        checkpoint.record(
+                            key, "transformed", (published, rows, highest_admin)
+                        )
+                    checkpoint.discard(key, "fetched")
+        if not rows:
+            continue
+        with profile("hapi", countryiso3):
+            hapi_output.process(countryiso3, rows)
+        countries_with_data.append(countryiso3)
+        memory_snapshot(f"country {countryiso3}")
+        if not generate_country_resources or deferred:
+            pass
+        elif checkpoint and checkpoint.is_done(key, "published"):
+            logger.info(f"{countryiso3} already published, skipping")
+        else:
+            with profile("publish", countryiso3):
+                publish_country_dataset(
+                    dataset_generator,
+                    countryiso3,
+                    rows,
+                    highest_admin,
+                    published,
+                    folder,
+                    batch,
+                    country_datasets,
+                    checkpoint,
+                    key,
+                )
+        if timed:
+            scheduler.record_time(countryiso3, plan_id, perf_counter() - start)
+    if scheduler:
+        scheduler.commit()
+    return countries_with_data
+
+
+def get_upload_context(
+    configuration: Configuration, compress_resources: str | None
+) -> AbstractContextManager:
+    if not compress_resources:
+        return nullcontext()
+    from hdx.scraper.hno.resource_compression import compressed_uploads
+
+    return compressed_uploads(configuration.remoteckan().session, compress_resources)
+
+
+def publish_global_datasets(
+    configuration: Configuration,
+    plan: Plan,
+    timeperiod_helper: TimePeriodHelper,
+    dataset_generator: DatasetGenerator,
+    hapi_output: HAPIOutput,
+    countries_with_data: list[str],
+    folder: str,
+    batch: str,
+    cache_dir: str | None = None,
+    row_diffs: "dict[str, RowDiff] | None" = None,
+    compress_resources: str | None = None,
+) -> None:
+    from hdx.data.dataset import Dataset
+
+    # Without knowing which countries changed, the global files are rebuilt in full
+    if cache_dir and row_diffs:
+        from hdx.scraper.hno.partitioned_csv import PartitionedCSV
+
+        year = timeperiod_helper.get_year()
+        partitioned_csv = PartitionedCSV(cache_dir, f"hpc_hno_{year}")
+        filename = configuration["hapi_dataset"]["resource"]["filename"]
+        hapi_partitioned_csv = PartitionedCSV(cache_dir, f"{filename}_{year}")
+        hno_changed_countries = set(row_diffs["hno"].summary)
+        hapi_changed_countries = set(row_diffs["hapi"].summary)
+    else:
+        partitioned_csv = None
+        hapi_partitioned_csv = None
+        hno_changed_countries = None
+        hapi_changed_countries = None
+    global_rows = plan.get_global_rows()
+    global_highest_admin = plan.get_global_highest_admin()
+    dataset = Dataset.read_from_hdx(dataset_generator.slugified_name)
+    if dataset:
+        resource = dataset_generator.add_global_resource(
+            dataset,
+            global_rows,
+            folder,
+            global_highest_admin,
+            partitioned_csv,
+            hno_changed_countries,
+        )
+    else:
+        dataset, resource = dataset_generator.generate_global_dataset(
+            folder,
+            global_rows,
+            countries_with_data,
+            global_highest_admin,
+            partitioned_csv,
+            hno_changed_countries,
+        )
+    if dataset:
+        dataset.update_from_yaml(
+            script_dir_plus_file(join("config", "hdx_dataset_static.yaml"), main)
+        )
+        if global_highest_admin == 0:
+            filename = "hdx_resource_view_static_adm0.yaml"
+        else:
+            filename = "hdx_resource_view_static.yaml"
+        dataset.generate_quickcharts(
+            0,
+            script_dir_plus_file(join("config", filename), main),
+        )
+        with get_upload_context(configuration, compress_resources):
+            dataset.create_in_hdx(
+                match_resource_order=True,
+                remove_additional_resources=False,
+                updated_by_script=updated_by_script,
+                batch=batch,
+            )
+        # The diff snapshot and copy of the output only move forward once published
+        # so that the next run compares against and copies what is on HDX
+        if partitioned_csv:
+            partitioned_csv.commit()
+            row_diffs["hno"].commit()
+
+        # We need the global dataset id and resource id
+        if generate_hapi_dataset:
+            resource_id = resource.get("id")
+            resource_name = resource["name"]
+            dataset_name = dataset["name"]
+            hapi_output.add_negative_rounded_errors(resource_name, dataset_name)
+            if not resource_id:
+                name = resource["name"]
+                for resource in dataset.get_resources():
+                    if resource["name"] == name:
+                        resource_id = resource["id"]
+                        break
+            if resource_id:
+                global_rows = hapi_output.get_global_rows()
+                hapi_dataset_generator = HAPIDatasetGenerator(
+                    configuration,
+                    timeperiod_helper,
+                    global_rows,
+                    countries_with_data,
+                )
+                dataset_id = dataset["id"]
+                dataset = Dataset.read_from_hdx(hapi_dataset_generator.slugified_name)
+                if dataset:
+                    time_period = dataset.get_time_period()
+                else:
+                    time_period = None
+                dataset = hapi_dataset_generator.generate_needs_dataset(
+                    folder,
+                    countries_with_data,
+                    dataset_id,
+                    resource_id,
+                    time_period,
+                    hapi_partitioned_csv,
+                    hapi_changed_countries,
+                )
+                if dataset:
+                    dataset.update_from_yaml(
+                        script_dir_plus_file(
+                            join(
+                                "config",
+                                "hdx_hapi_dataset_static.yaml",
+                            ),
+                            main,
+                        )
+                    )
+                    with get_upload_context(configuration, compress_resources):
+                        dataset.create_in_hdx(
+                            remove_additional_resources=False,
+                            updated_by_script=updated_by_script,
+                            batch=batch,
+                        )
+                    if hapi_partitioned_csv:
+                        hapi_partitioned_csv.commit()
+                        row_diffs["hapi"].commit()
+                    resources = sorted(
+                        dataset.get_resources(),
+                        key=lambda r: r["name"],
+                        reverse=True,
+                    )
+                    dataset.reorder_resources(
+                        [r["id"] for r in resources],
+                    )
+
+
+def diff_global_outputs(
+    configuration: Configuration,
+    cache_dir: str,
+    year: int,
+    plan: Plan,
+    hapi_output: HAPIOutput,
+) -> "dict[str, RowDiff]":
+    from hdx.scraper.hno.diff import RowDiff
+
+    hno_diff = RowDiff(cache_dir, f"hpc_hno_{year}", configuration["headers"])
+    hno_diff.diff(plan.get_global_rows())
+    resource_config = configuration["hapi_dataset"]["resource"]
+    # HDX ids are only added to the rows when the HAPI dataset is generated
+    hapi_headers = [
+        header
+        for header in resource_config["headers"]
+        if header not in ("dataset_hdx_id", "resource_hdx_id")
+    ]
+    hapi_diff = RowDiff(
+        cache_dir, f"{resource_config['filename']}_{year}", hapi_headers
+    )
+    hapi_diff.diff(hapi_output.get_global_rows())
+    return {"hno": hno_diff, "hapi": hapi_diff}
+
+
+def index_global_rows(
+    configuration: Configuration,
+    query_db: str,
+    year: int,
+    plan: Plan,
+    hapi_output: HAPIOutput,
+) -> None:
+    # Modules only needed by optional stages are imported when used
+    from hdx.scraper.hno.query_index import QueryIndex
+
+    with QueryIndex(query_db) as query_index:
+        query_index.build(
+            year,
+            configuration["headers"],
+            plan.get_global_rows(),
+            configuration["hapi_dataset"]["resource"]["headers"],
+            hapi_output.get_global_rows(),
+        )
+
+
+def get_years(year: str | None, years: str, today: datetime) -> list[int]:
+    """Get the years to process from a years string of form 2020-2026 or
+    2020,2022 if given, otherwise from year, the YEAR environment variable or the
+    current year.
+
+    Args:
+        year (Optional[str]): Year to process
+        years (str): Years to process
+        today (datetime): Today's date
+
+    Returns:
+        List of years
+    """
+    if not years:
+        if not year:
+            year = getenv("YEAR")
+        if not year:
+            year = today.year
+        return [int(year)]
+    output = []
+    for part in years.split(","):
+        if "-" in part:
+            start, end = part.split("-")
+            output.extend(range(int(start), int(end) + 1))
+        else:
+            output.append(int(part))
+    return sorted(set(output))
+
+
+def setup_shared(
+    configuration: Configuration,
+    error_handler: HDXErrorHandler,
+    year: int,
+    countryiso3s: list[str] | None,
+    pcodes: str,
+    pcodes_file: str,
+    merge_shards: bool,
+) -> tuple["PcodeIndex | None", "list[AdminLevel] | None", "SectorMapping | None"]:
+    """Set up the p-codes to process, admin tables and sector mapping, which do not
+    depend upon the year so are shared by all years. The admin tables are set up in
+    their own profiled stage before any country is processed. Merging shards does not
+    need them unless p-codes ending in * are given, whose descendants are found using
+    the admin tables.
+
+    Args:
+        configuration (Configuration): Configuration
+        error_handler (HDXErrorHandler): Error handler
+        year (int): First year to process
+        countryiso3s (Optional[List[str]]): Countries to process
+        pcodes (str): P-codes to process
+        pcodes_file (str): File of p-codes to process
+        merge_shards (bool): Whether shards are being merged
+
+    Returns:
+        Tuple of (p-codes to process, admin tables, sector mapping)
+    """
+    if pcodes_file or pcodes:
+        from hdx.scraper.hno.pcode_index import PcodeIndex
+
+        if pcodes_file:
+            pcodes = PcodeIndex.from_file(pcodes_file)
+        else:
+            pcodes = PcodeIndex(pcodes.split(","))
+    else:
+        pcodes = None
+    if merge_shards and not (pcodes and pcodes.has_roots()):
+        return pcodes, None, None
+    hapi_output = HAPIOutput(
+        configuration,
+        TimePeriodHelper(configuration, year),
+        error_handler,
+        DatasetGenerator.global_name,
+        countryiso3s,
+    )
+    admins = hapi_output.get_admins()
+    if pcodes:
+        pcodes.add_parents(PcodeIndex.get_parents(admins))
+    if merge_shards:
+        return pcodes, admins, None
+    return pcodes, admins, hapi_output.get_sector()
+
+
+# Set before forking so that workers inherit it rather than it being pickled
+_run_year_in_worker = None
+
+
+def setup_worker() -> None:
+    # Pooled connections inherited from the parent must not be shared by
+    # forked workers so drop them and let each worker open its own
+    from hdx.utilities.downloader import Download
+
+    for downloader in Download.downloaders.values():
+        downloader.session.close()
+    Configuration.read().remoteckan().session.close()
+
+
+def run_year_in_worker(year: int) -> dict:
+    return _run_year_in_worker(year)
+
+
+def run_year(
+    configuration: Configuration,
+    error_handler: HDXErrorHandler,
+    year: int,
+    countryiso3s: list[str] | None,
+    pcodes: "PcodeIndex | None",
+    admins: "list[AdminLevel] | None",
+    sector: "SectorMapping | None",
+    folder: str,
+    batch: str,
+    saved_dir: str,
+    save_test_data: bool,
+    country_datasets: bool,
+    resume: bool,
+    shard: str,
+    merge_shards: bool,
+    shard_dir: str,
+    shard_batch: str | None = None,
+    compress_test_data: bool = False,
+    cache_dir: str | None = None,
+    query_db: str | None = None,
+    engine: str = "loop",
+    compress_resources: str | None = None,
+    time_budget: float | None = None,
+    keep_checkpoint: bool = False,
+) -> dict:
+    from hdx.scraper.hno.memory_tracker import memory_snapshot
+    from hdx.scraper.hno.profiling import profile
+
+    logger.info(f"Running for year {year}...")
+    if shard:
+        from hdx.scraper.hno.shards import Shards, parse_shard, select_plans
+
+        shard_index, shard_count = parse_shard(shard)
+        if merge_shards:
+            shard_index = None
+    else:
+        if merge_shards:
+            raise ValueError("Shard count must be given eg. --shard 1/4!")
+        shard_index = None
+        shard_count = 1
+    plan = Plan(
+        configuration, year, error_handler, countryiso3s, pcodes, cache_dir, engine
+    )
+    timeperiod_helper = TimePeriodHelper(configuration, year)
+    dataset_generator = DatasetGenerator(configuration, timeperiod_helper)
+    hapi_output = HAPIOutput(
+        configuration,
+        timeperiod_helper,
+        error_handler,
+        dataset_generator.global_name,
+        countryiso3s,
+        sector,
+    )
+    if merge_shards:
+        shards = Shards(shard_dir, year, shard_count, shard_batch)
+        countries_with_data = shards.merge(plan, hapi_output)
+    else:
+        if admins is not None:
+            hapi_output.setup_admins(admins)
+        if keep_checkpoint or resume:
+            checkpoint = Checkpoint(join(folder, str(year)), resume)
+        else:
+            checkpoint = None
+        if checkpoint and checkpoint.is_done(Checkpoint.plans_key, "fetched"):
+            plan_ids_countries = checkpoint.load(Checkpoint.plans_key, "fetched")
+        else:
+            progress_json = ProgressJSON(
+                year, saved_dir, save_test_data, compress_test_data
+            )
+            plan_ids_countries = plan.get_plan_ids_and_countries(progress_json)
+            if checkpoint:
+                checkpoint.record(Checkpoint.plans_key, "fetched", plan_ids_countries)
+        if shard_index is not None:
+            plan_ids_countries = select_plans(
+                plan_ids_countries, shard_index, shard_count
+            )
+            logger.info(f"Shard {shard} has {len(plan_ids_countries)} plans")
+        if cache_dir:
+            from hdx.scraper.hno.scheduler import Scheduler
+
+            scheduler = Scheduler(cache_dir, year, plan, time_budget)
+        else:
+            scheduler = None
+        countries_with_data = process_countries(
+            plan,
+            error_handler,
+            dataset_generator,
+            hapi_output,
+            plan_ids_countries,
+            checkpoint,
+            folder,
+            batch,
+            saved_dir,
+            save_test_data,
+            country_datasets,
+            configuration.get("plan_requeues", 0),
+            compress_test_data,
+            scheduler,
+        )
+
+    if shard_index is not None and not merge_shards:
+        shards = Shards(shard_dir, year, shard_count, shard_batch)
+        shards.write(shard_index, plan, hapi_output, countries_with_data)
+    elif generate_global_dataset:
+        if cache_dir:
+            row_diffs = diff_global_outputs(
+                configuration, cache_dir, year, plan, hapi_output
+            )
+        else:
+            row_diffs = None
+        memory_snapshot(f"countries {year}")
+        with profile("publish"):
+            publish_global_datasets(
+                configuration,
+                plan,
+                timeperiod_helper,
+                dataset_generator,
+                hapi_output,
+                countries_with_data,
+                folder,
+                batch,
+                cache_dir,
+                row_diffs,
+                compress_resources,
+            )
+        memory_snapshot(f"global datasets {year}")
+        if query_db:
+            index_global_rows(configuration, query_db, year, plan, hapi_output)
+    return error_handler.shared_errors
+
+
+def watch_year(
+    configuration: Configuration,
+    err_to_hdx: str | None,
+    year: int,
+    countryiso3s: list[str] | None,
+    pcodes: "PcodeIndex | None",
+    admins: "list[AdminLevel] | None",
+    sector: "SectorMapping | None",
+    folder: str,
+    batch: str,
+    saved_dir: str,
+    save_test_data: bool,
+    country_datasets: bool,
+    poll_interval: int,
+    debounce: int,
+    compress_test_data: bool = False,
+    query_db: str | None = None,
+    engine: str = "loop",
+    compress_resources: str | None = None,
+) -> None:
+    from hdx.utilities.uuid import get_uuid
+
+    from hdx.scraper.hno.memory_tracker import memory_snapshot
+    from hdx.scraper.hno.profiling import profile
+    from hdx.scraper.hno.watcher import Watcher
+
+    logger.info(f"Watching year {year}...")
+    # Each rebuild of the global datasets has its own errors and batch
+    error_handler = HDXErrorHandler(write_to_hdx=err_to_hdx)
+    plan = Plan(configuration, year, error_handler, countryiso3s, pcodes, engine=engine)
+    timeperiod_helper = TimePeriodHelper(configuration, year)
+    dataset_generator = DatasetGenerator(configuration, timeperiod_helper)
+    hapi_output = HAPIOutput(
+        configuration,
+        timeperiod_helper,
+        error_handler,
+        dataset_generator.global_name,
+        countryiso3s,
+        sector,
+    )
+    if admins is not None:
+        hapi_output.setup_admins(admins)
+
+    def process_country(countryiso3: str, plan_id: str, json: dict) -> bool:
+        monitor_json = MonitorJSON(saved_dir, save_test_data, compress_test_data)
+        with profile("plan", countryiso3):
+            published, rows = plan.process(countryiso3, plan_id, monitor_json, json)
+        if not rows:
+            return False
+        with profile("hapi", countryiso3):
+            hapi_output.process(countryiso3, rows)
+        memory_snapshot(f"country {countryiso3}")
+        if generate_country_resources:
+            with profile("publish", countryiso3):
+                publish_country_dataset(
+                    dataset_generator,
+                    countryiso3,
+                    rows,
+                    plan.get_highest_admin(countryiso3),
+                    published,
+                    folder,
+                    batch,
+                    country_datasets,
+                )
+        return True
+
+    def publish_global(countries_with_data: list[str]) -> None:
+        nonlocal error_handler, batch
+        try:
+            if generate_global_dataset:
+                memory_snapshot(f"countries {year}")
+                with profile("publish"):
+                    publish_global_datasets(
+                        configuration,
+                        plan,
+                        timeperiod_helper,
+                        dataset_generator,
+                        hapi_output,
+                        countries_with_data,
+                        folder,
+                        batch,
+                        compress_resources=compress_resources,
+                    )
+                memory_snapshot(f"global datasets {year}")
+            if query_db:
+                index_global_rows(configuration, query_db, year, plan, hapi_output)
+        finally:
+            error_handler.output_errors()
+            error_handler = HDXErrorHandler(write_to_hdx=err_to_hdx)
+            plan.set_error_handler(error_handler)
+            hapi_output.set_error_handler(error_handler)
+            batch = get_uuid()
+
+    watcher = Watcher(
+        plan,
+        hapi_output,
+        process_country,
+        publish_global,
+        year,
+        saved_dir,
+        poll_interval,
+        debounce,
+    )
+
+    def stop(signum, frame) -> None:
+        logger.info(f"Received signal {signum}, stopping watcher")
+        watcher.stop()
+
+    signal(SIGTERM, stop)
+    signal(SIGINT, stop)
+    watcher.run()
+    # Errors since the last rebuild
+    error_handler.output_errors()
+
+
 def main(
     save: bool = False,
     use_saved: bool = False,
@@ -44,10 +790,36 @@ def main(
     hpc_bearer_token: str = "",
     countryiso3s: str = "",
     pcodes: str = "",
+    pcodes_file: str = "",
     year: str | None = None,
     no_country_datasets: bool = False,
     err_to_hdx: str | None = None,
     save_test_data: bool = False,
+    resume: bool = False,
+    checkpoint: bool = False,
+    shard: str = "",
+    merge_shards: bool = False,
+    shard_dir: str | None = None,
+    shard_batch: str | None = None,
+    years: str = "",
+    workers: int = 1,
+    watch: bool = False,
+    poll_interval: int = 300,
+    debounce: int = 600,
+    store_dir: str | None = None,
+    store_decoded: bool = False,
+    compress_test_data: bool = False,
+    cache_dir: str | None = None,
+    query_db: str | None = None,
+    engine: str = "loop",
+    compress_resources: str | None = None,
+    profile_stages: str = "",
+    profile_dir: str | None = None,
+    http_trace: str | None = None,
+    memory_report: str | None = None,
+    time_budget: float | None = None,
+    refresh_sector_mapping: str | None = None,
+    check_sector_mapping: bool = False,
 ) -> None:
     """Generate datasets and create them in HDX. If year command line option or YEAR
     environment variable is not supplied the current year will be used. If err-to-hdx
@@ -60,14 +832,41 @@ def main(
         hpc_basic_auth (str): Basic auth string. Defaults to "".
         hpc_bearer_token (str): Bearer token. Defaults to "".
         countryiso3s (str): Countries to process. Defaults to "" (all countries).
-        pcodes (str): P-codes to process. Defaults to "" (all p-codes).
+        pcodes (str): P-codes to process. Ending in * includes descendants eg. SD01*. Defaults to "" (all p-codes).
+        pcodes_file (str): File of p-codes to process, one or more per line. Defaults to "" (use pcodes).
         year (Optional[str]): Year to process. Defaults to None.
         no_country_datasets (bool): Whether to not write country datasets to HDX. Defaults to False.
         err_to_hdx (Optional[str]): Whether to write errors to HDX metadata. Defaults to None.
         save_test_data (bool): Whether to save test data. Defaults to False.
+        resume (bool): Whether to resume from the checkpoint of a failed run. Defaults to False.
+        checkpoint (bool): Whether to keep a checkpoint from which a failed run can be resumed. Defaults to False (CHECKPOINT or only when resuming).
+        shard (str): Shard to process of form index/count eg. 1/4. Defaults to "" (all plans).
+        merge_shards (bool): Whether to merge completed shards and publish global datasets. Defaults to False.
+        shard_dir (Optional[str]): Directory for shard files. Defaults to None (SHARD_DIR or shards).
+        shard_batch (Optional[str]): Id shared by the shards of a run and their merge. Needed with shard. Defaults to None (SHARD_BATCH).
+        years (str): Years to process eg. 2020-2026 or 2022,2024. Overrides year. Defaults to "".
+        workers (int): Number of worker processes to use for multiple years. Defaults to 1.
+        watch (bool): Whether to keep running and republish plans when they change. Defaults to False.
+        poll_interval (int): Seconds between polls of HPC in watch mode. Defaults to 300.
+        debounce (int): Seconds without changes before global datasets are rebuilt in watch mode. Defaults to 600.
+        store_dir (Optional[str]): Directory of compressed content addressed store to use for save and use_saved. Defaults to None (SAVED_STORE_DIR or not used).
+        store_decoded (bool): Whether to also keep parsed downloads in the store so replaying is faster. Defaults to False (SAVED_STORE_DECODED or not kept).
+        compress_test_data (bool): Whether to gzip test data. Defaults to False.
+        cache_dir (Optional[str]): Directory for data kept between runs eg. for diffing outputs. Defaults to None (CACHE_DIR or not used).
+        query_db (Optional[str]): SQLite database in which to index global rows for querying. Defaults to None (QUERY_DB or not used).
+        engine (str): Engine for transforming caseloads into rows, loop or columnar. Defaults to "loop".
+        compress_resources (Optional[str]): Compress the request bodies uploading global resources, gzip or zstd. Defaults to None (not compressed).
+        profile_stages (str): Stages to profile eg. plan:AFG,hapi,admins,publish where plan, hapi and publish can be limited to countries. Defaults to "" (PROFILE_STAGES or not profiled).
+        profile_dir (Optional[str]): Directory under which profiles are written in a folder for the batch. Defaults to None (PROFILE_DIR or profiles).
+        http_trace (Optional[str]): JSONL file to which HPC and HDX requests are appended, with a HAR file and summary at the end. Defaults to None (HTTP_TRACE or not traced).
+        memory_report (Optional[str]): JSONL file to which memory use and top allocation sites are appended at the end of stages. Defaults to None (MEMORY_REPORT or not tracked).
+        time_budget (Optional[float]): Seconds in which to process plans, after which unchanged plans are deferred. Needs cache_dir. Defaults to None (TIME_BUDGET or no limit).
+        refresh_sector_mapping (str | None): Path to which to only compile the sector mapping from the coordination groups on HDX. Defaults to None (not compiled).
+        check_sector_mapping (bool): Whether to check in the background that the sector mapping is up to date. Defaults to False (CHECK_SECTOR_MAPPING or not checked).
     Returns:
         None
     """
+    global _run_year_in_worker
     logger.info(f"##### {lookup} version {__version__} ####")
     configuration = Configuration.read()
     User.check_current_user_write_access(
@@ -78,198 +877,198 @@ def main(
         with wheretostart_tempdir_batch(lookup) as info:
             folder = info["folder"]
             batch = info["batch"]
-            if not year:
-                year = getenv("YEAR")
             today = now_utc()
-            if not year:
-                year = today.year
-            year = int(year)
-            logger.info(f"Running for year {year}...")
+            years = get_years(year, years, today)
+            if watch and (len(years) > 1 or shard or merge_shards):
+                raise ValueError("Watch mode can only be used for a single year!")
+            if compress_resources:
+                from hdx.scraper.hno.resource_compression import compression_methods
+
+                if compress_resources not in compression_methods:
+                    raise ValueError(f"Unknown compression {compress_resources}!")
+            if not checkpoint:
+                checkpoint = getenv("CHECKPOINT", "").lower() == "true"
+            if not shard_dir:
+                shard_dir = getenv("SHARD_DIR", "shards")
+            if not shard_batch:
+                shard_batch = getenv("SHARD_BATCH")
+            if shard and not shard_batch:
+                raise ValueError("A shard batch must be given eg. --shard-batch 2024a!")
             saved_dir = "saved_data"
             if not hpc_basic_auth:
                 hpc_basic_auth = getenv("HPC_BASIC_AUTH")
             if not hpc_bearer_token:
                 hpc_bearer_token = getenv("HPC_BEARER_TOKEN")
+            if not store_dir:
+                store_dir = getenv("SAVED_STORE_DIR")
+            if not cache_dir:
+                cache_dir = getenv("CACHE_DIR")
+            if not time_budget:
+                time_budget = getenv("TIME_BUDGET")
+            if time_budget:
+                if not cache_dir:
+                    raise ValueError("A time budget needs a cache directory!")
+                time_budget = float(time_budget)
+            if not query_db:
+                query_db = getenv("QUERY_DB")
+            if not profile_stages:
+                profile_stages = getenv("PROFILE_STAGES")
             Read.create_readers(
                 folder,
                 "saved_data",
                 folder,
-                save,
-                use_saved,
+                # The store replaces the saved data directory when used
+                save and not store_dir,
+                use_saved and not store_dir,
                 hdx_auth=configuration.get_api_key(),
                 basic_auths={"hpc_basic": hpc_basic_auth},
                 bearer_tokens={"hpc_bearer": hpc_bearer_token},
                 today=today,
-                rate_limit={"calls": 1, "period": 1},
             )
-            if countryiso3s:
-                countryiso3s = countryiso3s.split(",")
-            else:
-                countryiso3s = None
-            if pcodes:
-                pcodes = pcodes.split(",")
-            else:
-                pcodes = None
-            plan = Plan(configuration, year, error_handler, countryiso3s, pcodes)
-            timeperiod_helper = TimePeriodHelper(configuration, year)
-            dataset_generator = DatasetGenerator(configuration, timeperiod_helper)
-            hapi_output = HAPIOutput(
-                configuration,
-                timeperiod_helper,
-                error_handler,
-                dataset_generator.global_name,
-            )
-            hapi_output.setup_admins()
-            progress_json = ProgressJSON(year, saved_dir, save_test_data)
-            plan_ids_countries = plan.get_plan_ids_and_countries(progress_json)
+            if store_dir:
+                from hdx.scraper.hno.saved_store import setup_saved_store
 
-            countries_with_data = []
-            for plan_id_country in plan_ids_countries:
-                countryiso3 = plan_id_country["iso3"]
-                plan_id = plan_id_country["id"]
-                monitor_json = MonitorJSON(saved_dir, save_test_data)
-                published, rows = plan.process(countryiso3, plan_id, monitor_json)
-                if not rows:
-                    continue
-                hapi_output.process(countryiso3, rows)
-                countries_with_data.append(countryiso3)
-                if not generate_country_resources:
-                    continue
-                dataset = dataset_generator.get_country_dataset(countryiso3)
-                highest_admin = plan.get_highest_admin(countryiso3)
-                if not dataset:
-                    logger.warning(f"No dataset found for {countryiso3}, generating!")
-                    dataset = dataset_generator.generate_country_dataset(
-                        countryiso3, folder, rows, highest_admin
-                    )
-                    dataset.update_from_yaml(
-                        script_dir_plus_file(
-                            join("config", "hdx_dataset_static.yaml"), main
-                        )
+                if not store_decoded:
+                    store_decoded = getenv("SAVED_STORE_DECODED", "").lower() == "true"
+                setup_saved_store(store_dir, save, use_saved, store_decoded)
+            # Instruments are finished even if the run fails as that is when their
+            # output is most useful
+            with Instruments() as instruments:
+                from hdx.scraper.hno.transport import setup_transport
+
+                # Adapters are replaced so this comes before anything wrapping them
+                instruments.add(
+                    "transport",
+                    setup_transport(
+                        configuration.get("http_pools"),
+                        configuration.remoteckan().session,
+                    ),
+                )
+                setup_rate_controllers(configuration.get("rate_limits", {}))
+                if profile_stages:
+                    from hdx.scraper.hno.profiling import Profiler
+
+                    if not profile_dir:
+                        profile_dir = getenv("PROFILE_DIR", "profiles")
+                    # The temporary folder is deleted on success so profiles are kept
+                    # in a folder for the batch elsewhere
+                    instruments.add(
+                        "profiler", Profiler(join(profile_dir, batch), profile_stages)
                     )
-                    resource = dataset.get_resource(0)
-                    if country_datasets:
-                        dataset.create_in_hdx(
-                            match_resource_order=True,
-                            remove_additional_resources=False,
-                            updated_by_script=updated_by_script,
-                            batch=batch,
-                        )
-                else:
-                    resource = dataset_generator.add_country_resource(
-                        dataset, countryiso3, rows, folder, highest_admin
+                if not memory_report:
+                    memory_report = getenv("MEMORY_REPORT")
+                if memory_report:
+                    from hdx.scraper.hno.memory_tracker import MemoryTracker
+
+                    instruments.add("memory_tracker", MemoryTracker(memory_report))
+                if not http_trace:
+                    http_trace = getenv("HTTP_TRACE")
+                if http_trace:
+                    from hdx.scraper.hno.http_trace import setup_http_trace
+
+                    # Added last so that waits on rate controllers are included
+                    instruments.add(
+                        "http_trace",
+                        setup_http_trace(
+                            http_trace, configuration.remoteckan().session
+                        ),
                     )
-                    if not resource:
-                        continue
-                    resource.set_date_data_updated(published)
-                    if country_datasets:
-                        dataset.update_in_hdx(
-                            operation="patch",
-                            match_resource_order=True,
-                            remove_additional_resources=False,
-                            updated_by_script=updated_by_script,
-                            batch=batch,
-                        )
+                if refresh_sector_mapping:
+                    from hdx.scraper.hno.sector_mapping import compile_sector_mapping
 
-            if generate_global_dataset:
-                global_rows = plan.get_global_rows()
-                global_highest_admin = plan.get_global_highest_admin()
-                dataset = Dataset.read_from_hdx(dataset_generator.slugified_name)
-                if dataset:
-                    resource = dataset_generator.add_global_resource(
-                        dataset,
-                        global_rows,
-                        folder,
-                        global_highest_admin,
+                    compile_sector_mapping(refresh_sector_mapping)
+                    return
+                if not check_sector_mapping:
+                    check_sector_mapping = (
+                        getenv("CHECK_SECTOR_MAPPING", "").lower() == "true"
                     )
+                if check_sector_mapping:
+                    from hdx.scraper.hno.sector_mapping import (
+                        start_sector_mapping_check,
+                    )
+
+                    start_sector_mapping_check()
+                if countryiso3s:
+                    countryiso3s = countryiso3s.split(",")
                 else:
-                    dataset, resource = dataset_generator.generate_global_dataset(
+                    countryiso3s = None
+                pcodes, admins, sector = setup_shared(
+                    configuration,
+                    error_handler,
+                    years[0],
+                    countryiso3s,
+                    pcodes,
+                    pcodes_file,
+                    merge_shards,
+                )
+                run_year_partial = partial(
+                    run_year,
+                    configuration,
+                    error_handler,
+                    countryiso3s=countryiso3s,
+                    pcodes=pcodes,
+                    admins=admins,
+                    sector=sector,
+                    folder=folder,
+                    batch=batch,
+                    saved_dir=saved_dir,
+                    save_test_data=save_test_data,
+                    country_datasets=country_datasets,
+                    resume=resume,
+                    keep_checkpoint=checkpoint,
+                    shard=shard,
+                    merge_shards=merge_shards,
+                    shard_dir=shard_dir,
+                    shard_batch=shard_batch,
+                    compress_test_data=compress_test_data,
+                    cache_dir=cache_dir,
+                    query_db=query_db,
+                    engine=engine,
+                    compress_resources=compress_resources,
+                    time_budget=time_budget,
+                )
+                workers = min(workers, len(years))
+                if watch:
+                    watch_year(
+                        configuration,
+                        err_to_hdx,
+                        years[0],
+                        countryiso3s,
+                        pcodes,
+                        admins,
+                        sector,
                         folder,
-                        global_rows,
-                        countries_with_data,
-                        global_highest_admin,
-                    )
-                if dataset:
-                    dataset.update_from_yaml(
-                        script_dir_plus_file(
-                            join("config", "hdx_dataset_static.yaml"), main
-                        )
-                    )
-                    if global_highest_admin == 0:
-                        filename = "hdx_resource_view_static_adm0.yaml"
-                    else:
-                        filename = "hdx_resource_view_static.yaml"
-                    dataset.generate_quickcharts(
-                        0,
-                        script_dir_plus_file(join("config", filename), main),
-                    )
-                    dataset.create_in_hdx(
-                        match_resource_order=True,
-                        remove_additional_resources=False,
-                        updated_by_script=updated_by_script,
-                        batch=batch,
+                        batch,
+                        saved_dir,
+                        save_test_data,
+                        country_datasets,
+                        poll_interval,
+                        debounce,
+                        compress_test_data,
+                        query_db,
+                        engine,
+                        compress_resources,
                     )
+                elif workers > 1:
+                    logger.info(f"Running {len(years)} years with {workers} workers")
+                    # Fork so that workers inherit the admin tables and sector mappings
+                    _run_year_in_worker = run_year_partial
+                    from multiprocessing import get_context
 
-                    # We need the global dataset id and resource id
-                    if generate_hapi_dataset:
-                        resource_id = resource.get("id")
-                        resource_name = resource["name"]
-                        dataset_name = dataset["name"]
-                        hapi_output.add_negative_rounded_errors(
-                            resource_name, dataset_name
-                        )
-                        if not resource_id:
-                            name = resource["name"]
-                            for resource in dataset.get_resources():
-                                if resource["name"] == name:
-                                    resource_id = resource["id"]
-                                    break
-                        if resource_id:
-                            global_rows = hapi_output.get_global_rows()
-                            hapi_dataset_generator = HAPIDatasetGenerator(
-                                configuration,
-                                timeperiod_helper,
-                                global_rows,
-                                countries_with_data,
-                            )
-                            dataset_id = dataset["id"]
-                            dataset = Dataset.read_from_hdx(
-                                hapi_dataset_generator.slugified_name
-                            )
-                            if dataset:
-                                time_period = dataset.get_time_period()
-                            else:
-                                time_period = None
-                            dataset = hapi_dataset_generator.generate_needs_dataset(
-                                folder,
-                                countries_with_data,
-                                dataset_id,
-                                resource_id,
-                                time_period,
-                            )
-                            if dataset:
-                                dataset.update_from_yaml(
-                                    script_dir_plus_file(
-                                        join(
-                                            "config",
-                                            "hdx_hapi_dataset_static.yaml",
-                                        ),
-                                        main,
-                                    )
-                                )
-                                dataset.create_in_hdx(
-                                    remove_additional_resources=False,
-                                    updated_by_script=updated_by_script,
-                                    batch=batch,
-                                )
-                                resources = sorted(
-                                    dataset.get_resources(),
-                                    key=lambda r: r["name"],
-                                    reverse=True,
-                                )
-                                dataset.reorder_resources(
-                                    [r["id"] for r in resources],
-                                )
+                    context = get_context("fork")
+                    with context.Pool(workers, initializer=setup_worker) as pool:
+                        for shared_errors in pool.imap(run_year_in_worker, years):
+                            for message_type, messages in shared_errors.items():
+                                for category, texts in messages.items():
+                                    for text in texts:
+                                        dict_of_sets_add(
+                                            error_handler.shared_errors[message_type],
+                                            category,
+                                            text,
+                                        )
+                else:
+                    for year in years:
+                        run_year_partial(year)
 
     logger.info("HDX Scraper HNO pipeline completed!")
 
@@ -1,17 +1,23 @@
-import copy
+from .json_stream import JSONStreamWriter
 
 
 class CaseloadJSON:
-    def __init__(self, caseload: dict, save_test_data: bool = False) -> None:
-        self._disaggregated_attachments = []
-        if save_test_data:
-            self._caseload = copy.copy(caseload)
-            del self._caseload["measurements"]
-            self._caseload["disaggregatedAttachments"] = self._disaggregated_attachments
-        else:
-            self._caseload = None
-        self._save_test_data = save_test_data
+    def __init__(self, caseload: dict, writer: JSONStreamWriter | None = None) -> None:
+        self._writer = writer
+        if writer is None:
+            return
+        writer.begin_object()
+        for key, value in caseload.items():
+            if key in ("measurements", "disaggregatedAttachments"):
+                continue
+            writer.value(value, key)
+        writer.begin_array("disaggregatedAttachments")
 
     def add_disaggregated_attachment(self, disaggregated_attachment: dict) -> None:
-        if self._save_test_data:
-            self._disaggregated_attachments.append(disaggregated_attachment)
+        if self._writer:
+            self._writer.value(disaggregated_attachment)
+
+    def close(self) -> None:
+        if self._writer:
+            self._writer.end_array()
+            self._writer.end_object()
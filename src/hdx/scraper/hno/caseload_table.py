@@ -0,0 +1,178 @@
+from .pcode_index import PcodeIndex
+from .plan_index import PlanIndex
+
+
+class CaseloadTable:
+    """Caseloads of a plan exploded into columns with a row for each caseload total
+    followed by a row for each of its disaggregated attachments. Rows are transformed a
+    column at a time: locations are joined from the plan index, metric types pivoted
+    into population statuses and rows grouped on their key taking the first non-empty
+    value of each column. As in the loop in Plan.process, a caseload total replaces
+    any earlier row with the same key.
+
+    Args:
+        population_status_lookup: Mapping from metric type to population status header
+        max_admin: Maximum admin level
+    """
+
+    def __init__(self, population_status_lookup: dict, max_admin: int) -> None:
+        self._population_status_lookup = population_status_lookup
+        self._max_admin = max_admin
+        self.caseloads = []
+        self.base_rows = []
+        self.caseload_indexes = []
+        self.attachments = []
+        self.categories = []
+        self.metrics = {input_key: [] for input_key in population_status_lookup}
+        self.locations = []
+        self.unknown_locations = []
+
+    def __len__(self) -> int:
+        return len(self.caseload_indexes)
+
+    def add_caseload(
+        self, caseload: dict, base_row: dict, publish_disaggregated: bool
+    ) -> None:
+        caseload_index = len(self.caseloads)
+        self.caseloads.append(caseload)
+        self.base_rows.append(base_row)
+        self.caseload_indexes.append(caseload_index)
+        self.attachments.append(None)
+        self.categories.append("")
+        for input_key, column in self.metrics.items():
+            column.append(caseload.get(input_key, ""))
+        if not publish_disaggregated:
+            return
+        for attachment in caseload["disaggregatedAttachments"]:
+            self.caseload_indexes.append(caseload_index)
+            self.attachments.append(attachment)
+            self.categories.append(attachment["categoryLabel"])
+            for column in self.metrics.values():
+                column.append("")
+            # A later value of a metric type replaces an earlier one
+            for x in attachment["dataMatrix"]:
+                column = self.metrics.get(x["metricType"])
+                if column is not None:
+                    column[-1] = x["value"]
+
+    def join_locations(self, plan_index: PlanIndex) -> None:
+        locations = {}
+        for attachment in self.attachments:
+            if attachment is None:
+                continue
+            location_id = attachment["locationId"]
+            if location_id not in locations:
+                locations[location_id] = plan_index.get_location(location_id)
+        # Caseload totals and unknown locations are national
+        self.locations = []
+        self.unknown_locations = []
+        for i, attachment in enumerate(self.attachments):
+            if attachment is None:
+                self.locations.append((0, "", ""))
+                continue
+            location = locations[attachment["locationId"]]
+            if location is None:
+                self.unknown_locations.append(i)
+                location = (0, "", "")
+            self.locations.append(location)
+
+    def select(self, pcodes_to_process: PcodeIndex | None) -> list[int]:
+        if not pcodes_to_process:
+            return list(range(len(self)))
+        return [
+            i
+            for i, (adminlevel, pcode, _) in enumerate(self.locations)
+            if adminlevel == 0 or pcode in pcodes_to_process
+        ]
+
+    def get_highest_admin(self, indexes: list[int]) -> int:
+        return max((self.locations[i][0] for i in indexes), default=0)
+
+    def get_located_attachments(self, indexes: list[int]) -> dict[int, list[dict]]:
+        attachments = {}
+        for i in indexes:
+            if self.locations[i][0] != 0:
+                caseload_index = self.caseload_indexes[i]
+                attachments.setdefault(caseload_index, []).append(self.attachments[i])
+        return attachments
+
+    def get_info_column(self) -> list[str]:
+        base_infos = ["|".join(sorted(row["Info"])) for row in self.base_rows]
+        infos = [base_infos[i] for i in self.caseload_indexes]
+        for i in self.unknown_locations:
+            info = self.base_rows[self.caseload_indexes[i]]["Info"]
+            location_id = self.attachments[i]["locationId"]
+            infos[i] = "|".join(sorted(info | {f"Unknown location {location_id}"}))
+        return infos
+
+    def aggregate(self, indexes: list[int]) -> dict[tuple, tuple[dict, bool]]:
+        """Group the selected rows on their key of admin p-code, cluster, description
+        and category taking the first non-empty value of each column
+
+        Args:
+            indexes: Indexes of selected rows
+
+        Returns:
+            Dictionary of key to row and whether the row includes a caseload total
+        """
+        descriptions = [row["Description"] for row in self.base_rows]
+        descriptions = [descriptions[i] for i in self.caseload_indexes]
+        clusters = [row["Cluster"] for row in self.base_rows]
+        clusters = [clusters[i] for i in self.caseload_indexes]
+        headers = ["Category", "Description", "Info", "Cluster"]
+        columns = [self.categories, descriptions, self.get_info_column(), clusters]
+        for i in range(self._max_admin):
+            adminlevel = i + 1
+            headers.append(f"Admin {adminlevel} PCode")
+            columns.append(
+                [
+                    pcode if level == adminlevel else ""
+                    for level, pcode, _ in self.locations
+                ]
+            )
+            headers.append(f"Admin {adminlevel} Name")
+            columns.append(
+                [
+                    name if level == adminlevel else ""
+                    for level, _, name in self.locations
+                ]
+            )
+        for input_key, header in self._population_status_lookup.items():
+            headers.append(header)
+            columns.append(self.metrics[input_key])
+        keys = list(
+            zip(
+                [pcode if level else "" for level, pcode, _ in self.locations],
+                clusters,
+                descriptions,
+                self.categories,
+            )
+        )
+
+        groups = {}
+        totals = set()
+        for i in indexes:
+            key = keys[i]
+            if self.attachments[i] is None:
+                # Keeps the position of any earlier row with the same key
+                groups[key] = [i]
+                totals.add(key)
+                continue
+            group = groups.get(key)
+            if group is None:
+                groups[key] = [i]
+            else:
+                group.append(i)
+
+        table_rows = list(zip(*columns))
+        rows = {}
+        for key, group in groups.items():
+            if len(group) == 1:
+                values = table_rows[group[0]]
+            else:
+                values = [
+                    next((value for value in column if value), column[0])
+                    for column in zip(*(table_rows[i] for i in group))
+                ]
+            rows[key] = dict(zip(headers, values)), key in totals
+        return rows
@@ -0,0 +1,89 @@
+import gzip
+import json
+import logging
+import pickle
+from os import fsync, makedirs, remove
+from os.path import exists, join
+from shutil import rmtree
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class Checkpoint:
+    """Journal of the stages completed for each plan in a run, kept in the batch
+    temporary folder so that a failed run can be resumed. Intermediate data for a
+    stage is stored as gzipped pickles alongside the journal.
+
+    Args:
+        folder: Batch temporary folder
+        resume: Whether to resume from an existing journal. Defaults to False.
+    """
+
+    stages = ("fetched", "transformed", "csv_written", "published")
+    plans_key = "_plans"
+
+    def __init__(self, folder: str, resume: bool = False) -> None:
+        self._folder = join(folder, "checkpoint")
+        self._journal_path = join(self._folder, "journal.jsonl")
+        self._stages = {}
+        if resume and exists(self._journal_path):
+            self._load_journal()
+            logger.info(f"Resuming from checkpoint with {len(self._stages)} entries")
+        else:
+            rmtree(self._folder, ignore_errors=True)
+        makedirs(self._folder, exist_ok=True)
+
+    @staticmethod
+    def get_key(countryiso3: str, plan_id: str | int) -> str:
+        return f"{countryiso3}_{plan_id}"
+
+    def _load_journal(self) -> None:
+        with open(self._journal_path, encoding="utf-8") as fp:
+            for line in fp:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Last line may be truncated if the run died while writing it
+                    logger.warning(f"Ignoring corrupt checkpoint entry: {line}")
+                    continue
+                self._stages[entry["key"]] = entry["stage"]
+
+    def _get_path(self, key: str, stage: str) -> str:
+        return join(self._folder, f"{key}_{stage}.pkl.gz")
+
+    def get_stage(self, key: str) -> str | None:
+        return self._stages.get(key)
+
+    def is_done(self, key: str, stage: str) -> bool:
+        current_stage = self._stages.get(key)
+        if current_stage is None:
+            return False
+        return self.stages.index(current_stage) >= self.stages.index(stage)
+
+    def record(self, key: str, stage: str, data: Any = None) -> None:
+        if data is not None:
+            with gzip.open(self._get_path(key, stage), "wb", compresslevel=1) as fp:
+                pickle.dump(data, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        # The journal entry is only written once the data is safely on disk
+        with open(self._journal_path, "a", encoding="utf-8") as fp:
+            fp.write(json.dumps({"key": key, "stage": stage}))
+            fp.write("\n")
+            fp.flush()
+            fsync(fp.fileno())
+        self._stages[key] = stage
+
+    def load(self, key: str, stage: str) -> Any:
+        path = self._get_path(key, stage)
+        if not exists(path):
+            return None
+        with gzip.open(path, "rb") as fp:
+            return pickle.load(fp)
+
+    def discard(self, key: str, stage: str) -> None:
+        path = self._get_path(key, stage)
+        if exists(path):
+            remove(path)
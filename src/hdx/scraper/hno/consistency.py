@@ -0,0 +1,133 @@
+from operator import itemgetter
+
+from hdx.api.configuration import Configuration
+
+from .error_aggregator import ErrorAggregator
+
+
+class ConsistencyChecker:
+    """Checks that the subnational figures of a country are consistent with those of
+    the areas containing them. Figures of rows for each cluster, description and
+    category are summed by the nearest containing area that has a row, or else by the
+    national row. Subnational totals are compared with the national caseload total
+    when there is no national row for their category. Sums exceeding the figure of the
+    containing area by more than the tolerance are flagged. Sums below it are expected
+    as plans often do not cover the whole country.
+
+    Args:
+        configuration: Configuration
+        errors: Aggregator of messages to pass to the error handler
+    """
+
+    total_categories = ("total",)
+
+    def __init__(self, configuration: Configuration, errors: ErrorAggregator) -> None:
+        consistency = configuration["consistency"]
+        self._tolerance = consistency["tolerance"]
+        self._population_statuses = tuple(consistency["population_statuses"])
+        self._errors = errors
+
+    def get_children(
+        self, rows: dict, parents: dict[str, str]
+    ) -> dict[tuple, list[dict]]:
+        # Ancestors with rows are found once for each p-code. P-codes in parents are
+        # stripped.
+        adm_codes = {key[0] for key in rows}
+        adm_codes = {adm_code.strip(): adm_code for adm_code in adm_codes}
+        ancestors = {}
+        for pcode, adm_code in adm_codes.items():
+            if not adm_code:
+                continue
+            adm_code_ancestors = []
+            parent = parents.get(pcode)
+            while parent:
+                parent_adm_code = adm_codes.get(parent)
+                if parent_adm_code:
+                    adm_code_ancestors.append(parent_adm_code)
+                parent = parents.get(parent)
+            ancestors[adm_code] = adm_code_ancestors
+
+        children = {}
+        for key, row in rows.items():
+            adm_code, cluster, description, category = key
+            if not adm_code:
+                continue
+            for parent_adm_code in ancestors[adm_code]:
+                parent_key = (parent_adm_code, cluster, description, category)
+                if parent_key in rows:
+                    break
+            else:
+                parent_key = ("", cluster, description, category)
+                if parent_key not in rows:
+                    if category.lower() not in self.total_categories:
+                        continue
+                    parent_key = ("", cluster, description, "")
+                    if parent_key not in rows:
+                        continue
+            parent_children = children.get(parent_key)
+            if parent_children is None:
+                children[parent_key] = [row]
+            else:
+                parent_children.append(row)
+        return children
+
+    @staticmethod
+    def get_sum(values: tuple) -> int | float:
+        # Empty values are dropped without a loop in Python
+        try:
+            return sum(filter(None, values))
+        except TypeError:
+            return sum(value for value in values if isinstance(value, int | float))
+
+    def check(
+        self, countryiso3: str, rows: dict, parents: dict[str, str]
+    ) -> dict[tuple, set[str]]:
+        """Check subnational sums against the figures of the areas containing them
+
+        Args:
+            countryiso3: Country ISO3 code
+            rows: Rows of the country by key
+            parents: Mapping from p-code to parent p-code
+
+        Returns:
+            Dictionary of key of row to infos to add to it
+        """
+        get_values = itemgetter(*self._population_statuses)
+        infos = {}
+        for parent_key, children in self.get_children(rows, parents).items():
+            # Columns of the figures of the children
+            columns = zip(*map(get_values, children))
+            for population_status, value, column in zip(
+                self._population_statuses, get_values(rows[parent_key]), columns
+            ):
+                if not isinstance(value, int | float):
+                    continue
+                total = self.get_sum(column)
+                if total <= 0 or total <= value * (1 + self._tolerance):
+                    continue
+                adm_code, cluster, description, category = parent_key
+                self._errors.add_message(
+                    "HumanitarianNeeds",
+                    "HPC",
+                    "caseload {} category {} {} subnational sum {} exceeds {} for {} in {}",
+                    (
+                        description,
+                        category,
+                        population_status,
+                        total,
+                        value,
+                        adm_code or "country",
+                        countryiso3,
+                    ),
+                    message_type="warning",
+                )
+                infos.setdefault(parent_key, set()).add(
+                    f"{population_status} subnational sum {total} exceeds {value}"
+                )
+        return infos
+
+    @staticmethod
+    def add_infos(row: dict, infos: set[str]) -> None:
+        if row["Info"]:
+            infos = infos | set(row["Info"].split("|"))
+        row["Info"] = "|".join(sorted(infos))
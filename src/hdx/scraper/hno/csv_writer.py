@@ -0,0 +1,89 @@
+import csv
+import logging
+from functools import cache
+from os.path import join
+
+from hdx.data.dataset import Dataset
+from hdx.data.resource import Resource
+
+logger = logging.getLogger(__name__)
+
+buffer_size = 1 << 20
+
+
+@cache
+def get_admin_headers(
+    headers: tuple[str, ...], highest_admin: int, max_admin: int
+) -> tuple[str, ...]:
+    """Get headers without the admin PCode and Name columns above the highest admin
+    level. The result is cached for each set of headers and highest admin level.
+
+    Args:
+        headers: Headers including all admin levels
+        highest_admin: Highest admin level in rows
+        max_admin: Highest admin level in headers
+
+    Returns:
+        Headers to output
+    """
+    if headers[0] == "Country ISO3":
+        index = 1
+    else:
+        index = 0
+    start = highest_admin * 2 + index
+    end = max_admin * 2 + index
+    return headers[:start] + headers[end:]
+
+
+def write_csv(path: str, headers: tuple[str, ...], rows: dict) -> int:
+    """Write rows sorted by key to a CSV file. Each row is projected to a tuple of
+    the values of the headers with missing values written as empty strings, giving the
+    same output as the frictionless writer used by Dataset.generate_resource.
+
+    Args:
+        path: Path of CSV file
+        headers: Headers to output
+        rows: Rows by key
+
+    Returns:
+        Number of data rows written
+    """
+    with open(path, "w", encoding="utf-8", newline="", buffering=buffer_size) as fp:
+        writer = csv.writer(fp)
+        writer.writerow(headers)
+        writer.writerows(tuple(map(rows[key].get, headers)) for key in sorted(rows))
+    return len(rows)
+
+
+def generate_csv_resource(
+    dataset: Dataset,
+    folder: str,
+    filename: str,
+    rows: dict,
+    resourcedata: dict,
+    headers: tuple[str, ...],
+) -> tuple[bool, dict]:
+    """Equivalent of Dataset.generate_resource which writes the file using
+    write_csv
+
+    Args:
+        dataset: Dataset to which to add resource
+        folder: Folder to which to write file containing rows
+        filename: Filename of file to write rows
+        rows: Rows by key
+        resourcedata: Resource data
+        headers: Headers to output
+
+    Returns:
+        (True if resource added, dictionary of results)
+    """
+    if not rows:
+        logger.error(f"No data rows in {filename}!")
+        return False, {}
+    filepath = join(folder, filename)
+    write_csv(filepath, headers, rows)
+    resource = Resource(resourcedata)
+    resource.set_format("csv")
+    resource.set_file_to_upload(filepath)
+    dataset.add_update_resource(resource)
+    return True, {"resource": resource, "headers": list(headers)}
@@ -1,6 +1,5 @@
 import logging
 from collections.abc import Callable
-from copy import copy
 
 from hdx.api.configuration import Configuration
 from hdx.data.dataset import Dataset
@@ -8,6 +7,11 @@ from hdx.data.resource import Resource
 from hdx.location.country import Country
 from slugify import slugify
 
+from hdx.scraper.hno.csv_writer import generate_csv_resource, get_admin_headers
+from hdx.scraper.hno.partitioned_csv import (
+    PartitionedCSV,
+    generate_partitioned_resource,
+)
 from hdx.scraper.hno.timeperiod_helper import TimePeriodHelper
 
 logger = logging.getLogger(__name__)
@@ -15,17 +19,17 @@ logger = logging.getLogger(__name__)
 
 class DatasetGenerator:
     global_name = "Global HPC HNO"
-    slugified_name = slugify(global_name).lower()
 
     def __init__(
         self,
         configuration: Configuration,
         timeperiod_helper: TimePeriodHelper,
     ) -> None:
+        self.slugified_name = slugify(self.global_name).lower()
         self._max_admin = int(configuration["max_admin"])
         self._resource_description = configuration["resource_description"]
         self.resource_description_extra = configuration["resource_description_extra"]
-        self._global_headers = configuration["headers"]
+        self._global_headers = tuple(configuration["headers"])
         self._country_headers = self._global_headers[1:]
         self._timeperiod_helper = timeperiod_helper
 
@@ -33,13 +37,15 @@ class DatasetGenerator:
         self,
         dataset: Dataset,
         resource_name: str,
-        headers: list,
+        headers: tuple[str, ...],
         rows: dict,
         folder: str,
         filename: str,
         highest_admin: int,
         resource_description_extra: bool = False,
         p_coded: bool = None,
+        partitioned_csv: PartitionedCSV | None = None,
+        changed_countries: set[str] | None = None,
     ) -> tuple[bool, dict]:
         year = self._timeperiod_helper.get_year()
         if highest_admin == 0:
@@ -56,19 +62,24 @@ class DatasetGenerator:
         if p_coded:
             resourcedata["p_coded"] = p_coded
 
-        headers = copy(headers)
-        if headers[0] == "Country ISO3":
-            index = 1
-        else:
-            index = 0
-        for i in range(highest_admin, self._max_admin):
-            del headers[highest_admin * 2 + index]
-            del headers[highest_admin * 2 + index]
+        headers = get_admin_headers(headers, highest_admin, self._max_admin)
 
-        return dataset.generate_resource(
+        if partitioned_csv:
+            return generate_partitioned_resource(
+                dataset,
+                partitioned_csv,
+                folder,
+                filename,
+                rows,
+                resourcedata,
+                list(headers),
+                changed_countries,
+            )
+        return generate_csv_resource(
+            dataset,
             folder,
             filename,
-            (rows[key] for key in sorted(rows)),
+            rows,
             resourcedata,
             headers,
         )
@@ -79,11 +90,13 @@ class DatasetGenerator:
         name: str,
         resource_name: str,
         filename: str,
-        headers: list,
+        headers: tuple[str, ...],
         rows: dict,
         folder: str,
         highest_admin: int,
         p_coded: bool = None,
+        partitioned_csv: PartitionedCSV | None = None,
+        changed_countries: set[str] | None = None,
     ) -> tuple[Dataset | None, Resource | None]:
         logger.info(f"Creating dataset: {title}")
         slugified_name = slugify(name).lower()
@@ -115,6 +128,8 @@ class DatasetGenerator:
             filename,
             highest_admin,
             p_coded=p_coded,
+            partitioned_csv=partitioned_csv,
+            changed_countries=changed_countries,
         )
         if success is False:
             logger.warning(f"{name} has no data!")
@@ -177,6 +192,8 @@ class DatasetGenerator:
         rows: dict,
         folder: str,
         highest_admin: int,
+        partitioned_csv: PartitionedCSV | None = None,
+        changed_countries: set[str] | None = None,
     ) -> Resource | None:
         year = self._timeperiod_helper.get_year()
         filename = f"hpc_hno_{year}.csv"
@@ -190,6 +207,8 @@ class DatasetGenerator:
             filename,
             highest_admin,
             p_coded=True,
+            partitioned_csv=partitioned_csv,
+            changed_countries=changed_countries,
         )
         if not success:
             return None
@@ -203,6 +222,8 @@ class DatasetGenerator:
         rows: dict,
         countries_with_data: list[str],
         highest_admin: int | None,
+        partitioned_csv: PartitionedCSV | None = None,
+        changed_countries: set[str] | None = None,
     ) -> tuple[Dataset | None, Resource | None]:
         if not rows or highest_admin is None:
             return None, None
@@ -220,6 +241,8 @@ class DatasetGenerator:
             folder,
             highest_admin,
             p_coded=True,
+            partitioned_csv=partitioned_csv,
+            changed_countries=changed_countries,
         )
         dataset.add_country_locations(countries_with_data)
         return dataset, resource
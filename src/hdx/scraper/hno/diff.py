@@ -0,0 +1,147 @@
+import gzip
+import json
+import logging
+from collections.abc import Iterable, Iterator
+from hashlib import blake2b
+from os import makedirs, replace
+from os.path import exists, join
+
+logger = logging.getLogger(__name__)
+
+
+def get_row_values(row: dict, headers: list[str]) -> list[str]:
+    return [str(row.get(header, "")) for header in headers]
+
+
+def get_row_hash(values: list[str]) -> str:
+    # Unit separator cannot appear in the data so values cannot run together
+    return blake2b("\x1f".join(values).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def read_snapshot(path: str) -> Iterator[tuple[tuple, str, list[str]]]:
+    if not exists(path):
+        return
+    with gzip.open(path, "rt", encoding="utf-8") as fp:
+        for line in fp:
+            key, row_hash, values = json.loads(line)
+            yield tuple(key), row_hash, values
+
+
+def get_snapshot_rows(
+    rows: dict, headers: list[str]
+) -> Iterator[tuple[tuple, str, list[str]]]:
+    for key in sorted(rows):
+        values = get_row_values(rows[key], headers)
+        yield key, get_row_hash(values), values
+
+
+def diff_rows(
+    previous: Iterable[tuple[tuple, str, list[str]]],
+    current: Iterable[tuple[tuple, str, list[str]]],
+) -> Iterator[tuple[str, tuple, list[str] | None, list[str] | None]]:
+    """Merge join two streams of (key, hash, values) sorted by key yielding
+    (change, key, previous values, current values) where change is added, removed
+    or changed. Only one row from each stream is held at a time.
+
+    Args:
+        previous: Rows of previous run sorted by key
+        current: Rows of current run sorted by key
+
+    Returns:
+        Iterator of changes
+    """
+    previous = iter(previous)
+    current = iter(current)
+    previous_row = next(previous, None)
+    current_row = next(current, None)
+    while previous_row is not None or current_row is not None:
+        if current_row is None or (
+            previous_row is not None and previous_row[0] < current_row[0]
+        ):
+            yield "removed", previous_row[0], previous_row[2], None
+            previous_row = next(previous, None)
+        elif previous_row is None or current_row[0] < previous_row[0]:
+            yield "added", current_row[0], None, current_row[2]
+            current_row = next(current, None)
+        else:
+            if previous_row[1] != current_row[1]:
+                yield "changed", current_row[0], previous_row[2], current_row[2]
+            previous_row = next(previous, None)
+            current_row = next(current, None)
+
+
+class RowDiff:
+    """Compare the rows of an output with those of the previous run. The rows of
+    each run are kept in the cache directory as a gzipped snapshot of JSON lines of
+    (key, hash, values) sorted by key so that comparing is a single streaming pass.
+    Changes are written next to the snapshot along with per country counts. The new
+    snapshot only replaces the previous one when committed, ie. once the output has
+    been published.
+
+    Args:
+        cache_dir: Directory holding previous runs' snapshots
+        name: Name of output eg. hpc_hno_2024
+        headers: Columns to compare
+    """
+
+    changes = ("added", "removed", "changed")
+
+    def __init__(self, cache_dir: str, name: str, headers: list[str]) -> None:
+        self._folder = join(cache_dir, "diff")
+        self._name = name
+        self._headers = headers
+        self._snapshot_path = join(self._folder, f"{name}_snapshot.jsonl.gz")
+        self._new_snapshot_path = f"{self._snapshot_path}.new"
+        self.changes_path = join(self._folder, f"{name}_changes.jsonl.gz")
+        self.summary = None
+
+    def has_previous(self) -> bool:
+        return exists(self._snapshot_path)
+
+    def diff(self, rows: dict) -> dict[str, dict[str, int]]:
+        makedirs(self._folder, exist_ok=True)
+        summary = {}
+
+        def current_rows() -> Iterator[tuple[tuple, str, list[str]]]:
+            # The new snapshot is written as the current rows are compared
+            with gzip.open(
+                self._new_snapshot_path, "wt", encoding="utf-8", compresslevel=1
+            ) as fp:
+                for key, row_hash, values in get_snapshot_rows(rows, self._headers):
+                    fp.write(f"{json.dumps([key, row_hash, values])}\n")
+                    yield key, row_hash, values
+
+        temp_path = f"{self.changes_path}.tmp"
+        with gzip.open(temp_path, "wt", encoding="utf-8") as fp:
+            for change, key, previous_values, current_values in diff_rows(
+                read_snapshot(self._snapshot_path), current_rows()
+            ):
+                countryiso3 = key[0]
+                counts = summary.get(countryiso3)
+                if counts is None:
+                    counts = dict.fromkeys(self.changes, 0)
+                    summary[countryiso3] = counts
+                counts[change] += 1
+                change_row = {
+                    "change": change,
+                    "key": key,
+                    "previous": previous_values,
+                    "current": current_values,
+                }
+                fp.write(f"{json.dumps(change_row)}\n")
+        replace(temp_path, self.changes_path)
+        summary_path = join(self._folder, f"{self._name}_summary.json")
+        with open(summary_path, "w", encoding="utf-8") as fp:
+            json.dump(summary, fp, indent=2, sort_keys=True)
+        for countryiso3 in sorted(summary):
+            counts = summary[countryiso3]
+            text = ", ".join(f"{counts[change]} {change}" for change in self.changes)
+            logger.info(f"{self._name} {countryiso3}: {text}")
+        if not summary:
+            logger.info(f"{self._name}: no changes")
+        self.summary = summary
+        return summary
+
+    def commit(self) -> None:
+        if exists(self._new_snapshot_path):
+            replace(self._new_snapshot_path, self._snapshot_path)
@@ -0,0 +1,102 @@
+import logging
+
+from hdx.api.utilities.hdx_error_handler import HDXErrorHandler
+
+logger = logging.getLogger(__name__)
+
+
+class ErrorAggregator:
+    """Front end to HDXErrorHandler for messages raised inside per caseload and
+    per row loops. Messages are counted by their template and parameters rather
+    than being formatted and submitted each time they occur. flush formats each
+    distinct message once and passes it to the error handler with the same text as
+    if it had been added directly.
+
+    Args:
+        error_handler: HDX error handler to which to flush messages
+    """
+
+    def __init__(self, error_handler: HDXErrorHandler) -> None:
+        self._error_handler = error_handler
+        self._messages = {}
+        self._missing_values = {}
+
+    def add_message(
+        self,
+        pipeline: str,
+        identifier: str,
+        template: str,
+        params: tuple = (),
+        resource_name: str = "",
+        message_type: str = "error",
+        err_to_hdx: bool = False,
+    ) -> None:
+        key = (
+            pipeline,
+            identifier,
+            template,
+            params,
+            resource_name,
+            message_type,
+            err_to_hdx,
+        )
+        self._messages[key] = self._messages.get(key, 0) + 1
+
+    def add_missing_value_message(
+        self,
+        pipeline: str,
+        identifier: str,
+        value_type: str,
+        value: str,
+        resource_name: str = "",
+        message_type: str = "error",
+        err_to_hdx: bool = False,
+    ) -> None:
+        key = (
+            pipeline,
+            identifier,
+            value_type,
+            value,
+            resource_name,
+            message_type,
+            err_to_hdx,
+        )
+        self._missing_values[key] = self._missing_values.get(key, 0) + 1
+
+    def set_error_handler(self, error_handler: HDXErrorHandler) -> None:
+        self._error_handler = error_handler
+
+    def get_count(self) -> int:
+        return sum(self._messages.values()) + sum(self._missing_values.values())
+
+    def flush(self) -> int:
+        no_messages = len(self._messages) + len(self._missing_values)
+        if not no_messages:
+            return 0
+        for key, count in self._messages.items():
+            (
+                pipeline,
+                identifier,
+                template,
+                params,
+                resource_name,
+                message_type,
+                err_to_hdx,
+            ) = key
+            if params:
+                text = template.format(*params)
+            else:
+                text = template
+            if count > 1:
+                logger.debug(f"{pipeline} - {identifier} - {text} ({count} times)")
+            self._error_handler.add_message(
+                pipeline, identifier, text, resource_name, message_type, err_to_hdx
+            )
+        for key, count in self._missing_values.items():
+            if count > 1:
+                logger.debug(f"{key[0]} - {key[1]} - {key[2]} {key[3]} ({count} times)")
+            self._error_handler.add_missing_value_message(*key)
+        logger.debug(f"Flushed {no_messages} distinct of {self.get_count()} messages")
+        self._messages = {}
+        self._missing_values = {}
+        return no_messages
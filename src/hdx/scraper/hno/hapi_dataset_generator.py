@@ -3,6 +3,11 @@ from logging import getLogger
 from hdx.api.configuration import Configuration
 from hdx.data.dataset import Dataset
 
+from hdx.scraper.hno.csv_writer import generate_csv_resource
+from hdx.scraper.hno.partitioned_csv import (
+    PartitionedCSV,
+    generate_partitioned_resource,
+)
 from hdx.scraper.hno.timeperiod_helper import TimePeriodHelper
 
 logger = getLogger(__name__)
@@ -49,6 +54,8 @@ class HAPIDatasetGenerator:
         dataset_id: str,
         resource_id: str,
         time_period: dict | None,
+        partitioned_csv: PartitionedCSV | None = None,
+        changed_countries: set[str] | None = None,
     ) -> Dataset | None:
         if len(self._rows) == 0:
             logger.warning("Humanitarian needs has no data!")
@@ -74,20 +81,31 @@ class HAPIDatasetGenerator:
         headers = resource_config["headers"]
         filename = resource_config["filename"]
 
-        def get_rows():
-            for key in sorted(self._rows):
-                row = self._rows[key]
-                row["dataset_hdx_id"] = dataset_id
-                row["resource_hdx_id"] = resource_id
-                yield row
-
-        success, _ = dataset.generate_resource(
-            folder,
-            f"{filename}_{year}.csv",
-            get_rows(),
-            resourcedata,
-            headers,
-        )
+        for row in self._rows.values():
+            row["dataset_hdx_id"] = dataset_id
+            row["resource_hdx_id"] = resource_id
+        if partitioned_csv:
+            success, _ = generate_partitioned_resource(
+                dataset,
+                partitioned_csv,
+                folder,
+                f"{filename}_{year}.csv",
+                self._rows,
+                resourcedata,
+                headers,
+                changed_countries,
+                # Ids are in every row so if they change, every partition changes
+                f"{dataset_id} {resource_id}",
+            )
+        else:
+            success, _ = generate_csv_resource(
+                dataset,
+                folder,
+                f"{filename}_{year}.csv",
+                self._rows,
+                resourcedata,
+                tuple(headers),
+            )
         if success is False:
             logger.warning(f"{resource_name} has no data!")
             return None
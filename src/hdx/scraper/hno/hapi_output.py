@@ -1,23 +1,32 @@
 import logging
-from copy import deepcopy
+from collections.abc import Iterable
+from typing import TYPE_CHECKING
 
 from hdx.api.configuration import Configuration
 from hdx.api.utilities.hdx_error_handler import HDXErrorHandler
-from hdx.location.adminlevel import AdminLevel
 from hdx.location.country import Country
 from hdx.pipelineutils.hapi_admins import complete_admins
 from hdx.pipelineutils.reader import Read
-from hdx.pipelineutils.sector import Sector
 from hdx.utilities.dateparse import iso_string_from_datetime
 from hdx.utilities.dictandlist import dict_of_lists_add
 from hdx.utilities.text import get_numeric_if_possible
 
+from hdx.scraper.hno.error_aggregator import ErrorAggregator
+from hdx.scraper.hno.memory_tracker import memory_snapshot
+from hdx.scraper.hno.profiling import profile
+from hdx.scraper.hno.sector_mapping import SectorMapping, load_sector_mapping
 from hdx.scraper.hno.timeperiod_helper import TimePeriodHelper
 
+if TYPE_CHECKING:
+    from hdx.location.adminlevel import AdminLevel
+
 logger = logging.getLogger(__name__)
 
 
 class HAPIOutput:
+    # The HAPI output only has admin 1 and 2
+    admin_levels = 2
+
     def __init__(
         self,
         configuration: Configuration,
@@ -25,33 +34,51 @@ class HAPIOutput:
         error_handler: HDXErrorHandler,
         slugified_name: str,
         countryiso3s_to_process: list[str] | None = None,
+        sector: SectorMapping | None = None,
     ) -> None:
         self._max_admin = configuration["max_admin"]
-        self._population_status_mapping = configuration["population_status_mapping"]
+        self._population_statuses = tuple(
+            configuration["population_status_mapping"].items()
+        )
 
         self.start_date = iso_string_from_datetime(timeperiod_helper.get_startdate())
         self.end_date = iso_string_from_datetime(timeperiod_helper.get_enddate())
         self._error_handler = error_handler
+        self._errors = ErrorAggregator(error_handler)
         self._slugified_name = slugified_name
         self._countryiso3s_to_process = countryiso3s_to_process
-        self._sector = Sector()
+        # Admin tables and sector mappings are set up when first needed
+        self._admins = None
+        self._sector = sector
         self._negative_values_by_iso3 = {}
         self._rounded_values_by_iso3 = {}
         self._global_rows = {}
 
-    def setup_admins(self):
+    def setup_admins(self, admins: "list[AdminLevel] | None" = None) -> None:
+        if admins is not None:
+            self._admins = admins
+            return
+        from hdx.location.adminlevel import AdminLevel
+
+        # Deeper admin levels would need the much larger all p-codes file
         self._admins = []
-        for i in range(self._max_admin):
-            admin = AdminLevel(admin_level=i + 1, retriever=Read.get_reader())
-            if i >= 2:
-                admin.setup_from_url(
-                    admin_url=AdminLevel.admin_all_pcodes_url,
-                    countryiso3s=self._countryiso3s_to_process,
-                )
-            else:
+        with profile("admins"):
+            for i in range(min(self._max_admin, self.admin_levels)):
+                admin = AdminLevel(admin_level=i + 1, retriever=Read.get_reader())
                 admin.setup_from_url(countryiso3s=self._countryiso3s_to_process)
-            admin.load_pcode_formats()
-            self._admins.append(admin)
+                admin.load_pcode_formats()
+                self._admins.append(admin)
+        memory_snapshot("setup admins")
+
+    def get_admins(self) -> "list[AdminLevel]":
+        if self._admins is None:
+            self.setup_admins()
+        return self._admins
+
+    def get_sector(self) -> SectorMapping:
+        if self._sector is None:
+            self._sector = load_sector_mapping()
+        return self._sector
 
     def process(
         self,
@@ -59,94 +86,127 @@ class HAPIOutput:
         rows: dict,
     ) -> None:
         logger.info("Processing HAPI output")
+        admins = self.get_admins()
+        sector = self.get_sector()
+        has_hrp = "Y" if Country.get_hrp_status_from_iso3(countryiso3) else "N"
+        in_gho = "Y" if Country.get_gho_status_from_iso3(countryiso3) else "N"
+        # Rows at the same location or for the same cluster share the resolution of
+        # their admins or sector
+        admin_contexts = {}
+        sector_contexts = {}
         for key, row in rows.items():
             ignore = False
             for i in range(self._max_admin, 2, -1):
                 value = row.get(f"Admin {i} PCode", row.get(f"Admin {i} Name"))
                 if value:
                     ignore = True
-                    self._error_handler.add_message(
+                    self._errors.add_message(
                         "HumanitarianNeeds",
                         self._slugified_name,
-                        f"admin {i}: {value} ignored",
+                        "admin {}: {} ignored",
+                        (i, value),
                         message_type="warning",
                     )
                     break
             if ignore:
                 continue
             admcode, cluster, caseload_description, category = key
-            base_hapi_row = {
-                "warning": set(),
-                "error": set(),
-            }
-            provider_adm_names = [row["Admin 1 Name"], row["Admin 2 Name"]]
-            adm_codes = [row["Admin 1 PCode"], row["Admin 2 PCode"]]
-            adm_names = ["", ""]
-            adm_level, warnings = complete_admins(
-                self._admins,
-                countryiso3,
-                provider_adm_names,
-                adm_codes,
-                adm_names,
+            admin_key = (
+                row["Admin 1 Name"],
+                row["Admin 2 Name"],
+                row["Admin 1 PCode"],
+                row["Admin 2 PCode"],
+            )
+            admin_context = admin_contexts.get(admin_key)
+            if admin_context is None:
+                provider_adm_names = [row["Admin 1 Name"], row["Admin 2 Name"]]
+                adm_codes = [row["Admin 1 PCode"], row["Admin 2 PCode"]]
+                adm_names = ["", ""]
+                adm_level, warnings = complete_admins(
+                    admins,
+                    countryiso3,
+                    provider_adm_names,
+                    adm_codes,
+                    adm_names,
+                )
+                admin_context = (
+                    provider_adm_names,
+                    adm_codes,
+                    adm_names,
+                    adm_level,
+                    warnings,
+                )
+                admin_contexts[admin_key] = admin_context
+            provider_adm_names, adm_codes, adm_names, adm_level, warnings = (
+                admin_context
             )
+            base_warnings = set()
+            base_errors = set()
             for warning in warnings:
-                self._error_handler.add_message(
+                self._errors.add_message(
                     "HumanitarianNeeds",
                     self._slugified_name,
                     warning,
                     message_type="warning",
                 )
-                base_hapi_row["warning"].add(warning)
+                base_warnings.add(warning)
 
-            base_hapi_row["location_code"] = countryiso3
-            base_hapi_row["has_hrp"] = (
-                "Y" if Country.get_hrp_status_from_iso3(countryiso3) else "N"
-            )
-            base_hapi_row["in_gho"] = (
-                "Y" if Country.get_gho_status_from_iso3(countryiso3) else "N"
-            )
-            base_hapi_row["provider_admin1_name"] = provider_adm_names[0]
-            base_hapi_row["provider_admin2_name"] = provider_adm_names[1]
-            base_hapi_row["admin1_code"] = adm_codes[0]
-            base_hapi_row["admin1_name"] = adm_names[0]
-            base_hapi_row["admin2_code"] = adm_codes[1]
-            base_hapi_row["admin2_name"] = adm_names[1]
-            base_hapi_row["admin_level"] = adm_level
+            # Warnings and errors are filled in for each population status
+            base_hapi_row = {
+                "warning": None,
+                "error": None,
+                "location_code": countryiso3,
+                "has_hrp": has_hrp,
+                "in_gho": in_gho,
+                "provider_admin1_name": provider_adm_names[0],
+                "provider_admin2_name": provider_adm_names[1],
+                "admin1_code": adm_codes[0],
+                "admin1_name": adm_names[0],
+                "admin2_code": adm_codes[1],
+                "admin2_name": adm_names[1],
+                "admin_level": adm_level,
+            }
             if cluster:
-                sector_code = self._sector.get_code(cluster)
-                if sector_code:
-                    base_hapi_row["sector_code"] = sector_code
-                    base_hapi_row["sector_name"] = self._sector.get_name(
-                        sector_code, ""
-                    )
-                    if sector_code == "Intersectoral":
-                        sector_code_key = ""
+                sector_context = sector_contexts.get(cluster)
+                if sector_context is None:
+                    sector_code = sector.get_code(cluster)
+                    if sector_code:
+                        if sector_code == "Intersectoral":
+                            sector_code_key = ""
+                        else:
+                            sector_code_key = sector_code
+                        sector_context = (
+                            sector_code,
+                            sector.get_name(sector_code, ""),
+                            sector_code_key,
+                            False,
+                        )
                     else:
-                        sector_code_key = sector_code
-                else:
-                    base_hapi_row["sector_code"] = ""
-                    base_hapi_row["sector_name"] = ""
-                    self._error_handler.add_missing_value_message(
+                        sector_context = ("", "", f"ZZY: {cluster}", True)
+                    sector_contexts[cluster] = sector_context
+                sector_code, sector_name, sector_code_key, missing = sector_context
+                base_hapi_row["sector_code"] = sector_code
+                base_hapi_row["sector_name"] = sector_name
+                if missing:
+                    self._errors.add_missing_value_message(
                         "HumanitarianNeeds",
                         self._slugified_name,
                         "cluster",
                         cluster,
                     )
-                    base_hapi_row["error"].add(f"No cluster mapping for {cluster}")
-                    sector_code_key = f"ZZY: {cluster}"
+                    base_errors.add(f"No cluster mapping for {cluster}")
             else:
                 sector_code_key = f"ZZZ: {caseload_description}"
 
             base_hapi_row["category"] = category
 
-            for (
-                header,
-                population_status,
-            ) in self._population_status_mapping.items():
+            for header, population_status in self._population_statuses:
                 value = row.get(header)
                 if value:
-                    hapi_row = deepcopy(base_hapi_row)
+                    hapi_row = base_hapi_row.copy()
                     hapi_row["population_status"] = population_status
+                    row_warnings = base_warnings
+                    row_errors = base_errors
                     value = get_numeric_if_possible(value)
                     if value < 0:
                         dict_of_lists_add(
@@ -155,7 +215,7 @@ class HAPIOutput:
                             str(value),
                         )
                         value = ""
-                        hapi_row["error"].add("Negative value")
+                        row_errors = base_errors | {"Negative value"}
                     elif isinstance(value, float):
                         dict_of_lists_add(
                             self._rounded_values_by_iso3,
@@ -163,12 +223,12 @@ class HAPIOutput:
                             str(value),
                         )
                         value = round(value)
-                        hapi_row["warning"].add("Rounded value")
+                        row_warnings = base_warnings | {"Rounded value"}
                     hapi_row["population"] = value
                     hapi_row["reference_period_start"] = self.start_date
                     hapi_row["reference_period_end"] = self.end_date
-                    hapi_row["warning"] = "|".join(sorted(hapi_row["warning"]))
-                    errors = "|".join(sorted(hapi_row["error"]))
+                    hapi_row["warning"] = "|".join(sorted(row_warnings))
+                    errors = "|".join(sorted(row_errors))
                     if row["Info"]:
                         if errors:
                             errors = f"{row['Info']}|{errors}"
@@ -186,6 +246,7 @@ class HAPIOutput:
                         population_status,
                     )
                     self._global_rows[key] = hapi_row
+        self._errors.flush()
 
     def add_negative_rounded_errors(
         self, resource_name: str, dataset_name: str
@@ -208,5 +269,29 @@ class HAPIOutput:
                 message_type="warning",
             )
 
+    def load_global_rows(
+        self,
+        global_rows: Iterable[tuple[tuple, dict]],
+        negative_values_by_iso3: dict,
+        rounded_values_by_iso3: dict,
+    ) -> None:
+        for key, row in global_rows:
+            self._global_rows[key] = row
+        self._negative_values_by_iso3.update(negative_values_by_iso3)
+        self._rounded_values_by_iso3.update(rounded_values_by_iso3)
+
+    def set_error_handler(self, error_handler: HDXErrorHandler) -> None:
+        self._error_handler = error_handler
+        self._errors.set_error_handler(error_handler)
+
+    def remove_country(self, countryiso3: str) -> None:
+        for key in [key for key in self._global_rows if key[0] == countryiso3]:
+            del self._global_rows[key]
+        self._negative_values_by_iso3.pop(countryiso3, None)
+        self._rounded_values_by_iso3.pop(countryiso3, None)
+
     def get_global_rows(self) -> dict:
         return self._global_rows
+
+    def get_negative_rounded_values(self) -> tuple[dict, dict]:
+        return self._negative_values_by_iso3, self._rounded_values_by_iso3
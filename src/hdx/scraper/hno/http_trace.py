@@ -0,0 +1,332 @@
+import json
+import logging
+from collections.abc import Iterable
+from os.path import splitext
+from re import compile
+from threading import Lock, local
+from time import perf_counter
+from urllib.parse import parse_qsl, urlsplit
+
+from hdx.utilities.dateparse import now_utc
+from hdx.utilities.downloader import Download
+from requests import Response, Session
+
+logger = logging.getLogger(__name__)
+
+# Path segments that are identifiers eg. plan ids and dataset and resource UUIDs
+_identifier = compile(r"^(\d+|[0-9a-fA-F-]{16,})$")
+
+
+def get_url_template(url: str) -> str:
+    """Get URL template for grouping requests by endpoint. Identifiers in the path
+    are replaced by {id} and only the names of query parameters are kept.
+
+    Args:
+        url: URL
+
+    Returns:
+        URL template
+    """
+    spliturl = urlsplit(url)
+    path = "/".join(
+        "{id}" if _identifier.match(segment) else segment
+        for segment in spliturl.path.split("/")
+    )
+    template = f"{spliturl.scheme}://{spliturl.netloc}{path}"
+    names = sorted({name for name, _ in parse_qsl(spliturl.query)})
+    if names:
+        template = f"{template}?{'&'.join(names)}"
+    return template
+
+
+class HTTPTrace:
+    """Records every request made through traced sessions as a line of JSON with
+    method, URL, URL template, status, bytes received, time to first byte, total time
+    including reading a streamed body and time waited on rate limiting beforehand.
+
+    Args:
+        path: Path of JSONL file to which records are appended
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._fp = open(path, "a")
+        self._lock = Lock()
+        self._thread = local()
+        self._pending = {}
+
+    def get_path(self) -> str:
+        return self._path
+
+    def write(self, record: dict) -> None:
+        with self._lock:
+            if self._pending.pop(id(record), None) is None:
+                return
+            self._fp.write(f"{json.dumps(record)}\n")
+            self._fp.flush()
+
+    def complete(self, record: dict, start: float, nbytes: int | None) -> None:
+        record["time"] = round(perf_counter() - start, 6)
+        record["bytes"] = nbytes
+        self.write(record)
+
+    def get_wait(self, start: float) -> float | None:
+        # Time since the downloader's setup was called or the last request through
+        # it, which is spent waiting on rate limiters and retry backoffs
+        mark = getattr(self._thread, "mark", None)
+        if mark is None:
+            return None
+        return round(max(start - mark, 0), 6)
+
+    def trace_response(
+        self, response: Response, record: dict, start: float, stream: bool
+    ) -> None:
+        record["status"] = response.status_code
+        record["ttfb"] = round(response.elapsed.total_seconds(), 6)
+        raw = response.raw
+        tell = getattr(raw, "tell", None)
+        if not stream:
+            # The body has already been read
+            if tell:
+                nbytes = tell()
+            else:
+                nbytes = len(response.content)
+            self.complete(record, start, nbytes)
+            return
+        raw_stream = getattr(raw, "stream", None)
+        if raw_stream is None:
+            self.complete(record, start, None)
+            return
+
+        def traced_stream(*args, **kwargs):
+            nbytes = 0
+            try:
+                for chunk in raw_stream(*args, **kwargs):
+                    nbytes += len(chunk)
+                    yield chunk
+            finally:
+                # Bytes received are compressed if the body was
+                self.complete(record, start, tell() if tell else nbytes)
+
+        raw.stream = traced_stream
+
+    def trace_session(self, session: Session, service: str) -> None:
+        send = session.send
+
+        def traced_send(request, **kwargs) -> Response:
+            start = perf_counter()
+            record = {
+                "started": now_utc().isoformat(),
+                "service": service,
+                "method": request.method,
+                "url": request.url,
+                "template": get_url_template(request.url),
+                "status": None,
+                "bytes": None,
+                "ttfb": None,
+                "time": None,
+                "wait": self.get_wait(start),
+            }
+            with self._lock:
+                self._pending[id(record)] = record
+            try:
+                response = send(request, **kwargs)
+            except Exception as ex:
+                record["error"] = type(ex).__name__
+                self.complete(record, start, None)
+                raise
+            finally:
+                if getattr(self._thread, "mark", None) is not None:
+                    self._thread.mark = perf_counter()
+            self.trace_response(response, record, start, kwargs.get("stream", False))
+            return response
+
+        session.send = traced_send
+
+    def trace_downloader(self, downloader: Download) -> None:
+        setup = downloader.setup
+
+        def traced_setup(*args, **kwargs) -> Response:
+            self._thread.mark = perf_counter()
+            try:
+                return setup(*args, **kwargs)
+            finally:
+                self._thread.mark = None
+
+        downloader.setup = traced_setup
+
+    def close(self) -> None:
+        # Responses whose bodies were never read are written without a total time
+        with self._lock:
+            pending = list(self._pending.values())
+        for record in pending:
+            self.write(record)
+        self._fp.close()
+
+    def finish(self) -> None:
+        """Write remaining records, a summary table to the log and a HAR file alongside
+        the JSONL file
+
+        Returns:
+            None
+        """
+        self.close()
+        self.log_summary(self._path)
+        self.write_har(self._path, f"{splitext(self._path)[0]}.har")
+
+    @staticmethod
+    def read(path: str) -> Iterable[dict]:
+        with open(path) as fp:
+            for line in fp:
+                yield json.loads(line)
+
+    @classmethod
+    def summarise(cls, path: str) -> list[dict]:
+        """Summarise records by service, method and URL template sorted by total time
+        descending
+
+        Args:
+            path: Path of JSONL file
+
+        Returns:
+            List of summary rows
+        """
+        summaries = {}
+        for record in cls.read(path):
+            key = (record["service"], record["method"], record["template"])
+            summary = summaries.get(key)
+            if summary is None:
+                summary = {
+                    "service": record["service"],
+                    "method": record["method"],
+                    "template": record["template"],
+                    "requests": 0,
+                    "errors": 0,
+                    "bytes": 0,
+                    "ttfb": 0,
+                    "time": 0,
+                    "wait": 0,
+                }
+                summaries[key] = summary
+            summary["requests"] += 1
+            status = record["status"]
+            if status is None or status >= 400:
+                summary["errors"] += 1
+            for field in ("bytes", "ttfb", "time", "wait"):
+                summary[field] += record[field] or 0
+        return sorted(summaries.values(), key=lambda x: x["time"], reverse=True)
+
+    @classmethod
+    def log_summary(cls, path: str) -> None:
+        summaries = cls.summarise(path)
+        logger.info(f"HTTP requests by endpoint from {path}:")
+        logger.info(
+            f"{'service':<12} {'requests':>8} {'errors':>6} {'bytes':>12} {'mean ttfb':>9} {'time':>9} {'wait':>9}  endpoint"
+        )
+        totals = {}
+        for summary in summaries:
+            logger.info(
+                f"{summary['service']:<12} {summary['requests']:>8} {summary['errors']:>6} {summary['bytes']:>12} {summary['ttfb'] / summary['requests']:>9.3f} {summary['time']:>9.2f} {summary['wait']:>9.2f}  {summary['method']} {summary['template']}"
+            )
+            total = totals.setdefault(summary["service"], [0, 0, 0])
+            total[0] += summary["requests"]
+            total[1] += summary["time"]
+            total[2] += summary["wait"]
+        for service, (requests, time, wait) in totals.items():
+            logger.info(
+                f"{service}: {requests} requests taking {time:.2f}s after waiting {wait:.2f}s on rate limiting"
+            )
+
+    @classmethod
+    def write_har(cls, path: str, har_path: str) -> None:
+        """Write the records in a JSONL file as a HAR file. Waits on rate limiting
+        are given as blocked time.
+
+        Args:
+            path: Path of JSONL file
+            har_path: Path of HAR file
+
+        Returns:
+            None
+        """
+        entries = []
+        for record in cls.read(path):
+            ttfb = (record["ttfb"] or 0) * 1000
+            time = (record["time"] or 0) * 1000
+            wait = record["wait"]
+            nbytes = record["bytes"]
+            url = record["url"]
+            entries.append(
+                {
+                    "startedDateTime": record["started"],
+                    "time": time,
+                    "request": {
+                        "method": record["method"],
+                        "url": url,
+                        "httpVersion": "HTTP/1.1",
+                        "cookies": [],
+                        "headers": [],
+                        "queryString": [
+                            {"name": name, "value": value}
+                            for name, value in parse_qsl(urlsplit(url).query)
+                        ],
+                        "headersSize": -1,
+                        "bodySize": -1,
+                    },
+                    "response": {
+                        "status": record["status"] or 0,
+                        "statusText": record.get("error", ""),
+                        "httpVersion": "HTTP/1.1",
+                        "cookies": [],
+                        "headers": [],
+                        "content": {
+                            "size": -1 if nbytes is None else nbytes,
+                            "mimeType": "",
+                        },
+                        "redirectURL": "",
+                        "headersSize": -1,
+                        "bodySize": -1 if nbytes is None else nbytes,
+                    },
+                    "cache": {},
+                    "timings": {
+                        "blocked": -1 if wait is None else wait * 1000,
+                        "send": 0,
+                        "wait": ttfb,
+                        "receive": max(time - ttfb, 0),
+                    },
+                }
+            )
+        har = {
+            "log": {
+                "version": "1.2",
+                "creator": {"name": "hdx-scraper-hno", "version": "1"},
+                "entries": entries,
+            }
+        }
+        with open(har_path, "w") as fp:
+            json.dump(har, fp)
+
+
+def setup_http_trace(path: str, remoteckan_session: Session) -> HTTPTrace:
+    """Set up tracing of requests made by the downloaders used by readers and the HDX
+    API client
+
+    Args:
+        path: Path of JSONL file to which records are appended
+        remoteckan_session: Session of HDX API client
+
+    Returns:
+        HTTPTrace
+    """
+    http_trace = HTTPTrace(path)
+    sessions = set()
+    for name, downloader in Download.downloaders.items():
+        http_trace.trace_downloader(downloader)
+        # Downloaders can share a session
+        if id(downloader.session) in sessions:
+            continue
+        sessions.add(id(downloader.session))
+        http_trace.trace_session(downloader.session, name)
+    if id(remoteckan_session) not in sessions:
+        http_trace.trace_session(remoteckan_session, "hdx_api")
+    return http_trace
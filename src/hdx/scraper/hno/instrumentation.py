@@ -0,0 +1,59 @@
+import logging
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+_instruments = {}
+
+
+def get_instrument(name: str) -> Any:
+    """Get an instrument added for the run
+
+    Args:
+        name: Name of instrument eg. profiler
+
+    Returns:
+        Instrument or None if it was not added
+    """
+    return _instruments.get(name)
+
+
+class Instruments:
+    """Context manager holding the instruments of a run, like the profiler, memory
+    tracker, HTTP trace and connection pools. Each is added under a name by which the
+    pipeline finds it with get_instrument, which gives None for an instrument that is
+    not enabled. On leaving the context, whether the run succeeded or failed, the
+    instruments are removed and their finish methods called in the reverse order to
+    that in which they were added, so an instrument wrapping another is finished
+    first. A failure to finish one instrument is logged and does not stop the others
+    being finished.
+    """
+
+    def __init__(self) -> None:
+        self._names = []
+
+    def __enter__(self) -> "Instruments":
+        return self
+
+    def add(self, name: str, instrument: Any) -> Any:
+        """Add an instrument with a finish method
+
+        Args:
+            name: Name of instrument eg. profiler
+            instrument: Instrument
+
+        Returns:
+            Instrument
+        """
+        _instruments[name] = instrument
+        self._names.append(name)
+        return instrument
+
+    def __exit__(self, *args: Any) -> None:
+        while self._names:
+            name = self._names.pop()
+            instrument = _instruments.pop(name)
+            try:
+                instrument.finish()
+            except Exception:
+                logger.exception(f"Could not finish {name}!")
@@ -0,0 +1,87 @@
+import gzip
+import json
+from os import remove, replace
+from os.path import exists
+from typing import Any
+
+
+class JSONStreamWriter:
+    """Write a JSON document incrementally so that it does not need to be held in
+    memory. Output is written to a temporary file which replaces the final one when
+    the writer is closed so that a partly written document is never left at path. If
+    writing fails, abort closes and removes the temporary file. Used as a context
+    manager, the writer is closed on success and aborted on failure.
+
+    Args:
+        path: Path to JSON file. .gz is appended if compress is True.
+        compress: Whether to gzip the output. Defaults to False.
+    """
+
+    def __init__(self, path: str, compress: bool = False) -> None:
+        if compress:
+            path = f"{path}.gz"
+        self.path = path
+        self._temp_path = f"{path}.tmp"
+        if compress:
+            self._fp = gzip.open(self._temp_path, "wt", encoding="utf-8")
+        else:
+            self._fp = open(self._temp_path, "w", encoding="utf-8")
+        # Whether each open container already has a member so needs a separator
+        self._has_members = []
+
+    def _start_member(self, key: str | None) -> None:
+        if self._has_members:
+            if self._has_members[-1]:
+                self._fp.write(", ")
+            self._has_members[-1] = True
+        if key is not None:
+            self._fp.write(f"{json.dumps(key)}: ")
+
+    def begin_object(self, key: str | None = None) -> None:
+        self._start_member(key)
+        self._fp.write("{")
+        self._has_members.append(False)
+
+    def end_object(self) -> None:
+        self._has_members.pop()
+        self._fp.write("}")
+
+    def begin_array(self, key: str | None = None) -> None:
+        self._start_member(key)
+        self._fp.write("[")
+        self._has_members.append(False)
+
+    def end_array(self) -> None:
+        self._has_members.pop()
+        self._fp.write("]")
+
+    def value(self, value: Any, key: str | None = None) -> None:
+        self._start_member(key)
+        json.dump(value, self._fp, separators=(", ", ": "))
+
+    def _remove_temp(self) -> None:
+        if exists(self._temp_path):
+            remove(self._temp_path)
+
+    def close(self) -> None:
+        try:
+            self._fp.close()
+        except BaseException:
+            self._remove_temp()
+            raise
+        replace(self._temp_path, self.path)
+
+    def abort(self) -> None:
+        try:
+            self._fp.close()
+        finally:
+            self._remove_temp()
+
+    def __enter__(self) -> "JSONStreamWriter":
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
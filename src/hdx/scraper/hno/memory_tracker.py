@@ -0,0 +1,132 @@
+import json
+import logging
+import tracemalloc
+from itertools import islice
+from os import getpid
+
+from hdx.utilities.dateparse import now_utc
+
+from hdx.scraper.hno.instrumentation import get_instrument
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryTracker:
+    """Takes tracemalloc snapshots at stage boundaries, reporting memory in use, the
+    peak since the previous snapshot, the top allocation sites and the growth of
+    allocation sites since the previous snapshot. Reports are logged and appended as
+    lines of JSON to a file.
+
+    Args:
+        path: Path of JSONL file to which reports are appended
+        top: Number of allocation sites to report. Defaults to 10.
+        frames: Number of frames stored for each allocation. Defaults to 1.
+    """
+
+    # Allocations made by tracemalloc itself and the import system are not of interest
+    excluded_filenames = frozenset(
+        (
+            tracemalloc.__file__,
+            "<frozen importlib._bootstrap>",
+            "<frozen importlib._bootstrap_external>",
+            "<unknown>",
+        )
+    )
+
+    def __init__(self, path: str, top: int = 10, frames: int = 1) -> None:
+        self._path = path
+        self._top = top
+        self._key_type = "lineno" if frames == 1 else "traceback"
+        self._previous = None
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    @staticmethod
+    def get_site(statistic) -> str:
+        return " < ".join(
+            f"{frame.filename}:{frame.lineno}"
+            for frame in reversed(statistic.traceback)
+        )
+
+    def get_statistics(self, statistics: list) -> list:
+        # Filtering grouped statistics is much faster than filtering every trace
+        statistics = (
+            statistic
+            for statistic in statistics
+            if statistic.traceback[-1].filename not in self.excluded_filenames
+        )
+        return list(islice(statistics, self._top))
+
+    def snapshot(self, stage: str) -> dict:
+        """Take a snapshot at the end of a stage and report on it
+
+        Args:
+            stage: Name of stage eg. country AFG
+
+        Returns:
+            Report
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        top_sites = [
+            {
+                "site": self.get_site(statistic),
+                "size": statistic.size,
+                "count": statistic.count,
+            }
+            for statistic in self.get_statistics(snapshot.statistics(self._key_type))
+        ]
+        if self._previous is None:
+            growth = []
+        else:
+            differences = self.get_statistics(
+                snapshot.compare_to(self._previous, self._key_type)
+            )
+            growth = [
+                {
+                    "site": self.get_site(statistic),
+                    "size_diff": statistic.size_diff,
+                    "count_diff": statistic.count_diff,
+                }
+                for statistic in differences
+                if statistic.size_diff > 0
+            ]
+        # Peaks are reported for each stage
+        tracemalloc.reset_peak()
+        self._previous = snapshot
+        report = {
+            "time": now_utc().isoformat(),
+            "pid": getpid(),
+            "stage": stage,
+            "current": current,
+            "peak": peak,
+            "top": top_sites,
+            "growth": growth,
+        }
+        with open(self._path, "a") as fp:
+            fp.write(f"{json.dumps(report)}\n")
+        logger.info(
+            f"Memory after {stage}: {current / 1e6:.1f}MB in use, peak {peak / 1e6:.1f}MB"
+        )
+        for site in growth[:3]:
+            logger.info(f"  grew {site['size_diff'] / 1e6:+.1f}MB at {site['site']}")
+        return report
+
+    def finish(self) -> None:
+        self._previous = None
+        tracemalloc.stop()
+
+
+def memory_snapshot(stage: str) -> None:
+    """Take a memory snapshot at the end of a stage if memory diagnostics are enabled
+
+    Args:
+        stage: Name of stage eg. country AFG
+
+    Returns:
+        None
+    """
+    memory_tracker = get_instrument("memory_tracker")
+    if memory_tracker is None:
+        return
+    memory_tracker.snapshot(stage)
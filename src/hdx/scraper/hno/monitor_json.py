@@ -1,47 +1,86 @@
 from os.path import join
 
-from hdx.utilities.saver import save_json
-
 from .caseload_json import CaseloadJSON
+from .json_stream import JSONStreamWriter
 
 
 class MonitorJSON:
-    def __init__(self, saved_dir: str, save_test_data: bool = False) -> None:
+    def __init__(
+        self, saved_dir: str, save_test_data: bool = False, compress: bool = False
+    ) -> None:
         self._saved_dir = saved_dir
         self._save_test_data = save_test_data
-        self._locations = []
-        self._caseloads = []
-        self._json = {
-            "data": {
-                "locations": self._locations,
-                "caseloads": self._caseloads,
-            }
-        }
+        self._compress = compress
+        self._writer = None
+        self._array = None
+        self._arrays = set()
 
-    def set_last_published(self, last_published_version: str, last_published_date: str):
+    def is_saving(self) -> bool:
+        return self._save_test_data
+
+    def start(self, plan_id: str) -> None:
         if self._save_test_data:
-            self._json["data"]["lastPublishedVersion"] = last_published_version
-            self._json["data"]["lastPublishedDate"] = last_published_date
+            path = join(
+                self._saved_dir,
+                f"test_{plan_id}-responsemonitoring-includecaseloaddisaggregation-true-includeindicatordisaggregation-false-disaggregationonlytotal-false.json",
+            )
+            self._writer = JSONStreamWriter(path, self._compress)
+            self._array = None
+            self._arrays = set()
+            self._writer.begin_object()
+            self._writer.begin_object("data")
+
+    def _set_array(self, array: str | None) -> None:
+        # Each array is streamed in one go so it ends when the next part begins
+        if array == self._array:
+            return
+        if self._array:
+            self._writer.end_array()
+        if array:
+            self._writer.begin_array(array)
+            self._arrays.add(array)
+        self._array = array
+
+    def _add_missing_arrays(self, *arrays: str) -> None:
+        # Empty arrays are still output as they were before streaming
+        for array in arrays:
+            if array not in self._arrays:
+                self._set_array(array)
+        self._set_array(None)
+
+    def set_last_published(self, last_published_version: str, last_published_date: str):
+        if self._writer:
+            self._set_array(None)
+            self._writer.value(last_published_version, "lastPublishedVersion")
+            self._writer.value(last_published_date, "lastPublishedDate")
 
     def add_location(self, location: dict) -> None:
-        if self._save_test_data:
-            self._locations.append(location)
+        if self._writer:
+            self._set_array("locations")
+            self._writer.value(location)
 
     def set_global_clusters(self, clusters: list) -> None:
-        if self._save_test_data:
-            self._json["data"]["planGlobalClusters"] = clusters
+        if self._writer:
+            self._add_missing_arrays("locations")
+            self._writer.value(clusters, "planGlobalClusters")
+
+    def get_caseload_json(self, caseload: dict) -> CaseloadJSON:
+        if self._writer:
+            self._set_array("caseloads")
+        return CaseloadJSON(caseload, self._writer)
 
     def add_caseload_json(self, caseload_json: CaseloadJSON) -> None:
-        if caseload_json._caseload is not None:
-            self._caseloads.append(caseload_json._caseload)
+        caseload_json.close()
 
-    def save(self, plan_id: str) -> None:
-        if self._save_test_data:
-            path = join(
-                self._saved_dir,
-                f"test_{plan_id}-responsemonitoring-includecaseloaddisaggregation-true-includeindicatordisaggregation-false-disaggregationonlytotal-false.json",
-            )
-            save_json(
-                self._json,
-                path,
-            )
+    def save(self) -> None:
+        if self._writer:
+            self._add_missing_arrays("locations", "caseloads")
+            self._writer.end_object()
+            self._writer.end_object()
+            self._writer.close()
+            self._writer = None
+
+    def abort(self) -> None:
+        if self._writer:
+            self._writer.abort()
+            self._writer = None
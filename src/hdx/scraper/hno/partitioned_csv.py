@@ -0,0 +1,161 @@
+import csv
+import json
+import logging
+from io import StringIO
+from itertools import groupby
+from operator import itemgetter
+from os import makedirs, replace
+from os.path import exists, join
+from shutil import copyfile
+
+from hdx.data.dataset import Dataset
+from hdx.data.resource import Resource
+
+logger = logging.getLogger(__name__)
+
+
+class PartitionedCSV:
+    """Write a global CSV of rows sorted by keys starting with the country ISO3 so
+    that each country's rows form a contiguous partition. A copy of the last
+    published output and an index of the byte range of each partition are kept in
+    the cache directory. Partitions of countries that have not changed are copied
+    byte for byte from the copy rather than being formatted again. If the headers
+    (which depend upon the highest admin level) or the fingerprint (for anything
+    else output in every row) differ from the copy, all partitions are written.
+
+    Args:
+        cache_dir: Directory holding the copy of the last published output
+        name: Name of output eg. hpc_hno_2024
+    """
+
+    def __init__(self, cache_dir: str, name: str) -> None:
+        self._folder = join(cache_dir, "global")
+        self._copy_path = join(self._folder, f"{name}.csv")
+        self._index_path = join(self._folder, f"{name}_index.json")
+        self._path = None
+        self._index = None
+
+    def _load_index(self) -> dict | None:
+        if not exists(self._index_path) or not exists(self._copy_path):
+            return None
+        with open(self._index_path, encoding="utf-8") as fp:
+            return json.load(fp)
+
+    @staticmethod
+    def _format_rows(rows: list[tuple]) -> bytes:
+        output = StringIO()
+        # Same output as the frictionless writer used by generate_resource
+        csv.writer(output).writerows(rows)
+        return output.getvalue().encode("utf-8")
+
+    def write(
+        self,
+        path: str,
+        headers: list[str],
+        rows: dict,
+        changed_countries: set[str],
+        fingerprint: str = "",
+    ) -> int:
+        index = self._load_index()
+        if (
+            index is None
+            or index["headers"] != headers
+            or index["fingerprint"] != fingerprint
+        ):
+            previous_partitions = {}
+        else:
+            previous_partitions = index["partitions"]
+        partitions = {}
+        no_rows = 0
+        no_copied = 0
+        previous_fp = open(self._copy_path, "rb") if previous_partitions else None
+        try:
+            with open(path, "wb") as fp:
+                fp.write(self._format_rows([headers]))
+                for countryiso3, keys in groupby(sorted(rows), key=itemgetter(0)):
+                    start = fp.tell()
+                    previous = previous_partitions.get(countryiso3)
+                    if previous and countryiso3 not in changed_countries:
+                        offset, length, no_partition_rows = previous
+                        previous_fp.seek(offset)
+                        fp.write(previous_fp.read(length))
+                        no_copied += 1
+                    else:
+                        # csv writes missing values (None) as empty strings
+                        partition_rows = [
+                            tuple(map(rows[key].get, headers)) for key in keys
+                        ]
+                        no_partition_rows = len(partition_rows)
+                        fp.write(self._format_rows(partition_rows))
+                    no_rows += no_partition_rows
+                    partitions[countryiso3] = [
+                        start,
+                        fp.tell() - start,
+                        no_partition_rows,
+                    ]
+        finally:
+            if previous_fp:
+                previous_fp.close()
+        logger.info(
+            f"Wrote {len(partitions)} partitions of {path}, {no_copied} copied unchanged"
+        )
+        self._path = path
+        self._index = {
+            "headers": headers,
+            "fingerprint": fingerprint,
+            "partitions": partitions,
+        }
+        return no_rows
+
+    def commit(self) -> None:
+        # Only kept once published so unchanged partitions always match HDX
+        if self._path is None:
+            return
+        makedirs(self._folder, exist_ok=True)
+        copyfile(self._path, f"{self._copy_path}.tmp")
+        replace(f"{self._copy_path}.tmp", self._copy_path)
+        with open(f"{self._index_path}.tmp", "w", encoding="utf-8") as fp:
+            json.dump(self._index, fp)
+        replace(f"{self._index_path}.tmp", self._index_path)
+
+
+def generate_partitioned_resource(
+    dataset: Dataset,
+    partitioned_csv: PartitionedCSV,
+    folder: str,
+    filename: str,
+    rows: dict,
+    resourcedata: dict,
+    headers: list[str],
+    changed_countries: set[str],
+    fingerprint: str = "",
+) -> tuple[bool, dict]:
+    """Equivalent of Dataset.generate_resource which writes the file using a
+    PartitionedCSV
+
+    Args:
+        dataset: Dataset to which to add resource
+        partitioned_csv: PartitionedCSV object
+        folder: Folder to which to write file containing rows
+        filename: Filename of file to write rows
+        rows: Rows by key sorted by country ISO3 first
+        resourcedata: Resource data
+        headers: Headers
+        changed_countries: Countries whose partitions must be written
+        fingerprint: Value which if changed means all partitions are written. Defaults to "".
+
+    Returns:
+        (True if resource added, dictionary of results)
+    """
+    filepath = join(folder, filename)
+    no_rows = partitioned_csv.write(
+        filepath, headers, rows, changed_countries, fingerprint
+    )
+    if not no_rows:
+        logger.error(f"No data rows in {filename}!")
+        return False, {}
+    resource = Resource(resourcedata)
+    resource.set_format("csv")
+    resource.set_file_to_upload(filepath)
+    dataset.add_update_resource(resource)
+    return True, {"resource": resource, "headers": headers}
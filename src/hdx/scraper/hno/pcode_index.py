@@ -0,0 +1,116 @@
+import logging
+from collections.abc import Iterable
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from hdx.location.adminlevel import AdminLevel
+
+logger = logging.getLogger(__name__)
+
+
+class PcodeIndex:
+    """P-codes to process. A p-code ending in * eg. SD01* selects that p-code and all
+    of its descendants, otherwise only the exact p-code is selected. Parents come
+    from the admin tables and the locations of each plan. P-code prefixes are used for
+    p-codes with no recorded parent since p-codes normally extend those of their
+    parents. Whether a p-code
+    is selected is remembered so that repeated checks are set lookups.
+
+    Args:
+        pcodes: P-codes to process
+        parents: Mapping from p-code to parent p-code. Defaults to None.
+    """
+
+    def __init__(
+        self, pcodes: Iterable[str], parents: dict[str, str] | None = None
+    ) -> None:
+        self._selected = set()
+        self._roots = set()
+        selectors = set()
+        for pcode in pcodes:
+            pcode = pcode.strip()
+            if not pcode:
+                continue
+            selectors.add(pcode)
+            if pcode.endswith("*"):
+                pcode = pcode[:-1]
+                self._roots.add(pcode)
+            self._selected.add(pcode)
+        self._selectors = sorted(selectors)
+        self._max_root_length = max((len(root) for root in self._roots), default=0)
+        if parents is None:
+            parents = {}
+        self._parents = parents
+        self._unselected = set()
+
+    @classmethod
+    def from_file(
+        cls, path: str, parents: dict[str, str] | None = None
+    ) -> "PcodeIndex":
+        """Read p-codes from a file with one or more comma separated p-codes per
+        line. Text after # is ignored.
+
+        Args:
+            path: Path to file
+            parents: Mapping from p-code to parent p-code. Defaults to None.
+
+        Returns:
+            PcodeIndex
+        """
+        pcodes = []
+        with open(path, encoding="utf-8") as fp:
+            for line in fp:
+                line = line.split("#", 1)[0]
+                pcodes.extend(line.split(","))
+        return cls(pcodes, parents)
+
+    @staticmethod
+    def get_parents(admins: "list[AdminLevel] | None") -> dict[str, str]:
+        parents = {}
+        if admins:
+            for admin in admins:
+                parents.update(admin.pcode_to_parent)
+        return parents
+
+    def get_selectors(self) -> list[str]:
+        return self._selectors
+
+    def has_roots(self) -> bool:
+        return bool(self._roots)
+
+    def add_parents(self, parents: dict[str, str]) -> None:
+        if not self._roots:
+            return
+        self._parents.update(parents)
+        # New parents may select p-codes that were not selected before
+        self._unselected = set()
+
+    def _is_descendant(self, pcode: str) -> bool:
+        parent = self._parents.get(pcode)
+        if parent:
+            seen = set()
+            while parent and parent not in seen:
+                if parent in self._roots:
+                    return True
+                seen.add(parent)
+                parent = self._parents.get(parent)
+            return False
+        # Prefixes are only used for p-codes without a recorded parent
+        for i in range(1, min(len(pcode), self._max_root_length + 1)):
+            if pcode[:i] in self._roots:
+                return True
+        return False
+
+    def __contains__(self, pcode: str) -> bool:
+        if pcode in self._selected:
+            return True
+        if not self._roots or pcode in self._unselected:
+            return False
+        if self._is_descendant(pcode):
+            self._selected.add(pcode)
+            return True
+        self._unselected.add(pcode)
+        return False
+
+    def __bool__(self) -> bool:
+        return bool(self._selected)
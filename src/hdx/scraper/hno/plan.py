@@ -1,4 +1,5 @@
 import logging
+from collections.abc import Iterable
 from copy import deepcopy
 from datetime import datetime
 
@@ -8,8 +9,12 @@ from hdx.pipelineutils.reader import Read
 from hdx.utilities.base_downloader import DownloadError
 from hdx.utilities.dateparse import parse_date
 
-from .caseload_json import CaseloadJSON
+from .caseload_table import CaseloadTable
+from .consistency import ConsistencyChecker
+from .error_aggregator import ErrorAggregator
 from .monitor_json import MonitorJSON
+from .pcode_index import PcodeIndex
+from .plan_index import PlanIndex, PlanIndexCache
 from .progress_json import ProgressJSON
 
 logger = logging.getLogger(__name__)
@@ -22,58 +27,75 @@ class Plan:
         year: int,
         error_handler: HDXErrorHandler,
         countryiso3s_to_process: list[str] | None = None,
-        pcodes_to_process: list[str] | None = None,
+        pcodes_to_process: list[str] | PcodeIndex | None = None,
+        cache_dir: str | None = None,
+        engine: str = "loop",
     ) -> None:
+        if engine not in ("loop", "columnar"):
+            raise ValueError(f"Unknown engine {engine}!")
         self._hpc_url = configuration["hpc_url"]
         self._max_admin = configuration["max_admin"]
         self._population_status_lookup = configuration["population_status"]
+        self._consistency = deepcopy(configuration.get("consistency"))
         self._year = year
-        self._error_handler = error_handler
+        self._errors = ErrorAggregator(error_handler)
         self._countryiso3s_to_process = countryiso3s_to_process
+        if pcodes_to_process is not None and not isinstance(
+            pcodes_to_process, PcodeIndex
+        ):
+            pcodes_to_process = PcodeIndex(pcodes_to_process)
         self._pcodes_to_process = pcodes_to_process
+        self._engine = engine
+        if "consistency" in configuration:
+            self._consistency_checker = ConsistencyChecker(configuration, self._errors)
+        else:
+            self._consistency_checker = None
         self._global_rows = {}
         self._highest_admin = {}
+        self._plan_versions = {}
+        if cache_dir:
+            self._plan_index_cache = PlanIndexCache(cache_dir)
+        else:
+            self._plan_index_cache = None
 
     def get_plan_ids_and_countries(self, progress_json: ProgressJSON) -> list:
         json = Read.get_reader("hpc_basic").download_json(
             f"{self._hpc_url}fts/flow/plan/overview/progress/{self._year}"
         )
         plan_ids_countries = []
-        for plan in json["data"]["plans"]:
-            plan_id = plan["id"]
-            if plan["planType"]["name"] not in (
-                "Humanitarian response plan",
-                "Humanitarian needs and response plan",
-            ):
-                continue
-            countries = plan["countries"]
-            if len(countries) != 1:
-                continue
-            countryiso3 = countries[0]["iso3"]
-            if (
-                self._countryiso3s_to_process
-                and countryiso3 not in self._countryiso3s_to_process
-            ):
-                continue
-            plan["caseLoads"] = []
-            progress_json.add_plan(plan)
-            plan_ids_countries.append({"iso3": countryiso3, "id": plan_id})
+        try:
+            for plan in json["data"]["plans"]:
+                plan_id = plan["id"]
+                if plan["planType"]["name"] not in (
+                    "Humanitarian response plan",
+                    "Humanitarian needs and response plan",
+                ):
+                    continue
+                countries = plan["countries"]
+                if len(countries) != 1:
+                    continue
+                countryiso3 = countries[0]["iso3"]
+                if (
+                    self._countryiso3s_to_process
+                    and countryiso3 not in self._countryiso3s_to_process
+                ):
+                    continue
+                plan["caseLoads"] = []
+                self._plan_versions[plan_id] = (
+                    plan.get("planVersionId"),
+                    plan.get("updatedAt"),
+                )
+                progress_json.add_plan(plan)
+                plan_ids_countries.append({"iso3": countryiso3, "id": plan_id})
+        except BaseException:
+            progress_json.abort()
+            raise
         progress_json.save()
         return sorted(plan_ids_countries, key=lambda x: x["iso3"])
 
-    def get_location_mapping(
-        self,
-        countryiso3: str,
-        data: dict,
-        monitor_json: MonitorJSON,
-    ) -> dict:
-        location_mapping = {}
+    def add_monitor_locations(self, data: dict, monitor_json: MonitorJSON) -> None:
         for location in data["locations"]:
             adminlevel = location.get("adminLevel")
-            if adminlevel > self._max_admin:
-                raise ValueError(
-                    f"Admin level: {adminlevel} for {countryiso3} is not supported!"
-                )
             if adminlevel >= 1:
                 pcode = location["pcode"].strip()
                 if self._pcodes_to_process:
@@ -83,124 +105,141 @@ class Plan:
                     monitor_json.add_location(location)
             elif adminlevel == 0:
                 monitor_json.add_location(location)
-            location_mapping[location["id"]] = location
-        return location_mapping
-
-    @staticmethod
-    def get_cluster_mapping(data: dict, monitor_json: MonitorJSON) -> dict:
-        cluster_mapping = {None: "ALL"}
-        clusters = data["planGlobalClusters"]
-        for cluster in clusters:
-            cluster_code = cluster["globalClusterCode"]
-            for plan_cluster_code in cluster["planClusters"]:
-                if plan_cluster_code in cluster_mapping:
-                    cluster_mapping[plan_cluster_code] = ""
-                else:
-                    cluster_mapping[plan_cluster_code] = cluster_code
-        monitor_json.set_global_clusters(clusters)
-        return cluster_mapping
+
+    def get_plan_index(
+        self,
+        countryiso3: str,
+        plan_id: str,
+        data: dict,
+        monitor_json: MonitorJSON,
+    ) -> PlanIndex:
+        version = data["lastPublishedVersion"]
+        # Test data needs the full locations and clusters so the cache is skipped
+        if self._plan_index_cache and not monitor_json.is_saving():
+            plan_index = self._plan_index_cache.get(plan_id, version)
+            if plan_index:
+                logger.info(f"Using cached index of plan {plan_id} version {version}")
+                if self._pcodes_to_process:
+                    self._pcodes_to_process.add_parents(plan_index.get_parents())
+                return plan_index
+        plan_index = PlanIndex.from_data(data, self._max_admin, countryiso3)
+        if self._pcodes_to_process:
+            self._pcodes_to_process.add_parents(plan_index.get_parents())
+        self.add_monitor_locations(data, monitor_json)
+        monitor_json.set_global_clusters(data["planGlobalClusters"])
+        if self._plan_index_cache:
+            self._plan_index_cache.save(plan_id, version, plan_index)
+        return plan_index
 
     def fill_population_status_info(self, row: dict, data: dict) -> None:
         for input_key, key in self._population_status_lookup.items():
             row[key] = data.get(input_key, "")
         row["Info"] = "|".join(sorted(row["Info"]))
 
-    def process(
-        self,
-        countryiso3: str,
-        plan_id: str,
-        monitor_json: MonitorJSON,
-    ) -> tuple[datetime | None, dict | None]:
-        logger.info(f"Processing {countryiso3}")
+    def download(self, plan_id: str) -> dict | None:
         try:
-            json = Read.get_reader("hpc_bearer").download_json(
+            return Read.get_reader("hpc_bearer").download_json(
                 f"{self._hpc_url}plan/{plan_id}/responseMonitoring?includeCaseloadDisaggregation=true&includeIndicatorDisaggregation=false&disaggregationOnlyTotal=false",
             )
         except DownloadError as err:
             logger.exception(err)
-            return None, None
-        data = json["data"]
+            return None
 
-        publish_disaggregated = False
-        last_published_version = data["lastPublishedVersion"]
-        last_published_date = data["lastPublishedDate"]
-        monitor_json.set_last_published(last_published_version, last_published_date)
-        if float(last_published_version) >= 1:
-            publish_disaggregated = True
-
-        location_mapping = self.get_location_mapping(
-            countryiso3,
-            data,
-            monitor_json,
-        )
-        cluster_mapping = self.get_cluster_mapping(data, monitor_json)
+    def get_base_row(
+        self,
+        countryiso3: str,
+        caseload: dict,
+        cluster_mapping: dict,
+        publish_disaggregated: bool,
+    ) -> dict | None:
+        caseload_description = caseload["caseloadDescription"]
+        entity_id = caseload["entityId"]
+        cluster = cluster_mapping.get(entity_id, "NO_CLUSTER_CODE")
+        if cluster != "ALL" and publish_disaggregated is False:
+            return None
+        base_row = {
+            "Category": "",
+            "Description": caseload_description,
+            "Info": set(),
+        }
 
-        rows = {}
-        highest_admin = 0
-        for caseload in data["caseloads"]:
-            caseload_description = caseload["caseloadDescription"]
-            entity_id = caseload["entityId"]
-            cluster = cluster_mapping.get(entity_id, "NO_CLUSTER_CODE")
-            if cluster != "ALL" and publish_disaggregated is False:
-                continue
-            base_row = {
-                "Category": "",
-                "Description": caseload_description,
-                "Info": set(),
-            }
-
-            # No cluster code provided
-            if cluster == "NO_CLUSTER_CODE":
-                cluster = ""
-                self._error_handler.add_message(
-                    "HumanitarianNeeds",
-                    "HPC",
-                    f"caseload {caseload_description} no cluster for entity {entity_id} in {countryiso3}",
-                    message_type="warning",
-                )
-                base_row["Info"].add(f"No cluster for entity {entity_id}")
-            # HACKY CODE TO DEAL WITH DIFFERENT AORS UNDER PROTECTION
-            elif cluster == "":
-                description_lower = caseload_description.lower()
+        # No cluster code provided
+        if cluster == "NO_CLUSTER_CODE":
+            cluster = ""
+            self._errors.add_message(
+                "HumanitarianNeeds",
+                "HPC",
+                "caseload {} no cluster for entity {} in {}",
+                (caseload_description, entity_id, countryiso3),
+                message_type="warning",
+            )
+            base_row["Info"].add(f"No cluster for entity {entity_id}")
+        # HACKY CODE TO DEAL WITH DIFFERENT AORS UNDER PROTECTION
+        elif cluster == "":
+            description_lower = caseload_description.lower()
+            if any(
+                x in description_lower for x in ("child", "enfant", "niñez", "infancia")
+            ):
+                cluster = "PRO-CPN"
+            elif any(x in description_lower for x in ("housing", "logement")):
+                cluster = "PRO-HLP"
+            elif any(
+                x in description_lower for x in ("gender", "genre", "género", "gbv")
+            ):
+                cluster = "PRO-GBV"
+            elif any(x in description_lower for x in ("mine", "minas")):
+                cluster = "PRO-MIN"
+            elif any(x in description_lower for x in ("protection", "protección")):
                 if any(
                     x in description_lower
-                    for x in ("child", "enfant", "niñez", "infancia")
-                ):
-                    cluster = "PRO-CPN"
-                elif any(x in description_lower for x in ("housing", "logement")):
-                    cluster = "PRO-HLP"
-                elif any(
-                    x in description_lower for x in ("gender", "genre", "género", "gbv")
+                    for x in ("total", "overall", "general", "générale")
                 ):
-                    cluster = "PRO-GBV"
-                elif any(x in description_lower for x in ("mine", "minas")):
-                    cluster = "PRO-MIN"
-                elif any(x in description_lower for x in ("protection", "protección")):
-                    if any(
-                        x in description_lower
-                        for x in ("total", "overall", "general", "générale")
-                    ):
-                        cluster = "PRO"
-                    else:
-                        cluster = "PRO"
-                        self._error_handler.add_message(
-                            "HumanitarianNeeds",
-                            "HPC",
-                            f"caseload {caseload_description} ({entity_id}) mapped to PRO in {countryiso3}",
-                            message_type="warning",
-                        )
+                    cluster = "PRO"
                 else:
-                    cluster = ""
-                    self._error_handler.add_message(
+                    cluster = "PRO"
+                    self._errors.add_message(
                         "HumanitarianNeeds",
                         "HPC",
-                        f"caseload {caseload_description} ({entity_id}) unknown cluster in {countryiso3}",
-                        message_type="error",
+                        "caseload {} ({}) mapped to PRO in {}",
+                        (caseload_description, entity_id, countryiso3),
+                        message_type="warning",
                     )
-                    base_row["Info"].add(f"No cluster for {caseload_description}")
+            else:
+                cluster = ""
+                self._errors.add_message(
+                    "HumanitarianNeeds",
+                    "HPC",
+                    "caseload {} ({}) unknown cluster in {}",
+                    (caseload_description, entity_id, countryiso3),
+                    message_type="error",
+                )
+                base_row["Info"].add(f"No cluster for {caseload_description}")
 
-            base_row["Cluster"] = cluster
-            national_row = deepcopy(base_row)
+        base_row["Cluster"] = cluster
+        return base_row
+
+    def process_caseloads(
+        self,
+        countryiso3: str,
+        data: dict,
+        plan_index: PlanIndex,
+        publish_disaggregated: bool,
+        monitor_json: MonitorJSON,
+    ) -> tuple[dict, int]:
+        rows = {}
+        highest_admin = 0
+        for caseload in data["caseloads"]:
+            base_row = self.get_base_row(
+                countryiso3, caseload, plan_index.clusters, publish_disaggregated
+            )
+            if base_row is None:
+                continue
+            caseload_description = base_row["Description"]
+            entity_id = caseload["entityId"]
+            cluster = base_row["Cluster"]
+            # Rows only hold strings, numbers and the set of info so are copied
+            # shallowly with a new set
+            national_row = {**base_row, "Info": set(base_row["Info"])}
             for i in range(self._max_admin):
                 national_row[f"Admin {i + 1} PCode"] = ""
                 national_row[f"Admin {i + 1} Name"] = ""
@@ -210,23 +249,22 @@ class Plan:
             # adm code, cluster, caseload_description, category
             key = ("", cluster, caseload_description, "")
             rows[key] = national_row
-            global_row = deepcopy(national_row)
+            global_row = national_row.copy()
             global_row["Country ISO3"] = countryiso3
             key = (countryiso3, "", cluster, caseload_description, "")
             self._global_rows[key] = global_row
 
-            caseload_json = CaseloadJSON(caseload, monitor_json._save_test_data)
+            caseload_json = monitor_json.get_caseload_json(caseload)
             if publish_disaggregated:
                 for attachment in caseload["disaggregatedAttachments"]:
-                    row = deepcopy(base_row)
+                    row = {**base_row, "Info": set(base_row["Info"])}
                     location_id = attachment["locationId"]
-                    location = location_mapping.get(location_id)
+                    location = plan_index.get_location(location_id)
                     adm_codes = ["" for _ in range(self._max_admin)]
                     adm_names = ["" for _ in range(self._max_admin)]
                     if location:
-                        adminlevel = location.get("adminLevel")
+                        adminlevel, pcode, name = location
                         if adminlevel != 0:
-                            pcode = location["pcode"]
                             if (
                                 self._pcodes_to_process
                                 and pcode not in self._pcodes_to_process
@@ -234,16 +272,16 @@ class Plan:
                                 continue
                             if adminlevel > highest_admin:
                                 highest_admin = adminlevel
-                            name = location["name"]
                             adm_codes[adminlevel - 1] = pcode
                             adm_names[adminlevel - 1] = name
                             caseload_json.add_disaggregated_attachment(attachment)
                     else:
                         adminlevel = 0
-                        self._error_handler.add_message(
+                        self._errors.add_message(
                             "HumanitarianNeeds",
                             "HPC",
-                            f"caseload {caseload_description} ({entity_id}) unknown location {location_id} in {countryiso3}",
+                            "caseload {} ({}) unknown location {} in {}",
+                            (caseload_description, entity_id, location_id, countryiso3),
                             message_type="error",
                         )
                         row["Info"].add(f"Unknown location {location_id}")
@@ -292,20 +330,183 @@ class Plan:
                             if value and not existing_row.get(key):
                                 existing_row[key] = value
                     else:
-                        global_row = deepcopy(row)
+                        global_row = row.copy()
                         global_row["Country ISO3"] = countryiso3
                         self._global_rows[key] = global_row
 
             monitor_json.add_caseload_json(caseload_json)
+        return rows, highest_admin
 
-        self._highest_admin[countryiso3] = highest_admin
-        monitor_json.save(plan_id)
+    def process_table(
+        self,
+        countryiso3: str,
+        data: dict,
+        plan_index: PlanIndex,
+        publish_disaggregated: bool,
+        monitor_json: MonitorJSON,
+    ) -> tuple[dict, int]:
+        table = CaseloadTable(self._population_status_lookup, self._max_admin)
+        for caseload in data["caseloads"]:
+            base_row = self.get_base_row(
+                countryiso3, caseload, plan_index.clusters, publish_disaggregated
+            )
+            if base_row is not None:
+                table.add_caseload(caseload, base_row, publish_disaggregated)
+        table.join_locations(plan_index)
+        for i in table.unknown_locations:
+            caseload = table.caseloads[table.caseload_indexes[i]]
+            self._errors.add_message(
+                "HumanitarianNeeds",
+                "HPC",
+                "caseload {} ({}) unknown location {} in {}",
+                (
+                    caseload["caseloadDescription"],
+                    caseload["entityId"],
+                    table.attachments[i]["locationId"],
+                    countryiso3,
+                ),
+                message_type="error",
+            )
+        indexes = table.select(self._pcodes_to_process)
+        if monitor_json.is_saving():
+            attachments = table.get_located_attachments(indexes)
+            for caseload_index, caseload in enumerate(table.caseloads):
+                caseload_json = monitor_json.get_caseload_json(caseload)
+                for attachment in attachments.get(caseload_index, ()):
+                    caseload_json.add_disaggregated_attachment(attachment)
+                monitor_json.add_caseload_json(caseload_json)
+
+        rows = {}
+        for key, (row, has_total) in table.aggregate(indexes).items():
+            rows[key] = row
+            global_key = (countryiso3, *key)
+            # A caseload total replaces any existing row
+            if has_total:
+                existing_row = None
+            else:
+                existing_row = self._global_rows.get(global_key)
+            if existing_row:
+                for header, value in row.items():
+                    if value and not existing_row.get(header):
+                        existing_row[header] = value
+            else:
+                global_row = row.copy()
+                global_row["Country ISO3"] = countryiso3
+                self._global_rows[global_key] = global_row
+        return rows, table.get_highest_admin(indexes)
+
+    def process(
+        self,
+        countryiso3: str,
+        plan_id: str,
+        monitor_json: MonitorJSON,
+        json: dict | None = None,
+    ) -> tuple[datetime | None, dict | None]:
+        logger.info(f"Processing {countryiso3}")
+        if json is None:
+            json = self.download(plan_id)
+            if json is None:
+                return None, None
+        data = json["data"]
+        monitor_json.start(plan_id)
+        try:
+            publish_disaggregated = False
+            last_published_version = data["lastPublishedVersion"]
+            last_published_date = data["lastPublishedDate"]
+            monitor_json.set_last_published(last_published_version, last_published_date)
+            if float(last_published_version) >= 1:
+                publish_disaggregated = True
+
+            plan_index = self.get_plan_index(countryiso3, plan_id, data, monitor_json)
+            if self._engine == "columnar":
+                rows, highest_admin = self.process_table(
+                    countryiso3, data, plan_index, publish_disaggregated, monitor_json
+                )
+            else:
+                rows, highest_admin = self.process_caseloads(
+                    countryiso3, data, plan_index, publish_disaggregated, monitor_json
+                )
+            if self._consistency_checker:
+                infos = self._consistency_checker.check(
+                    countryiso3, rows, plan_index.get_parents()
+                )
+                for key, row_infos in infos.items():
+                    ConsistencyChecker.add_infos(rows[key], row_infos)
+                    global_row = self._global_rows.get((countryiso3, *key))
+                    if global_row:
+                        ConsistencyChecker.add_infos(global_row, row_infos)
+
+            self._highest_admin[countryiso3] = highest_admin
+        except BaseException:
+            monitor_json.abort()
+            raise
+        monitor_json.save()
+        self._errors.flush()
         published = parse_date(last_published_date, "%d/%m/%Y")
         return published, rows
 
+    def restore(self, countryiso3: str, rows: dict, highest_admin: int) -> None:
+        for key, row in rows.items():
+            key = (countryiso3, *key)
+            existing_row = self._global_rows.get(key)
+            if existing_row:
+                for header, value in row.items():
+                    if value and not existing_row.get(header):
+                        existing_row[header] = value
+            else:
+                global_row = deepcopy(row)
+                global_row["Country ISO3"] = countryiso3
+                self._global_rows[key] = global_row
+        self._highest_admin[countryiso3] = highest_admin
+
+    def load_global_rows(
+        self, global_rows: Iterable[tuple[tuple, dict]], highest_admin: dict
+    ) -> None:
+        for key, row in global_rows:
+            self._global_rows[key] = row
+        self._highest_admin.update(highest_admin)
+
+    def set_error_handler(self, error_handler: HDXErrorHandler) -> None:
+        self._errors.set_error_handler(error_handler)
+
+    def remove_country(self, countryiso3: str) -> None:
+        for key in [key for key in self._global_rows if key[0] == countryiso3]:
+            del self._global_rows[key]
+        self._highest_admin.pop(countryiso3, None)
+
+    def get_settings(self) -> dict:
+        """Get the settings on which the rows of a plan depend, like the p-codes
+        selected and the configuration of the consistency checks that add to the Info
+        column
+
+        Returns:
+            Settings
+        """
+        if self._pcodes_to_process is None:
+            pcodes = None
+        else:
+            pcodes = self._pcodes_to_process.get_selectors()
+        if self._countryiso3s_to_process is None:
+            countryiso3s = None
+        else:
+            countryiso3s = sorted(self._countryiso3s_to_process)
+        return {
+            "countryiso3s": countryiso3s,
+            "pcodes": pcodes,
+            "max_admin": self._max_admin,
+            "population_status": self._population_status_lookup,
+            "consistency": self._consistency,
+        }
+
+    def get_plan_version(self, plan_id: str | int) -> tuple | None:
+        return self._plan_versions.get(plan_id)
+
     def get_global_rows(self) -> dict:
         return self._global_rows
 
+    def get_highest_admins(self) -> dict:
+        return self._highest_admin
+
     def get_highest_admin(self, countryiso3: str) -> int | None:
         return self._highest_admin.get(countryiso3)
 
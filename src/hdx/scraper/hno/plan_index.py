@@ -0,0 +1,176 @@
+import json
+import logging
+from os import makedirs, replace
+from os.path import exists, join
+
+logger = logging.getLogger(__name__)
+
+
+class PlanIndex:
+    """Compact index of the locations and clusters of a plan version. Locations are
+    held as parallel arrays of id, parent id, admin level, p-code and name with a
+    mapping from location id to position, and plan clusters as a mapping to global
+    cluster codes.
+
+    Args:
+        locations: Location ids, parent ids, admin levels, p-codes and names
+        clusters: Mapping from plan cluster code to global cluster code
+    """
+
+    def __init__(
+        self,
+        locations: tuple[list, list, list, list, list],
+        clusters: dict,
+    ) -> None:
+        self.ids, self.parent_ids, self.admin_levels, self.pcodes, self.names = (
+            locations
+        )
+        self._positions = {location_id: i for i, location_id in enumerate(self.ids)}
+        self.clusters = clusters
+
+    @classmethod
+    def from_data(cls, data: dict, max_admin: int, countryiso3: str) -> "PlanIndex":
+        locations = ([], [], [], [], [])
+        for location in data["locations"]:
+            adminlevel = location.get("adminLevel")
+            if adminlevel > max_admin:
+                raise ValueError(
+                    f"Admin level: {adminlevel} for {countryiso3} is not supported!"
+                )
+            locations[0].append(location["id"])
+            locations[1].append(location.get("parentLocationId"))
+            locations[2].append(adminlevel)
+            locations[3].append(location.get("pcode"))
+            locations[4].append(location.get("name"))
+        clusters = {None: "ALL"}
+        for cluster in data["planGlobalClusters"]:
+            cluster_code = cluster["globalClusterCode"]
+            for plan_cluster_code in cluster["planClusters"]:
+                if plan_cluster_code in clusters:
+                    clusters[plan_cluster_code] = ""
+                else:
+                    clusters[plan_cluster_code] = cluster_code
+        return cls(locations, clusters)
+
+    @classmethod
+    def from_json(cls, plan_index_json: dict) -> "PlanIndex":
+        # JSON keys are strings so clusters are stored as pairs
+        return cls(
+            tuple(plan_index_json["locations"]),
+            dict(plan_index_json["clusters"]),
+        )
+
+    def to_json(self) -> dict:
+        return {
+            "locations": [
+                self.ids,
+                self.parent_ids,
+                self.admin_levels,
+                self.pcodes,
+                self.names,
+            ],
+            "clusters": list(self.clusters.items()),
+        }
+
+    def get_location(self, location_id: int) -> tuple[int, str, str] | None:
+        i = self._positions.get(location_id)
+        if i is None:
+            return None
+        return self.admin_levels[i], self.pcodes[i], self.names[i]
+
+    def get_parents(self) -> dict[str, str]:
+        parents = {}
+        for i, parent_id in enumerate(self.parent_ids):
+            pcode = self.pcodes[i]
+            j = self._positions.get(parent_id)
+            if pcode and j is not None and self.pcodes[j]:
+                parents[pcode.strip()] = self.pcodes[j].strip()
+        return parents
+
+    def compare(self, other: "PlanIndex") -> dict[str, list]:
+        """Compare with the index of another version of the plan
+
+        Args:
+            other: Index of other version
+
+        Returns:
+            Dictionary of added, removed and changed location ids and changed clusters
+        """
+        added = [
+            location_id
+            for location_id in self.ids
+            if location_id not in other._positions
+        ]
+        removed = [
+            location_id
+            for location_id in other.ids
+            if location_id not in self._positions
+        ]
+        changed = [
+            location_id
+            for location_id in self.ids
+            if location_id in other._positions
+            and self.get_location(location_id) != other.get_location(location_id)
+        ]
+        clusters = sorted(
+            str(code)
+            for code in self.clusters.keys() | other.clusters.keys()
+            if self.clusters.get(code) != other.clusters.get(code)
+        )
+        return {
+            "added": added,
+            "removed": removed,
+            "changed": changed,
+            "clusters": clusters,
+        }
+
+
+class PlanIndexCache:
+    """Cache of plan indexes by plan id and last published version kept in the
+    cache directory so that unchanged plans are not indexed again. The index of the
+    previous version is kept so that new versions can be compared with it.
+
+    Args:
+        cache_dir: Directory in which to keep plan indexes
+    """
+
+    def __init__(self, cache_dir: str) -> None:
+        self._folder = join(cache_dir, "plan_index")
+
+    def _get_path(self, plan_id: str | int) -> str:
+        return join(self._folder, f"{plan_id}.json")
+
+    def _load(self, plan_id: str | int) -> dict:
+        path = self._get_path(plan_id)
+        if not exists(path):
+            return {}
+        with open(path, encoding="utf-8") as fp:
+            return json.load(fp)
+
+    def get(self, plan_id: str | int, version: str) -> PlanIndex | None:
+        plan_index_json = self._load(plan_id).get(version)
+        if plan_index_json is None:
+            return None
+        return PlanIndex.from_json(plan_index_json)
+
+    def save(self, plan_id: str | int, version: str, plan_index: PlanIndex) -> None:
+        versions = self._load(plan_id)
+        if versions:
+            previous_version = list(versions)[-1]
+            if previous_version != version:
+                changes = plan_index.compare(
+                    PlanIndex.from_json(versions[previous_version])
+                )
+                text = ", ".join(
+                    f"{len(values)} {change}" for change, values in changes.items()
+                )
+                logger.info(
+                    f"Plan {plan_id} version {version} vs {previous_version}: {text}"
+                )
+                versions = {previous_version: versions[previous_version]}
+        versions[version] = plan_index.to_json()
+        makedirs(self._folder, exist_ok=True)
+        path = self._get_path(plan_id)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as fp:
+            json.dump(versions, fp)
+        replace(f"{path}.tmp", path)
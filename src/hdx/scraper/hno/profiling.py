@@ -0,0 +1,149 @@
+import logging
+import sys
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from cProfile import Profile
+from os import getpid, makedirs
+from os.path import basename, join
+from threading import Event, Thread, get_ident
+
+from hdx.scraper.hno.instrumentation import get_instrument
+
+logger = logging.getLogger(__name__)
+
+# Reusable context manager returned when profiling is disabled
+_disabled = nullcontext()
+
+
+class StackSampler:
+    """Samples the stack of a thread at an interval counting identical stacks, which
+    are output in the collapsed format read by flamegraph tools.
+
+    Args:
+        thread_id: Identifier of thread to sample
+        interval: Seconds between samples. Defaults to 0.005.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005) -> None:
+        self._thread_id = thread_id
+        self._interval = interval
+        self._stacks = Counter()
+        self._stop = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def get_frame_name(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(self.get_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self._stacks[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path: str) -> None:
+        with open(path, "w") as fp:
+            for stack, count in sorted(self._stacks.items()):
+                fp.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """Profiles selected stages writing a pstats file from a deterministic profiler
+    and a collapsed stack file from a sampling profiler for each call. Stages are
+    given as a comma separated string like plan:AFG,hapi,admins,publish where a stage
+    without countries is profiled for all of them.
+
+    Args:
+        profile_dir: Directory in which to write profile files
+        stages: Stages to profile with optional countries
+        interval: Seconds between stack samples. Defaults to 0.005.
+    """
+
+    stage_names = ("plan", "hapi", "admins", "publish")
+
+    def __init__(self, profile_dir: str, stages: str, interval: float = 0.005) -> None:
+        self._profile_dir = profile_dir
+        self._interval = interval
+        self._stages = {}
+        for stage in stages.split(","):
+            stage, _, countryiso3 = stage.strip().partition(":")
+            if stage not in self.stage_names:
+                raise ValueError(f"Unknown profiling stage {stage}!")
+            countryiso3s = self._stages.get(stage, set())
+            if countryiso3s is None or not countryiso3:
+                self._stages[stage] = None
+            else:
+                countryiso3s.add(countryiso3.upper())
+                self._stages[stage] = countryiso3s
+        self._counts = Counter()
+        self._active = False
+        makedirs(profile_dir, exist_ok=True)
+
+    def is_profiled(self, stage: str, countryiso3: str | None) -> bool:
+        if stage not in self._stages:
+            return False
+        countryiso3s = self._stages[stage]
+        return countryiso3s is None or countryiso3 in countryiso3s
+
+    @contextmanager
+    def _profile(self, stage: str, name: str):
+        self._active = True
+        sampler = StackSampler(get_ident(), self._interval)
+        profile = Profile()
+        sampler.start()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            sampler.stop()
+            self._active = False
+            # Stages can run more than once eg. in watch mode or for several years
+            self._counts[name] += 1
+            path = join(self._profile_dir, f"{name}_{getpid()}_{self._counts[name]}")
+            profile.dump_stats(f"{path}.pstats")
+            sampler.write(f"{path}.collapsed")
+            logger.info(f"Wrote {stage} profile to {path}")
+
+    def profile(self, stage: str, countryiso3: str | None = None):
+        # Only one profiler can be active at a time so stages within a profiled stage
+        # are not profiled separately
+        if self._active or not self.is_profiled(stage, countryiso3):
+            return _disabled
+        if countryiso3:
+            name = f"{stage}_{countryiso3}"
+        else:
+            name = stage
+        return self._profile(stage, name)
+
+    def finish(self) -> None:
+        # Profiles are written as each stage ends
+        logger.info(f"Profiles are in {self._profile_dir}")
+
+
+def profile(stage: str, countryiso3: str | None = None):
+    """Context manager profiling a stage if it was selected for profiling
+
+    Args:
+        stage: Stage, one of plan, hapi, admins or publish
+        countryiso3: Country ISO3 code. Defaults to None.
+
+    Returns:
+        Context manager
+    """
+    profiler = get_instrument("profiler")
+    if profiler is None:
+        return _disabled
+    return profiler.profile(stage, countryiso3)
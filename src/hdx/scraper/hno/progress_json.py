@@ -1,22 +1,43 @@
 from os.path import join
 
-from hdx.utilities.saver import save_json
+from .json_stream import JSONStreamWriter
 
 
 class ProgressJSON:
-    def __init__(self, year: int, saved_dir: str, save_test_data: bool = False) -> None:
+    def __init__(
+        self,
+        year: int,
+        saved_dir: str,
+        save_test_data: bool = False,
+        compress: bool = False,
+    ) -> None:
         self._path = join(saved_dir, f"test_progress-{year}.json")
         self._save_test_data = save_test_data
-        self._plans = []
-        self._json = {"data": {"plans": self._plans}}
+        self._compress = compress
+        self._writer = None
+
+    def _get_writer(self) -> JSONStreamWriter:
+        if self._writer is None:
+            self._writer = JSONStreamWriter(self._path, self._compress)
+            self._writer.begin_object()
+            self._writer.begin_object("data")
+            self._writer.begin_array("plans")
+        return self._writer
 
     def add_plan(self, plan: dict) -> None:
         if self._save_test_data:
-            self._plans.append(plan)
+            self._get_writer().value(plan)
 
     def save(self):
         if self._save_test_data:
-            save_json(
-                self._json,
-                self._path,
-            )
+            writer = self._get_writer()
+            writer.end_array()
+            writer.end_object()
+            writer.end_object()
+            writer.close()
+            self._writer = None
+
+    def abort(self) -> None:
+        if self._writer:
+            self._writer.abort()
+            self._writer = None
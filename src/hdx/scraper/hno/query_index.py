@@ -0,0 +1,214 @@
+"""Local SQLite index over global HNO and HAPI rows"""
+
+import argparse
+import csv
+import logging
+import sqlite3
+import sys
+from collections.abc import Sequence
+
+logger = logging.getLogger(__name__)
+
+
+def get_column(header: str) -> str:
+    return header.lower().replace(" ", "_")
+
+
+def get_value(value):
+    # Empty strings in the outputs are missing values
+    if value == "":
+        return None
+    return value
+
+
+class QueryIndex:
+    """Materialise the global HNO and HAPI rows of each year into a local SQLite
+    database with indexes on country, admin p-codes, sector and population status so
+    that questions about a run can be answered without loading the CSVs. Each year's
+    rows replace any earlier rows of that year in a single transaction.
+
+    Args:
+        path: Path of SQLite database
+    """
+
+    indexes = {
+        "hno": (
+            ("year", "country_iso3"),
+            ("admin_1_pcode",),
+            ("admin_2_pcode",),
+            ("cluster",),
+        ),
+        "hapi": (
+            ("year", "location_code"),
+            ("admin1_code",),
+            ("admin2_code",),
+            ("sector_code",),
+            ("population_status",),
+        ),
+    }
+
+    def __init__(self, path: str) -> None:
+        # Workers for different years may write at the same time
+        self._connection = sqlite3.connect(path, timeout=60)
+        self._connection.row_factory = sqlite3.Row
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> "QueryIndex":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _get_columns(self, table: str) -> list[str]:
+        cursor = self._connection.execute(f'PRAGMA table_info("{table}")')
+        return [row["name"] for row in cursor]
+
+    def _create_table(self, table: str, columns: list[str]) -> None:
+        existing_columns = self._get_columns(table)
+        if not existing_columns:
+            definition = ", ".join(f'"{column}"' for column in ["year", *columns])
+            self._connection.execute(f'CREATE TABLE "{table}" ({definition})')
+        else:
+            # Headers can gain columns eg. admin levels so tables grow to match
+            for column in columns:
+                if column not in existing_columns:
+                    self._connection.execute(
+                        f'ALTER TABLE "{table}" ADD COLUMN "{column}"'
+                    )
+        for index_columns in self.indexes[table]:
+            if "year" not in index_columns and index_columns[0] not in columns:
+                continue
+            name = f"{table}_{'_'.join(index_columns)}"
+            definition = ", ".join(f'"{column}"' for column in index_columns)
+            self._connection.execute(
+                f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({definition})'
+            )
+
+    def add_rows(self, table: str, year: int, headers: list[str], rows: dict) -> int:
+        columns = [get_column(header) for header in headers]
+        self._create_table(table, columns)
+        self._connection.execute(f'DELETE FROM "{table}" WHERE year = ?', (year,))
+        names = ", ".join(f'"{column}"' for column in ["year", *columns])
+        placeholders = ", ".join("?" * (len(columns) + 1))
+        self._connection.executemany(
+            f'INSERT INTO "{table}" ({names}) VALUES ({placeholders})',
+            (
+                [year, *(get_value(rows[key].get(header)) for header in headers)]
+                for key in sorted(rows)
+            ),
+        )
+        return len(rows)
+
+    def build(
+        self,
+        year: int,
+        hno_headers: list[str],
+        hno_rows: dict,
+        hapi_headers: list[str],
+        hapi_rows: dict,
+    ) -> None:
+        with self._connection:
+            no_hno_rows = self.add_rows("hno", year, hno_headers, hno_rows)
+            no_hapi_rows = self.add_rows("hapi", year, hapi_headers, hapi_rows)
+        logger.info(
+            f"Indexed {no_hno_rows} HNO and {no_hapi_rows} HAPI rows for {year}"
+        )
+
+    def query(self, sql: str, parameters: Sequence = ()) -> list[dict]:
+        cursor = self._connection.execute(sql, parameters)
+        return [dict(row) for row in cursor]
+
+    def get_populations(
+        self,
+        countryiso3: str,
+        year: int | None = None,
+        population_status: str = "INN",
+        admin_level: int | None = None,
+        sector_code: str | None = None,
+        category: str | None = None,
+    ) -> list[dict]:
+        """Get HAPI population figures for a country summed by admin unit and
+        sector eg. people in need by sector for SDN admin 2. Only total rows are
+        included unless a category is given so that disaggregations are not counted
+        twice.
+
+        Args:
+            countryiso3: Country ISO3 code
+            year: Year. Defaults to None (latest year indexed).
+            population_status: Population status. Defaults to "INN".
+            admin_level: Admin level. Defaults to None (all levels).
+            sector_code: Sector code. Defaults to None (all sectors).
+            category: Category. Defaults to None (totals).
+
+        Returns:
+            List of rows with admin codes and names, sector code and population
+        """
+        if year is None:
+            year = self._connection.execute(
+                "SELECT MAX(year) FROM hapi WHERE location_code = ?", (countryiso3,)
+            ).fetchone()[0]
+        conditions = ["year = ?", "location_code = ?", "population_status = ?"]
+        parameters = [year, countryiso3, population_status]
+        if admin_level is not None:
+            conditions.append("admin_level = ?")
+            parameters.append(admin_level)
+        if sector_code is not None:
+            conditions.append("sector_code = ?")
+            parameters.append(sector_code)
+        if category is None:
+            # Subnational totals have the category "total" rather than none
+            conditions.append("(category IS NULL OR LOWER(category) = 'total')")
+        else:
+            conditions.append("category = ?")
+            parameters.append(category)
+        where = " AND ".join(conditions)
+        group_by = "admin1_code, admin1_name, admin2_code, admin2_name, sector_code"
+        return self.query(
+            f"SELECT {group_by}, SUM(population) AS population FROM hapi "
+            f"WHERE {where} GROUP BY {group_by} ORDER BY {group_by}",
+            parameters,
+        )
+
+
+def main(args: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Query the local index of HNO and HAPI rows"
+    )
+    parser.add_argument("database", help="Path of SQLite database")
+    parser.add_argument("countryiso3", nargs="?", help="Country ISO3 code")
+    parser.add_argument("--sql", help="SQL query to run instead")
+    parser.add_argument("--year", type=int, help="Year (default latest)")
+    parser.add_argument("--status", default="INN", help="Population status")
+    parser.add_argument("--admin-level", type=int, help="Admin level")
+    parser.add_argument("--sector", help="Sector code")
+    parser.add_argument("--category", help="Category")
+    args = parser.parse_args(args)
+    with QueryIndex(args.database) as query_index:
+        if args.sql:
+            rows = query_index.query(args.sql)
+        elif args.countryiso3:
+            rows = query_index.get_populations(
+                args.countryiso3,
+                args.year,
+                args.status,
+                args.admin_level,
+                args.sector,
+                args.category,
+            )
+        else:
+            parser.error("Either a country or --sql must be given")
+    if not rows:
+        return
+    headers = list(rows[0])
+    writer = csv.writer(sys.stdout, dialect="excel-tab")
+    writer.writerow(headers)
+    for row in rows:
+        writer.writerow(
+            ["" if row[header] is None else row[header] for header in headers]
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import logging
+from collections.abc import Callable
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from time import monotonic, sleep
+
+from hdx.utilities.dateparse import now_utc
+from hdx.utilities.downloader import Download, DownloadError
+from requests import Response
+from urllib3.util import Retry
+
+logger = logging.getLogger(__name__)
+
+
+class RateController:
+    """Client side rate controller for a downloader. The request rate is adjusted
+    using additive increase on success and multiplicative decrease when the server
+    signals that it is overloaded with a 429 or 5xx status, in which case the request
+    is retried after the time given in any Retry-After header or otherwise after an
+    exponential backoff. A wrapped downloader's requests go to its unlimited
+    normal_setup, so the controller replaces any fixed rate limit of the downloader
+    rather than adding to it.
+
+    Args:
+        name: Name of the downloader being controlled
+        initial_rate: Starting requests per second. Defaults to 1.
+        min_rate: Minimum requests per second. Defaults to 0.1.
+        max_rate: Maximum requests per second. Defaults to 5.
+        increase: Requests per second added after each success. Defaults to 0.1.
+        decrease: Factor applied to the rate when throttled. Defaults to 0.5.
+        max_retries: Maximum retries of a request. Defaults to 5.
+        backoff: Seconds to wait before the first retry without Retry-After. Defaults to 1.
+        max_backoff: Maximum seconds to wait before a retry. Defaults to 300.
+        clock: Function returning the current time in seconds. Defaults to monotonic.
+        sleep_fn: Function to sleep for a number of seconds. Defaults to sleep.
+    """
+
+    retry_statuses = (429, 500, 502, 503, 504)
+
+    def __init__(
+        self,
+        name: str,
+        initial_rate: float = 1,
+        min_rate: float = 0.1,
+        max_rate: float = 5,
+        increase: float = 0.1,
+        decrease: float = 0.5,
+        max_retries: int = 5,
+        backoff: float = 1,
+        max_backoff: float = 300,
+        clock: Callable[[], float] = monotonic,
+        sleep_fn: Callable[[float], None] = sleep,
+    ) -> None:
+        self._name = name
+        self._rate = initial_rate
+        self._min_rate = min_rate
+        self._max_rate = max_rate
+        self._increase = increase
+        self._decrease = decrease
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._clock = clock
+        self._sleep = sleep_fn
+        self._next_time = None
+        self._lock = Lock()
+
+    def get_rate(self) -> float:
+        return self._rate
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = self._clock()
+            if self._next_time is None or self._next_time < now:
+                self._next_time = now
+            wait = self._next_time - now
+            self._next_time += 1 / self._rate
+        if wait > 0:
+            self._sleep(wait)
+
+    def on_success(self) -> None:
+        with self._lock:
+            self._rate = min(self._rate + self._increase, self._max_rate)
+
+    def on_throttle(self, delay: float) -> None:
+        with self._lock:
+            self._rate = max(self._rate * self._decrease, self._min_rate)
+            # Hold back every request through this controller not just the retry
+            next_time = self._clock() + delay
+            if self._next_time is None or self._next_time < next_time:
+                self._next_time = next_time
+
+    @staticmethod
+    def get_retry_after(response: Response | None) -> float | None:
+        if response is None:
+            return None
+        retry_after = response.headers.get("Retry-After")
+        if not retry_after:
+            return None
+        try:
+            return max(float(retry_after), 0)
+        except ValueError:
+            pass
+        try:
+            retry_date = parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+        return max((retry_date - now_utc()).total_seconds(), 0)
+
+    def get_delay(self, response: Response | None, attempt: int) -> float:
+        delay = self.get_retry_after(response)
+        if delay is None:
+            delay = self._backoff * 2**attempt
+        return min(delay, self._max_backoff)
+
+    def wrap(self, downloader: Download) -> None:
+        # Statuses are retried here rather than by the session so that the
+        # controller sees the server's signals
+        for adapter in {
+            id(x): x for x in downloader.session.adapters.values()
+        }.values():
+            max_retries = getattr(adapter, "max_retries", None)
+            if isinstance(max_retries, Retry):
+                adapter.max_retries = max_retries.new(
+                    status_forcelist=None, respect_retry_after_header=False
+                )
+        normal_setup = downloader.normal_setup
+
+        def setup(*args, **kwargs) -> Response:
+            attempt = 0
+            while True:
+                self.acquire()
+                try:
+                    response = normal_setup(*args, **kwargs)
+                except DownloadError:
+                    response = downloader.response
+                    if (
+                        response is None
+                        or response.status_code not in self.retry_statuses
+                    ):
+                        raise
+                    if attempt >= self._max_retries:
+                        raise
+                    delay = self.get_delay(response, attempt)
+                    self.on_throttle(delay)
+                    attempt += 1
+                    logger.warning(
+                        f"{self._name} returned {response.status_code}, retry {attempt} in {delay:.1f}s at {self._rate:.2f} requests/s"
+                    )
+                    continue
+                self.on_success()
+                return response
+
+        downloader.setup = setup
+
+
+def setup_rate_controllers(budgets: dict) -> dict[str, RateController]:
+    """Set up a rate controller for each named downloader from a dictionary of
+    form {"downloader name": {"initial_rate": 1, ...}, ...}
+
+    Args:
+        budgets: Rate controller parameters by downloader name
+
+    Returns:
+        Dictionary of rate controllers by downloader name
+    """
+    rate_controllers = {}
+    for name, budget in budgets.items():
+        downloader = Download.downloaders.get(name)
+        if downloader is None:
+            continue
+        rate_controller = RateController(name, **budget)
+        rate_controller.wrap(downloader)
+        rate_controllers[name] = rate_controller
+    return rate_controllers
@@ -0,0 +1,161 @@
+import logging
+import struct
+import zlib
+from collections import deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
+from os import cpu_count
+from typing import BinaryIO
+
+from requests import PreparedRequest, Response, Session
+
+logger = logging.getLogger(__name__)
+
+compression_methods = ("gzip", "zstd")
+
+# No file name and a zero modification time so that output is reproducible and
+# unchanged files keep the same hash
+_gzip_header = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+# Empty final deflate block
+_gzip_end = b"\x03\x00"
+
+
+def _deflate(chunk: bytes, level: int) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    # Ending on a byte boundary lets compressed chunks be concatenated
+    return compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def gzip_stream(
+    input_fp: BinaryIO,
+    output_fp: BinaryIO,
+    level: int = 6,
+    threads: int | None = None,
+    chunk_size: int = 1 << 20,
+) -> None:
+    """Gzip a stream compressing chunks in parallel threads (zlib releases the GIL)
+    into a single gzip member. The output does not depend upon the number of threads.
+
+    Args:
+        input_fp: Stream to compress
+        output_fp: Stream to which to write compressed output
+        level: Compression level. Defaults to 6.
+        threads: Number of threads. Defaults to None (number of CPUs).
+        chunk_size: Size of chunks compressed independently. Defaults to 1MB.
+
+    Returns:
+        None
+    """
+    threads = threads or cpu_count() or 1
+    crc = 0
+    size = 0
+    with ThreadPoolExecutor(threads) as executor:
+        output_fp.write(_gzip_header)
+        pending = deque()
+        while chunk := input_fp.read(chunk_size):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            pending.append(executor.submit(_deflate, chunk, level))
+            if len(pending) >= threads * 2:
+                output_fp.write(pending.popleft().result())
+        while pending:
+            output_fp.write(pending.popleft().result())
+        output_fp.write(_gzip_end)
+        output_fp.write(struct.pack("<II", crc, size & 0xFFFFFFFF))
+
+
+def zstd_stream(
+    input_fp: BinaryIO,
+    output_fp: BinaryIO,
+    level: int = 3,
+    threads: int | None = None,
+) -> None:
+    try:
+        import zstandard
+    except ImportError as err:
+        raise ValueError("zstd compression needs the zstandard package!") from err
+    compressor = zstandard.ZstdCompressor(
+        level=level, threads=threads or -1, write_checksum=True
+    )
+    compressor.copy_stream(input_fp, output_fp)
+
+
+def get_compressor(method: str) -> Callable:
+    if method == "gzip":
+        return gzip_stream
+    if method == "zstd":
+        return zstd_stream
+    raise ValueError(f"Unknown compression {method}!")
+
+
+def gzip_file(
+    path: str,
+    output_path: str,
+    level: int = 6,
+    threads: int | None = None,
+    chunk_size: int = 1 << 20,
+) -> None:
+    with open(path, "rb") as input_fp, open(output_path, "wb") as output_fp:
+        gzip_stream(input_fp, output_fp, level, threads, chunk_size)
+
+
+def compress_body(
+    request: PreparedRequest, method: str, threads: int | None = None
+) -> None:
+    """Compress the body of a file upload request in place, setting Content-Encoding
+    and Content-Length. Other requests are unchanged.
+
+    Args:
+        request: Prepared request
+        method: Compression method, gzip or zstd
+        threads: Number of threads. Defaults to None (number of CPUs).
+
+    Returns:
+        None
+    """
+    content_type = request.headers.get("Content-Type", "")
+    if not content_type.startswith("multipart/form-data"):
+        return
+    if "Content-Encoding" in request.headers or not isinstance(request.body, bytes):
+        return
+    output_fp = BytesIO()
+    get_compressor(method)(BytesIO(request.body), output_fp, threads=threads)
+    body = output_fp.getvalue()
+    logger.info(
+        f"Compressed upload to {request.url} with {method} from {len(request.body)} to {len(body)} bytes"
+    )
+    request.body = body
+    request.headers["Content-Encoding"] = method
+    request.headers["Content-Length"] = str(len(body))
+
+
+@contextmanager
+def compressed_uploads(
+    session: Session, method: str, threads: int | None = None
+) -> Iterator[None]:
+    """Send file uploads made through a session inside the context with compressed
+    request bodies. The resources and the files uploaded are unchanged, so the hash
+    comparison in Resource still skips unchanged uploads.
+
+    Args:
+        session: Session through which uploads are made
+        method: Compression method, gzip or zstd
+        threads: Number of threads. Defaults to None (number of CPUs).
+
+    Returns:
+        None
+    """
+    get_compressor(method)
+    send = session.send
+
+    def compressed_send(request: PreparedRequest, **kwargs) -> Response:
+        compress_body(request, method, threads)
+        return send(request, **kwargs)
+
+    session.send = compressed_send
+    try:
+        yield
+    finally:
+        session.send = send
@@ -0,0 +1,310 @@
+import gzip
+import json
+import logging
+import pickle
+from collections.abc import Iterator, Sequence
+from hashlib import sha256
+from os import getpid, makedirs, replace
+from os.path import exists, join
+from pathlib import Path
+from shutil import copyfileobj
+from typing import Any
+
+from hdx.pipelineutils.reader import Read
+from hdx.utilities.downloader import DownloadError
+
+logger = logging.getLogger(__name__)
+
+
+class SavedStore:
+    """Content addressed store for downloaded data. Payloads are gzipped into blobs
+    named by the SHA-256 of their content so identical payloads are only stored once
+    across years and runs. An append only index maps each request URL to its blob,
+    the last entry for a URL winning. Parsed forms of blobs can be kept as pickles
+    so that replaying is faster than parsing the text again, at the cost of a second
+    uncompressed copy on disk.
+
+    Args:
+        store_dir: Directory of the store
+        decoded: Whether to keep parsed forms of blobs. Defaults to False.
+    """
+
+    index_filename = "index.jsonl"
+
+    def __init__(self, store_dir: str, decoded: bool = False) -> None:
+        self._blob_dir = join(store_dir, "blobs")
+        self._decoded_dir = join(store_dir, "decoded")
+        self._decoded = decoded
+        makedirs(self._blob_dir, exist_ok=True)
+        if decoded:
+            makedirs(self._decoded_dir, exist_ok=True)
+        self._index_path = join(store_dir, self.index_filename)
+        self._index = {}
+        if exists(self._index_path):
+            with open(self._index_path, encoding="utf-8") as fp:
+                for line in fp:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A partly written final line from a killed run
+                        continue
+                    self._index[entry["url"]] = entry["digest"]
+
+    def _get_blob_path(self, digest: str) -> str:
+        return join(self._blob_dir, digest[:2], f"{digest}.gz")
+
+    def _get_decoded_path(self, digest: str, variant: str = "") -> str:
+        if variant:
+            variant = sha256(variant.encode("utf-8")).hexdigest()[:16]
+            return join(self._decoded_dir, f"{digest}_{variant}.pkl")
+        return join(self._decoded_dir, f"{digest}.pkl")
+
+    @staticmethod
+    def _write(path: str, data: bytes) -> None:
+        # Temporary file is per process as forked workers can write the same blob
+        temp_path = f"{path}.{getpid()}.tmp"
+        with open(temp_path, "wb") as fp:
+            fp.write(data)
+        replace(temp_path, path)
+
+    @property
+    def decoded(self) -> bool:
+        return self._decoded
+
+    def get_digest(self, url: str) -> str | None:
+        return self._index.get(url)
+
+    def put_bytes(self, url: str, data: bytes) -> str:
+        digest = sha256(data).hexdigest()
+        path = self._get_blob_path(digest)
+        if not exists(path):
+            makedirs(join(self._blob_dir, digest[:2]), exist_ok=True)
+            self._write(path, gzip.compress(data, mtime=0))
+        if self._index.get(url) != digest:
+            self._index[url] = digest
+            entry = json.dumps({"url": url, "digest": digest})
+            with open(self._index_path, "a", encoding="utf-8") as fp:
+                fp.write(f"{entry}\n")
+        return digest
+
+    def get_bytes(self, url: str) -> bytes | None:
+        digest = self._index.get(url)
+        if digest is None:
+            return None
+        with gzip.open(self._get_blob_path(digest), "rb") as fp:
+            return fp.read()
+
+    def get_file(self, url: str, path: str) -> str | None:
+        digest = self._index.get(url)
+        if digest is None:
+            return None
+        temp_path = f"{path}.{getpid()}.tmp"
+        with gzip.open(self._get_blob_path(digest), "rb") as input_fp:
+            with open(temp_path, "wb") as output_fp:
+                copyfileobj(input_fp, output_fp)
+        replace(temp_path, path)
+        return path
+
+    def get_decoded(self, url: str, variant: str = "") -> Any:
+        if not self._decoded:
+            return None
+        digest = self._index.get(url)
+        if digest is None:
+            return None
+        path = self._get_decoded_path(digest, variant)
+        if not exists(path):
+            return None
+        with open(path, "rb") as fp:
+            return pickle.load(fp)
+
+    def put_decoded(self, url: str, obj: Any, variant: str = "") -> None:
+        if not self._decoded:
+            return
+        digest = self._index[url]
+        data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        self._write(self._get_decoded_path(digest, variant), data)
+
+    def put_json(self, url: str, obj: Any) -> None:
+        data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.put_bytes(url, data)
+        self.put_decoded(url, obj)
+
+    def get_json(self, url: str) -> Any:
+        obj = self.get_decoded(url)
+        if obj is not None:
+            return obj
+        data = self.get_bytes(url)
+        if data is None:
+            return None
+        obj = json.loads(data)
+        self.put_decoded(url, obj)
+        return obj
+
+
+class StoredRead(Read):
+    """Reader which saves to or loads from a SavedStore instead of writing files
+    to the saved data directory.
+
+    Args:
+        reader: Reader to wrap
+        store: Store for downloaded data
+        save: Whether to save downloaded data in the store
+        use_saved: Whether to use data from the store
+    """
+
+    def __init__(
+        self, reader: Read, store: SavedStore, save: bool, use_saved: bool
+    ) -> None:
+        super().__init__(
+            reader.downloader,
+            fallback_dir=reader.fallback_dir,
+            saved_dir=reader.saved_dir,
+            temp_dir=reader.temp_dir,
+            prefix=reader.prefix,
+            delete=False,
+            today=reader.today,
+        )
+        self._store = store
+        self._store_save = save
+        self._store_use = use_saved
+        # Files decompressed from the store by url
+        self._files = {}
+
+    def _load(self, url: Path | str, logstr: str, load_fn) -> Any:
+        logger.info(f"Using stored {logstr}")
+        obj = load_fn(str(url))
+        if obj is None:
+            raise DownloadError(f"{url} is not in the saved store!")
+        return obj
+
+    def download_json(
+        self,
+        url: Path | str,
+        filename: str | None = None,
+        logstr: str | None = None,
+        fallback: bool = False,
+        log_level: int = None,
+        **kwargs: Any,
+    ) -> Any:
+        if self._store_use:
+            return self._load(url, logstr or url, self._store.get_json)
+        rjson = super().download_json(
+            url,
+            filename=filename,
+            logstr=logstr,
+            fallback=fallback,
+            log_level=log_level,
+            **kwargs,
+        )
+        if self._store_save:
+            self._store.put_json(str(url), rjson)
+        return rjson
+
+    def download_text(
+        self,
+        url: Path | str,
+        filename: str | None = None,
+        logstr: str | None = None,
+        fallback: bool = False,
+        log_level: int = None,
+        **kwargs: Any,
+    ) -> str:
+        if self._store_use:
+            data = self._load(url, logstr or url, self._store.get_bytes)
+            return data.decode("utf-8")
+        text = super().download_text(
+            url,
+            filename=filename,
+            logstr=logstr,
+            fallback=fallback,
+            log_level=log_level,
+            **kwargs,
+        )
+        if self._store_save:
+            self._store.put_bytes(str(url), text.encode("utf-8"))
+        return text
+
+    def download_file(
+        self,
+        url: Path | str,
+        filename: str | None = None,
+        logstr: str | None = None,
+        fallback: bool = False,
+        log_level: int = None,
+        **kwargs: Any,
+    ) -> Path:
+        if self._store_use:
+            # Each file is only decompressed from the store once
+            path = self._files.get(str(url))
+            if path is None:
+                filename, _ = self.get_filename(url, filename, **kwargs)
+                path = self.temp_dir / filename
+                self._load(
+                    url,
+                    logstr or filename,
+                    lambda x: self._store.get_file(x, str(path)),
+                )
+                self._files[str(url)] = path
+            return path
+        path = super().download_file(
+            url,
+            filename=filename,
+            logstr=logstr,
+            fallback=fallback,
+            log_level=log_level,
+            **kwargs,
+        )
+        if self._store_save:
+            with open(path, "rb") as fp:
+                self._store.put_bytes(str(url), fp.read())
+        return path
+
+    def get_tabular_rows(
+        self, url: Path | str | Sequence[str], *args: Any, **kwargs: Any
+    ) -> tuple[list[str], Iterator[list | dict]]:
+        # Arguments are passed through untouched as the parsing arguments differ
+        # between versions of hdx-python-utilities
+        if isinstance(url, list):
+            return super().get_tabular_rows(url, *args, **kwargs)
+        # Parsed rows depend upon the parsing arguments as well as the content
+        variant = repr((args, sorted(kwargs.items())))
+        url = str(url)
+        if self._store_use:
+            decoded = self._store.get_decoded(url, variant)
+            if decoded is not None:
+                logger.info(
+                    f"Using stored parsed rows of {kwargs.get('logstr') or url}"
+                )
+                header, rows = decoded
+                return header, iter(rows)
+        header, iterator = super().get_tabular_rows(url, *args, **kwargs)
+        if not (self._store_save or self._store_use):
+            return header, iterator
+        if not self._store.decoded or self._store.get_digest(url) is None:
+            return header, iterator
+        rows = list(iterator)
+        self._store.put_decoded(url, (header, rows), variant)
+        return header, iter(rows)
+
+
+def setup_saved_store(
+    store_dir: str, save: bool, use_saved: bool, decoded: bool = False
+) -> SavedStore:
+    """Replace the generated readers with ones that save to or load from a
+    content addressed store in store_dir
+
+    Args:
+        store_dir: Directory of the store
+        save: Whether to save downloaded data in the store
+        use_saved: Whether to use data from the store
+        decoded: Whether to keep parsed forms of blobs. Defaults to False.
+
+    Returns:
+        SavedStore object
+    """
+    if save and use_saved:
+        raise ValueError("Either the save or use_saved flags can be set to True!")
+    store = SavedStore(store_dir, decoded)
+    for name, reader in Read.retrievers.items():
+        Read.retrievers[name] = StoredRead(reader, store, save, use_saved)
+    return store
@@ -0,0 +1,192 @@
+import gzip
+import hashlib
+import json
+import logging
+import pickle
+from collections.abc import Callable
+from os import makedirs, replace
+from os.path import exists, join
+from time import monotonic
+from typing import Any
+
+from .checkpoint import Checkpoint
+from .plan import Plan
+
+logger = logging.getLogger(__name__)
+
+
+class Scheduler:
+    """Orders the plans of a year by expected value and cost and defers unchanged
+    plans when a time budget would be exceeded. Plans whose published version differs
+    from that of the previous run (or that have no stored result) are processed
+    first. Within changed and unchanged plans, those expected to take longest are
+    started first. Expected times are a moving average of previous runs' timings,
+    with plans not seen before assumed to take as long as the longest. Plans are
+    processed one at a time, so running large plans alongside small ones is out of
+    scope.
+
+    The transformed rows of each plan are kept in the cache directory with its
+    timing, payload size (number of disaggregated attachments), version and a hash
+    of the settings on which its rows depend, like the p-codes selected. A plan
+    whose version or settings differ is treated as changed. The stored rows are also
+    those read when resuming, so they are not kept again in the checkpoint. When a
+    time budget is given, an unchanged plan that would not finish within it is
+    deferred: its stored rows are used for the global outputs and its country dataset
+    is not republished.
+
+    Args:
+        cache_dir: Directory holding previous runs' timings and rows
+        year: Year being processed
+        plan: Plan object
+        time_budget: Seconds in which to process plans. Defaults to None (no limit).
+        clock: Function returning the current time in seconds. Defaults to monotonic.
+    """
+
+    smoothing = 0.5
+
+    def __init__(
+        self,
+        cache_dir: str,
+        year: int,
+        plan: Plan,
+        time_budget: float | None = None,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        self._folder = join(cache_dir, "schedule", str(year))
+        self._history_path = join(self._folder, "history.json")
+        self._plan = plan
+        self._time_budget = time_budget
+        self._clock = clock
+        self._start = clock()
+        if exists(self._history_path):
+            with open(self._history_path, encoding="utf-8") as fp:
+                self._history = json.load(fp)
+        else:
+            self._history = {}
+        settings = json.dumps(plan.get_settings(), sort_keys=True)
+        self._settings_hash = hashlib.sha256(settings.encode("utf-8")).hexdigest()
+        self._deferred = []
+        makedirs(self._folder, exist_ok=True)
+
+    def _get_path(self, key: str) -> str:
+        return join(self._folder, f"{key}_transformed.pkl.gz")
+
+    def _get_version(self, plan_id: str | int) -> list | None:
+        version = self._plan.get_plan_version(plan_id)
+        if version is None or version[0] is None:
+            return None
+        return list(version)
+
+    def is_changed(self, countryiso3: str, plan_id: str | int) -> bool:
+        key = Checkpoint.get_key(countryiso3, plan_id)
+        entry = self._history.get(key)
+        if entry is None or entry.get("version") is None:
+            return True
+        if entry["version"] != self._get_version(plan_id):
+            return True
+        if entry.get("settings") != self._settings_hash:
+            return True
+        return not exists(self._get_path(key))
+
+    def get_expected_time(self, countryiso3: str, plan_id: str | int) -> float | None:
+        entry = self._history.get(Checkpoint.get_key(countryiso3, plan_id))
+        if entry is None:
+            return None
+        return entry.get("seconds")
+
+    def order(self, plan_ids_countries: list[dict]) -> list[dict]:
+        """Order plans with changed plans first and then by expected time descending
+
+        Args:
+            plan_ids_countries: List of plans of form {"iso3": ..., "id": ...}
+
+        Returns:
+            Ordered list of plans
+        """
+        known_times = [
+            entry["seconds"] for entry in self._history.values() if "seconds" in entry
+        ]
+        longest = max(known_times, default=0)
+
+        def sort_key(plan_id_country: dict) -> tuple:
+            countryiso3 = plan_id_country["iso3"]
+            plan_id = plan_id_country["id"]
+            changed = self.is_changed(countryiso3, plan_id)
+            expected_time = self.get_expected_time(countryiso3, plan_id)
+            if expected_time is None:
+                expected_time = longest
+            entry = self._history.get(Checkpoint.get_key(countryiso3, plan_id), {})
+            size = entry.get("size", 0)
+            return not changed, -expected_time, -size, countryiso3
+
+        ordered = sorted(plan_ids_countries, key=sort_key)
+        no_changed = sum(
+            1
+            for plan_id_country in ordered
+            if self.is_changed(plan_id_country["iso3"], plan_id_country["id"])
+        )
+        logger.info(
+            f"Scheduled {no_changed} changed plans then {len(ordered) - no_changed} unchanged plans"
+        )
+        return ordered
+
+    def start(self) -> None:
+        self._start = self._clock()
+
+    def should_defer(self, countryiso3: str, plan_id: str | int) -> bool:
+        if self._time_budget is None or self.is_changed(countryiso3, plan_id):
+            return False
+        expected_time = self.get_expected_time(countryiso3, plan_id) or 0
+        elapsed = self._clock() - self._start
+        if elapsed + expected_time <= self._time_budget:
+            return False
+        self._deferred.append(countryiso3)
+        return True
+
+    def has_rows(self, countryiso3: str, plan_id: str | int) -> bool:
+        key = Checkpoint.get_key(countryiso3, plan_id)
+        entry = self._history.get(key, {})
+        if entry.get("settings") != self._settings_hash:
+            return False
+        return exists(self._get_path(key))
+
+    def load(self, countryiso3: str, plan_id: str | int) -> Any:
+        with gzip.open(
+            self._get_path(Checkpoint.get_key(countryiso3, plan_id)), "rb"
+        ) as fp:
+            return pickle.load(fp)
+
+    def save(
+        self, countryiso3: str, plan_id: str | int, data: Any, plan_json: dict
+    ) -> None:
+        key = Checkpoint.get_key(countryiso3, plan_id)
+        path = self._get_path(key)
+        with gzip.open(f"{path}.tmp", "wb", compresslevel=1) as fp:
+            pickle.dump(data, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        replace(f"{path}.tmp", path)
+        entry = self._history.setdefault(key, {})
+        entry["version"] = self._get_version(plan_id)
+        entry["settings"] = self._settings_hash
+        entry["size"] = sum(
+            len(caseload.get("disaggregatedAttachments") or ())
+            for caseload in plan_json["data"].get("caseloads") or ()
+        )
+
+    def record_time(self, countryiso3: str, plan_id: str | int, seconds: float) -> None:
+        entry = self._history.setdefault(Checkpoint.get_key(countryiso3, plan_id), {})
+        previous = entry.get("seconds")
+        if previous is not None:
+            seconds = self.smoothing * seconds + (1 - self.smoothing) * previous
+        entry["seconds"] = round(seconds, 3)
+
+    def get_deferred(self) -> list[str]:
+        return self._deferred
+
+    def commit(self) -> None:
+        if self._deferred:
+            logger.warning(
+                f"Deferred unchanged plans of {', '.join(self._deferred)} to keep within time budget"
+            )
+        with open(f"{self._history_path}.tmp", "w", encoding="utf-8") as fp:
+            json.dump(self._history, fp, indent=2, sort_keys=True)
+        replace(f"{self._history_path}.tmp", self._history_path)
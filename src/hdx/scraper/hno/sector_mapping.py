@@ -0,0 +1,256 @@
+import csv
+import hashlib
+import json
+import logging
+from collections.abc import Iterable
+from os import replace
+from os.path import exists, join
+from threading import Thread
+
+from hdx.pipelineutils.reader import Read
+from hdx.pipelineutils.sector import Sector
+from hdx.utilities.loader import load_yaml
+from hdx.utilities.matching import get_code_from_name
+from hdx.utilities.path import script_dir_plus_file
+from hdx.utilities.text import normalise
+
+logger = logging.getLogger(__name__)
+
+hpc_clusters_filename = (
+    "HPC Tools Disagg data and Gc Mapping(Global Cluster Mapping RPM-HDX).csv"
+)
+# Intersectoral caseloads have the cluster ALL which is not a global cluster
+extra_clusters = ("ALL",)
+
+
+def get_config_path(filename: str) -> str:
+    return script_dir_plus_file(join("config", filename), get_config_path)
+
+
+class SectorMapping:
+    """Sector mapping compiled from the HPC global clusters in the config folder and
+    the HDX coordination groups configured for Sector. HPC cluster codes are looked up
+    in a table of the codes Sector would give them. Other names are matched against
+    the coordination groups lookup in the same way as Sector, so nothing is
+    downloaded.
+
+    Args:
+        mapping: Sector mapping from build_sector_mapping
+    """
+
+    format_version = 1
+
+    def __init__(self, mapping: dict) -> None:
+        self.source = mapping["source"]
+        self._clusters = mapping["clusters"]
+        self._code_lookup = mapping["code_lookup"]
+        self._code_to_name = mapping["code_to_name"]
+        self._unmatched = []
+
+    @classmethod
+    def from_file(cls, path: str) -> "SectorMapping":
+        with open(path, encoding="utf-8") as fp:
+            mapping = json.load(fp)
+        if mapping.get("format_version") != cls.format_version:
+            raise ValueError(
+                f"Sector mapping {path} has format version {mapping.get('format_version')} not {cls.format_version}!"
+            )
+        return cls(mapping)
+
+    def get_code(self, cluster: str) -> str | None:
+        if cluster in self._clusters:
+            return self._clusters[cluster]
+        return get_code_from_name(
+            name=cluster,
+            code_lookup=self._code_lookup,
+            unmatched=self._unmatched,
+        )
+
+    def get_name(self, code: str, default: str | None = None) -> str | None:
+        return self._code_to_name.get(code, default)
+
+    def get_code_to_name(self) -> dict[str, str]:
+        return self._code_to_name
+
+
+def get_sector_configuration() -> dict:
+    return load_yaml(script_dir_plus_file("sector_configuration.yaml", Sector))
+
+
+def get_coordination_groups_info() -> dict:
+    return get_sector_configuration()["datasetinfo"]
+
+
+def read_hpc_clusters(path: str) -> tuple[list[str], str]:
+    with open(path, "rb") as fp:
+        data = fp.read()
+    reader = csv.DictReader(data.decode("utf-8-sig").splitlines())
+    clusters = [row["HPC Global Cluster Code"] for row in reader]
+    return clusters, hashlib.sha256(data).hexdigest()
+
+
+def build_code_lookup(
+    configuration: dict, rows: Iterable[dict]
+) -> tuple[dict[str, str], dict[str, str]]:
+    """Build the lookup of names to codes and codes to names from the coordination
+    groups rows in the same way as Sector
+
+    Args:
+        configuration: Sector configuration
+        rows: Coordination groups rows
+
+    Returns:
+        Tuple of (names to codes, codes to names)
+    """
+    code_lookup = dict(configuration.get("initial_lookup", {}))
+    code_to_name = {}
+
+    def add(code: str, name: str) -> None:
+        code_lookup[name] = code
+        code_lookup[code] = code
+        code_lookup[normalise(name)] = code
+        code_lookup[normalise(code)] = code
+        code_to_name[code] = name
+
+    code_key = configuration["code_key"]
+    name_key = configuration["name_key"]
+    for row in rows:
+        add(row[code_key], row[name_key])
+    for code, name in configuration.get("extra_entries", {}).items():
+        add(code, name)
+    return code_lookup, code_to_name
+
+
+def build_sector_mapping() -> dict:
+    """Build the sector mapping from the HPC global clusters in the config folder and
+    the HDX coordination groups read with the current reader
+
+    Returns:
+        Sector mapping
+    """
+    configuration = get_sector_configuration()
+    datasetinfo = configuration["datasetinfo"]
+    reader = Read.get_reader()
+    resource = reader.read_hdx_metadata(datasetinfo)
+    _, rows = reader.read(datasetinfo, file_prefix=configuration["file_prefix"])
+    code_lookup, code_to_name = build_code_lookup(configuration, rows)
+    clusters, hpc_clusters_hash = read_hpc_clusters(
+        get_config_path(hpc_clusters_filename)
+    )
+    # Matching adds names to the lookup so a copy is used
+    matching_lookup = dict(code_lookup)
+    unmatched = []
+    mapping = {
+        "format_version": SectorMapping.format_version,
+        "source": {
+            "dataset": datasetinfo["dataset"],
+            "resource": datasetinfo["resource"],
+            "last_modified": resource["last_modified"],
+            "hpc_clusters_sha256": hpc_clusters_hash,
+        },
+        "clusters": {
+            cluster: get_code_from_name(
+                name=cluster, code_lookup=matching_lookup, unmatched=unmatched
+            )
+            for cluster in sorted((*clusters, *extra_clusters))
+        },
+        "code_lookup": code_lookup,
+        "code_to_name": code_to_name,
+    }
+    unmapped = [cluster for cluster, code in mapping["clusters"].items() if not code]
+    if unmapped:
+        logger.warning(f"Clusters without sectors: {', '.join(unmapped)}")
+    return mapping
+
+
+def compile_sector_mapping(path: str) -> dict:
+    """Build the sector mapping and write it to a file, which can be committed as
+    sector_mapping.json in config
+
+    Args:
+        path: Path to write mapping
+
+    Returns:
+        Sector mapping
+    """
+    mapping = build_sector_mapping()
+    with open(f"{path}.tmp", "w", encoding="utf-8") as fp:
+        json.dump(mapping, fp, ensure_ascii=False, indent=1, sort_keys=True)
+        fp.write("\n")
+    replace(f"{path}.tmp", path)
+    logger.info(
+        f"Compiled sector mapping of {len(mapping['clusters'])} clusters from coordination groups of {mapping['source']['last_modified']} to {path}"
+    )
+    return mapping
+
+
+def load_sector_mapping(path: str | None = None) -> SectorMapping:
+    """Load the precompiled sector mapping
+
+    Args:
+        path: Path of precompiled mapping. Defaults to None (sector_mapping.json in config).
+
+    Returns:
+        SectorMapping
+    """
+    if path is None:
+        path = get_config_path("sector_mapping.json")
+    return SectorMapping.from_file(path)
+
+
+def check_sector_mapping(path: str | None = None) -> bool:
+    """Check whether the coordination groups on HDX or the HPC global clusters in the
+    config folder have changed since the sector mapping was compiled
+
+    Args:
+        path: Path of precompiled mapping. Defaults to None (sector_mapping.json in config).
+
+    Returns:
+        True if the sector mapping is up to date
+    """
+    if path is None:
+        path = get_config_path("sector_mapping.json")
+    if not exists(path):
+        logger.warning(
+            f"No precompiled sector mapping in {path}. Compile it with --refresh-sector-mapping"
+        )
+        return False
+    source = SectorMapping.from_file(path).source
+    _, hpc_clusters_hash = read_hpc_clusters(get_config_path(hpc_clusters_filename))
+    resource = Read.get_reader().read_hdx_metadata(get_coordination_groups_info())
+    stale = []
+    if hpc_clusters_hash != source["hpc_clusters_sha256"]:
+        stale.append("HPC global clusters have changed")
+    if resource["last_modified"] != source["last_modified"]:
+        stale.append(
+            f"coordination groups were updated {resource['last_modified']} not {source['last_modified']}"
+        )
+    if stale:
+        logger.warning(
+            f"Sector mapping is out of date ({', '.join(stale)}). Refresh it with --refresh-sector-mapping"
+        )
+        return False
+    logger.info("Sector mapping is up to date")
+    return True
+
+
+def start_sector_mapping_check(path: str | None = None) -> Thread:
+    """Check the sector mapping is up to date in a background thread so that startup
+    does not wait for HDX
+
+    Args:
+        path: Path of precompiled mapping. Defaults to None (sector_mapping.json in config).
+
+    Returns:
+        Thread running check
+    """
+
+    def check() -> None:
+        try:
+            check_sector_mapping(path)
+        except Exception:
+            logger.exception("Could not check sector mapping!")
+
+    thread = Thread(target=check, name="sector-mapping-check", daemon=True)
+    thread.start()
+    return thread
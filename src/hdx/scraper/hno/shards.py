@@ -0,0 +1,175 @@
+import gzip
+import json
+import logging
+import pickle
+from collections.abc import Iterator
+from hashlib import md5
+from heapq import merge
+from os import makedirs, remove, replace
+from os.path import exists, join
+
+from hdx.scraper.hno.hapi_output import HAPIOutput
+from hdx.scraper.hno.plan import Plan
+
+logger = logging.getLogger(__name__)
+
+
+def parse_shard(shard: str) -> tuple[int, int]:
+    """Parse a shard string of form i/n where i is 1 based
+
+    Args:
+        shard: Shard string eg. 2/8
+
+    Returns:
+        Tuple of (shard index starting at 0, number of shards)
+    """
+    try:
+        index, count = (int(x) for x in shard.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard {shard} must be of form index/count eg. 1/4!")
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Shard {shard} is out of range!")
+    return index - 1, count
+
+
+def get_shard_index(countryiso3: str, shard_count: int) -> int:
+    # Not hash() which is salted per process so workers would disagree. Keyed on
+    # the country rather than position so that the assignment does not shift if
+    # the plan list changes between workers starting.
+    digest = md5(countryiso3.encode("utf-8"), usedforsecurity=False).digest()
+    return int.from_bytes(digest[:8], "big") % shard_count
+
+
+def select_plans(
+    plan_ids_countries: list[dict], shard_index: int, shard_count: int
+) -> list[dict]:
+    return [
+        plan_id_country
+        for plan_id_country in plan_ids_countries
+        if get_shard_index(plan_id_country["iso3"], shard_count) == shard_index
+    ]
+
+
+class Shards:
+    """Read and write the intermediate files of a sharded run. Each worker writes
+    its global HNO and HAPI rows sorted by key along with a metadata file which is
+    written last and so marks the shard as complete. The metadata records the batch
+    and number of shards so that the merge step only combines shards from the same
+    run.
+
+    Args:
+        shard_dir: Directory shared by the workers and the merge step
+        year: Year being processed
+        shard_count: Number of shards
+        batch: Id shared by the workers and the merge step of a run
+    """
+
+    def __init__(self, shard_dir: str, year: int, shard_count: int, batch: str) -> None:
+        self._shard_dir = shard_dir
+        self._year = year
+        self._shard_count = shard_count
+        self._batch = batch
+
+    def _get_path(self, shard_index: int, suffix: str) -> str:
+        return join(
+            self._shard_dir,
+            f"hno_{self._year}_shard_{shard_index + 1}_of_{self._shard_count}_{suffix}",
+        )
+
+    @staticmethod
+    def _write_rows(path: str, rows: dict) -> None:
+        temp_path = f"{path}.tmp"
+        with gzip.open(temp_path, "wb", compresslevel=1) as fp:
+            for key in sorted(rows):
+                pickle.dump((key, rows[key]), fp, protocol=pickle.HIGHEST_PROTOCOL)
+        replace(temp_path, path)
+
+    @staticmethod
+    def _read_rows(path: str) -> Iterator[tuple]:
+        with gzip.open(path, "rb") as fp:
+            while True:
+                try:
+                    yield pickle.load(fp)
+                except EOFError:
+                    return
+
+    def write(
+        self,
+        shard_index: int,
+        plan: Plan,
+        hapi_output: HAPIOutput,
+        countries_with_data: list[str],
+    ) -> None:
+        makedirs(self._shard_dir, exist_ok=True)
+        path = self._get_path(shard_index, "metadata.json")
+        # The shard is incomplete until its new metadata is written
+        if exists(path):
+            remove(path)
+        self._write_rows(
+            self._get_path(shard_index, "hno.pkl.gz"), plan.get_global_rows()
+        )
+        self._write_rows(
+            self._get_path(shard_index, "hapi.pkl.gz"), hapi_output.get_global_rows()
+        )
+        negative_values, rounded_values = hapi_output.get_negative_rounded_values()
+        metadata = {
+            "batch": self._batch,
+            "shard_count": self._shard_count,
+            "countries_with_data": countries_with_data,
+            "highest_admin": plan.get_highest_admins(),
+            "negative_values": negative_values,
+            "rounded_values": rounded_values,
+        }
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as fp:
+            json.dump(metadata, fp)
+        replace(temp_path, path)
+        logger.info(f"Wrote shard {shard_index + 1} of {self._shard_count}")
+
+    def merge(self, plan: Plan, hapi_output: HAPIOutput) -> list[str]:
+        missing = [
+            str(i + 1)
+            for i in range(self._shard_count)
+            if not exists(self._get_path(i, "metadata.json"))
+        ]
+        if missing:
+            raise ValueError(f"Shard(s) {', '.join(missing)} are not complete!")
+        shard_metadata = []
+        mismatched = []
+        for i in range(self._shard_count):
+            with open(self._get_path(i, "metadata.json"), encoding="utf-8") as fp:
+                metadata = json.load(fp)
+            batch = metadata.get("batch")
+            shard_count = metadata.get("shard_count")
+            if batch != self._batch or shard_count != self._shard_count:
+                mismatched.append(f"{i + 1} (batch {batch} with {shard_count} shards)")
+            shard_metadata.append(metadata)
+        if mismatched:
+            raise ValueError(
+                f"Shard(s) {', '.join(mismatched)} are not from batch {self._batch} with {self._shard_count} shards!"
+            )
+        countries_with_data = []
+        highest_admin = {}
+        negative_values = {}
+        rounded_values = {}
+        for metadata in shard_metadata:
+            countries_with_data.extend(metadata["countries_with_data"])
+            highest_admin.update(metadata["highest_admin"])
+            negative_values.update(metadata["negative_values"])
+            rounded_values.update(metadata["rounded_values"])
+
+        def merged_rows(suffix: str) -> Iterator[tuple]:
+            return merge(
+                *(
+                    self._read_rows(self._get_path(i, suffix))
+                    for i in range(self._shard_count)
+                ),
+                key=lambda x: x[0],
+            )
+
+        plan.load_global_rows(merged_rows("hno.pkl.gz"), highest_admin)
+        hapi_output.load_global_rows(
+            merged_rows("hapi.pkl.gz"), negative_values, rounded_values
+        )
+        logger.info(f"Merged {self._shard_count} shards")
+        return sorted(countries_with_data)
@@ -0,0 +1,250 @@
+import logging
+from threading import Lock
+
+from hdx.utilities.downloader import Download
+from requests import PreparedRequest, Response, Session
+from requests.adapters import HTTPAdapter
+from urllib3 import PoolManager
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.util.request import ACCEPT_ENCODING
+
+logger = logging.getLogger(__name__)
+
+
+class HostPoolManager(PoolManager):
+    """PoolManager with a maximum number of connections kept alive for each host and
+    which keeps counts of the connections made and requests sent by pools that are
+    closed or evicted.
+
+    Args:
+        num_pools: Number of pools to keep
+        maxsize: Default connections kept alive for each host
+        host_maxsize: Connections kept alive by host
+    """
+
+    def __init__(self, num_pools: int, maxsize: int, host_maxsize: dict) -> None:
+        super().__init__(num_pools=num_pools, maxsize=maxsize)
+        self._host_maxsize = host_maxsize
+        self._lock = Lock()
+        self.closed_connections = 0
+        self.closed_requests = 0
+        self.pools.dispose_func = self._dispose
+
+    def _new_pool(
+        self,
+        scheme: str,
+        host: str,
+        port: int,
+        request_context: dict | None = None,
+    ) -> HTTPConnectionPool:
+        if request_context is None:
+            request_context = self.connection_pool_kw.copy()
+        maxsize = self._host_maxsize.get(host)
+        if maxsize:
+            request_context["maxsize"] = maxsize
+        return super()._new_pool(scheme, host, port, request_context)
+
+    def _dispose(self, pool: HTTPConnectionPool) -> None:
+        with self._lock:
+            self.closed_connections += pool.num_connections
+            self.closed_requests += pool.num_requests
+        pool.close()
+
+    def get_counts(self) -> tuple[int, int]:
+        connections = self.closed_connections
+        requests = self.closed_requests
+        for key in self.pools.keys():
+            pool = self.pools.get(key)
+            if pool is None:
+                continue
+            connections += pool.num_connections
+            requests += pool.num_requests
+        return connections, requests
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter using the connection pools of a PooledTransport. Retries are
+    still configured for each adapter. Pool sizes are kept for reference but the
+    shared pools are sized by the PooledTransport.
+
+    Args:
+        transport: PooledTransport
+        max_retries: Retries of requests. Defaults to 0.
+        pool_connections: Pool connections of replaced adapter. Defaults to 10.
+        pool_maxsize: Pool maximum size of replaced adapter. Defaults to 10.
+    """
+
+    def __init__(
+        self,
+        transport: "PooledTransport",
+        max_retries=0,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+    ) -> None:
+        self._transport = transport
+        super().__init__(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=max_retries,
+        )
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        self.poolmanager = self._transport.poolmanager
+
+    def build_response(self, req: PreparedRequest, resp) -> Response:
+        response = super().build_response(req, resp)
+        self._transport.count_response(response)
+        return response
+
+
+class PooledTransport:
+    """Connection pools shared by the sessions of all downloaders and the HDX API
+    client so that connections are kept alive and reused across them. Responses are
+    requested compressed with every encoding urllib3 can decode, and the bytes
+    received for compressed responses are compared with their decoded size.
+
+    Args:
+        maxsize: Default connections kept alive for each host. Defaults to 10.
+        hosts: Connections kept alive by host. Defaults to None.
+        num_pools: Number of hosts for which to keep pools. Defaults to 50.
+        http2: Whether to use HTTP/2, which needs the h2 package. Defaults to False.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 10,
+        hosts: dict | None = None,
+        num_pools: int = 50,
+        http2: bool = False,
+    ) -> None:
+        if http2:
+            try:
+                from urllib3.http2 import inject_into_urllib3
+
+                inject_into_urllib3()
+            except ImportError as err:
+                raise ValueError("HTTP/2 needs the h2 package!") from err
+        self.poolmanager = HostPoolManager(num_pools, maxsize, dict(hosts or {}))
+        self._lock = Lock()
+        self._compressed_responses = 0
+        self._received_bytes = 0
+        self._decoded_bytes = 0
+
+    def mount(self, session: Session) -> bool:
+        """Replace the HTTP and HTTPS adapters of a session with ones using the shared
+        pools, keeping their retries and settings. Sessions with adapters whose
+        settings the shared pools cannot honour (adapters of other classes or that
+        block when pools are full) are left as they are.
+
+        Args:
+            session: Session to mount on
+
+        Returns:
+            Whether the shared pools were mounted
+        """
+        adapters = {}
+        for prefix in ("http://", "https://"):
+            adapter = session.adapters.get(prefix)
+            if adapter is None:
+                continue
+            if type(adapter) not in (HTTPAdapter, PooledAdapter):
+                logger.warning(
+                    f"Not sharing connection pools with session using {type(adapter).__name__} for {prefix}"
+                )
+                return False
+            if adapter._pool_block:
+                logger.warning(
+                    f"Not sharing connection pools with session whose {prefix} adapter blocks"
+                )
+                return False
+            adapters[prefix] = adapter
+        for prefix in ("http://", "https://"):
+            adapter = adapters.get(prefix)
+            if adapter is None:
+                new_adapter = PooledAdapter(self)
+            else:
+                new_adapter = PooledAdapter(
+                    self,
+                    adapter.max_retries,
+                    adapter._pool_connections,
+                    adapter._pool_maxsize,
+                )
+                new_adapter.config.update(adapter.config)
+                adapter.close()
+            session.mount(prefix, new_adapter)
+        session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+        return True
+
+    def count_response(self, response: Response) -> None:
+        if not response.headers.get("Content-Encoding"):
+            return
+        raw = response.raw
+        raw_stream = getattr(raw, "stream", None)
+        if raw_stream is None:
+            return
+
+        def counted_stream(*args, **kwargs):
+            decoded_bytes = 0
+            try:
+                for chunk in raw_stream(*args, **kwargs):
+                    decoded_bytes += len(chunk)
+                    yield chunk
+            finally:
+                with self._lock:
+                    self._compressed_responses += 1
+                    self._received_bytes += raw.tell()
+                    self._decoded_bytes += decoded_bytes
+
+        raw.stream = counted_stream
+
+    def get_summary(self) -> dict:
+        connections, requests = self.poolmanager.get_counts()
+        return {
+            "requests": requests,
+            "connections": connections,
+            "compressed_responses": self._compressed_responses,
+            "received_bytes": self._received_bytes,
+            "decoded_bytes": self._decoded_bytes,
+        }
+
+    def log_summary(self) -> None:
+        summary = self.get_summary()
+        requests = summary["requests"]
+        connections = summary["connections"]
+        if requests:
+            reused = (requests - connections) / requests
+            logger.info(
+                f"HTTP pools: {requests} requests over {connections} connections, {reused:.0%} reused"
+            )
+        if summary["compressed_responses"]:
+            received = summary["received_bytes"]
+            decoded = summary["decoded_bytes"]
+            logger.info(
+                f"HTTP compression: {summary['compressed_responses']} compressed responses received in {received} bytes for {decoded} bytes, saving {decoded - received} bytes"
+            )
+
+    def finish(self) -> None:
+        self.log_summary()
+
+
+def setup_transport(
+    configuration: dict | None, remoteckan_session: Session
+) -> PooledTransport:
+    """Set up connection pools shared by the downloaders used by readers and the HDX
+    API client from a dictionary of form {"maxsize": 10, "hosts": {"host": 4, ...},
+    "http2": False}
+
+    Args:
+        configuration: Connection pool parameters. Defaults to None.
+        remoteckan_session: Session of HDX API client
+
+    Returns:
+        PooledTransport
+    """
+    transport = PooledTransport(**(configuration or {}))
+    sessions = {id(remoteckan_session): remoteckan_session}
+    for downloader in Download.downloaders.values():
+        sessions[id(downloader.session)] = downloader.session
+    for session in sessions.values():
+        transport.mount(session)
+    return transport
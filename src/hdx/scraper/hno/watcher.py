@@ -0,0 +1,184 @@
+import logging
+from collections.abc import Callable
+from threading import Event
+from time import monotonic
+
+from hdx.scraper.hno.hapi_output import HAPIOutput
+from hdx.scraper.hno.plan import Plan
+from hdx.scraper.hno.progress_json import ProgressJSON
+
+logger = logging.getLogger(__name__)
+
+
+class Watcher:
+    """Long running watcher that polls HPC for plans with new published versions,
+    reprocesses only the countries that changed and rebuilds the global outputs
+    once changes have stopped arriving for the debounce period. The plan progress
+    endpoint is checked on every poll and the published version of a plan is only
+    downloaded if its progress entry changed or if the recheck interval has passed.
+    A country that fails to process is left out until a later poll processes it, and
+    a failed rebuild of the global outputs is retried after the debounce period.
+
+    Args:
+        plan: Plan object which holds the global rows between polls
+        hapi_output: HAPIOutput object which holds the HAPI rows between polls
+        process_country: Function taking country, plan id and plan JSON which returns whether there was data
+        publish_global: Function taking countries with data which publishes the global datasets
+        year: Year being processed
+        saved_dir: Directory to save or load downloaded data
+        poll_interval: Seconds between polls. Defaults to 300.
+        debounce: Seconds without changes before the global datasets are rebuilt. Defaults to 600.
+        recheck_interval: Seconds between checks of every plan's published version. Defaults to 86400.
+        clock: Function returning the current time in seconds. Defaults to monotonic.
+    """
+
+    def __init__(
+        self,
+        plan: Plan,
+        hapi_output: HAPIOutput,
+        process_country: Callable[[str, str, dict], bool],
+        publish_global: Callable[[list[str]], None],
+        year: int,
+        saved_dir: str,
+        poll_interval: float = 300,
+        debounce: float = 600,
+        recheck_interval: float = 86400,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        self._plan = plan
+        self._hapi_output = hapi_output
+        self._process_country = process_country
+        self._publish_global = publish_global
+        self._year = year
+        self._saved_dir = saved_dir
+        self._poll_interval = poll_interval
+        self._debounce = debounce
+        self._recheck_interval = recheck_interval
+        self._clock = clock
+        self._progress_versions = {}
+        self._published_versions = {}
+        self._countries_with_data = set()
+        self._last_recheck = None
+        self._last_change = None
+        self._stop = Event()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def get_countries_with_data(self) -> list[str]:
+        return sorted(self._countries_with_data)
+
+    def poll(self) -> list[str]:
+        progress_json = ProgressJSON(self._year, self._saved_dir)
+        plan_ids_countries = self._plan.get_plan_ids_and_countries(progress_json)
+        now = self._clock()
+        recheck = (
+            self._last_recheck is None
+            or now - self._last_recheck >= self._recheck_interval
+        )
+        if recheck:
+            self._last_recheck = now
+
+        plans_by_country = {}
+        for plan_id_country in plan_ids_countries:
+            plan_ids = plans_by_country.setdefault(plan_id_country["iso3"], [])
+            plan_ids.append(plan_id_country["id"])
+        plan_jsons = {}
+        changed = set()
+        for countryiso3, plan_ids in plans_by_country.items():
+            for plan_id in plan_ids:
+                version = self._plan.get_plan_version(plan_id)
+                if not recheck and version == self._progress_versions.get(plan_id):
+                    continue
+                json = self._plan.download(plan_id)
+                if json is None:
+                    # Leave the versions untouched so that it is retried next poll
+                    continue
+                plan_jsons[plan_id] = json
+                self._progress_versions[plan_id] = version
+                published_version = json["data"]["lastPublishedVersion"]
+                if published_version == self._published_versions.get(plan_id):
+                    continue
+                logger.info(
+                    f"{countryiso3} plan {plan_id} has published version {published_version}"
+                )
+                self._published_versions[plan_id] = published_version
+                changed.add(countryiso3)
+        removed = self._countries_with_data - set(plans_by_country)
+        for countryiso3 in removed:
+            logger.info(f"{countryiso3} no longer has a plan")
+            self._remove_country(countryiso3)
+
+        for countryiso3 in sorted(changed):
+            # All of a country's plans are reprocessed as its rows are replaced
+            self._remove_country(countryiso3)
+            plan_ids = plans_by_country[countryiso3]
+            try:
+                for plan_id in plan_ids:
+                    json = plan_jsons.get(plan_id)
+                    if json is None:
+                        json = self._plan.download(plan_id)
+                        if json is None:
+                            continue
+                    if self._process_country(countryiso3, plan_id, json):
+                        self._countries_with_data.add(countryiso3)
+            except Exception:
+                logger.exception(f"Could not process {countryiso3}!")
+                # Partly processed rows are dropped and the versions forgotten so
+                # that the country is processed again next poll
+                self._remove_country(countryiso3)
+                for plan_id in plan_ids:
+                    self._progress_versions.pop(plan_id, None)
+                    self._published_versions.pop(plan_id, None)
+        changed.update(removed)
+        if changed:
+            self._last_change = self._clock()
+        return sorted(changed)
+
+    def _remove_country(self, countryiso3: str) -> None:
+        self._plan.remove_country(countryiso3)
+        self._hapi_output.remove_country(countryiso3)
+        self._countries_with_data.discard(countryiso3)
+
+    def get_seconds_until_global(self) -> float | None:
+        if self._last_change is None:
+            return None
+        return max(self._last_change + self._debounce - self._clock(), 0)
+
+    def publish_global_if_due(self) -> bool:
+        seconds = self.get_seconds_until_global()
+        if seconds is None or seconds > 0:
+            return False
+        logger.info("Rebuilding global datasets")
+        try:
+            self._publish_global(self.get_countries_with_data())
+        except Exception:
+            logger.exception("Could not rebuild global datasets!")
+            # Retried once the debounce period has passed again
+            self._last_change = self._clock()
+            return False
+        self._last_change = None
+        return True
+
+    def run(self, max_polls: int | None = None) -> None:
+        polls = 0
+        next_poll = self._clock()
+        while not self._stop.is_set():
+            if self._clock() >= next_poll:
+                try:
+                    changed = self.poll()
+                except Exception:
+                    logger.exception("Could not poll HPC!")
+                    changed = None
+                if changed:
+                    logger.info(f"Changed countries: {', '.join(changed)}")
+                polls += 1
+                next_poll = self._clock() + self._poll_interval
+            self.publish_global_if_due()
+            if max_polls and polls >= max_polls and self._last_change is None:
+                break
+            wait = next_poll - self._clock()
+            seconds = self.get_seconds_until_global()
+            if seconds is not None:
+                wait = min(wait, seconds)
+            self._stop.wait(max(wait, 0))
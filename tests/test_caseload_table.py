@@ -0,0 +1,104 @@
+import gzip
+import json
+from copy import deepcopy
+from os.path import join
+
+import pytest
+from hdx.api.utilities.hdx_error_handler import HDXErrorHandler
+from hdx.utilities.loader import load_json
+from hdx.utilities.path import temp_dir
+
+from hdx.scraper.hno.monitor_json import MonitorJSON
+from hdx.scraper.hno.plan import Plan
+
+
+class TestCaseloadTable:
+    @pytest.fixture(scope="class")
+    @staticmethod
+    def input_dir():
+        return join("tests", "fixtures", "input")
+
+    @pytest.fixture(scope="class")
+    @staticmethod
+    def plan_jsons(input_dir):
+        plan_jsons = {}
+        for countryiso3, plan_id in (("AFG", "1185"), ("SDN", "1188")):
+            plan_jsons[countryiso3] = load_json(
+                join(
+                    input_dir,
+                    f"{plan_id}-responsemonitoring-includecaseloaddisaggregation-true-includeindicatordisaggregation-false-disaggregationonlytotal-false.json",
+                )
+            )
+        return plan_jsons
+
+    def process(self, configuration, plan_jsons, engine, pcodes=None):
+        with temp_dir(f"TestHNOCaseloadTable{engine}") as tempdir:
+            with HDXErrorHandler(write_to_hdx=False) as error_handler:
+                plan = Plan(
+                    configuration, 2024, error_handler, None, pcodes, None, engine
+                )
+                outputs = {}
+                for countryiso3, plan_json in plan_jsons.items():
+                    monitor_json = MonitorJSON(tempdir, True, True)
+                    _, rows = plan.process(
+                        countryiso3, countryiso3, monitor_json, plan_json
+                    )
+                    path = join(
+                        tempdir,
+                        f"test_{countryiso3}-responsemonitoring-includecaseloaddisaggregation-true-includeindicatordisaggregation-false-disaggregationonlytotal-false.json.gz",
+                    )
+                    with gzip.open(path, "rt") as fp:
+                        outputs[countryiso3] = json.load(fp)
+                    # Order of rows and of their columns must also match
+                    rows = [(key, list(row.items())) for key, row in rows.items()]
+                    outputs[f"{countryiso3} rows"] = rows
+                outputs["global"] = [
+                    (key, list(row.items()))
+                    for key, row in plan.get_global_rows().items()
+                ]
+                outputs["highest"] = plan.get_highest_admins()
+                outputs["errors"] = error_handler.shared_errors
+                return outputs
+
+    def test_engines(self, configuration, plan_jsons):
+        expected = self.process(configuration, plan_jsons, "loop")
+        assert self.process(configuration, plan_jsons, "columnar") == expected
+        expected = self.process(configuration, plan_jsons, "loop", ["SD01*", "AF02"])
+        assert (
+            self.process(configuration, plan_jsons, "columnar", ["SD01*", "AF02"])
+            == expected
+        )
+
+        # Duplicate keys, unknown and national locations and repeated caseloads
+        plan_json = deepcopy(plan_jsons["SDN"])
+        caseloads = plan_json["data"]["caseloads"]
+        caseloads[0]["disaggregatedAttachments"].extend(
+            (
+                {
+                    "locationId": 25884957,
+                    "categoryLabel": "IDPs",
+                    "dataMatrix": [
+                        {"metricType": "totalPopulation", "value": 0},
+                        {"metricType": "expectedReach", "value": 5},
+                        {"metricType": "expectedReach", "value": 6},
+                    ],
+                },
+                {
+                    "locationId": 1,
+                    "categoryLabel": "",
+                    "dataMatrix": [{"metricType": "inNeed", "value": 3}],
+                },
+                {
+                    "locationId": 212,
+                    "categoryLabel": "IDPs",
+                    "dataMatrix": [{"metricType": "affected", "value": 4}],
+                },
+            )
+        )
+        caseloads.append(deepcopy(caseloads[2]))
+        caseloads[-1]["inNeed"] = 1
+        plan_jsons = {"SDN": plan_json}
+        expected = self.process(configuration, plan_jsons, "loop")
+        assert self.process(configuration, plan_jsons, "columnar") == expected
+        with pytest.raises(ValueError):
+            Plan(configuration, 2024, None, engine="polars")
@@ -0,0 +1,59 @@
+from os.path import join
+
+import pytest
+from hdx.api.utilities.hdx_error_handler import HDXErrorHandler
+from hdx.utilities.loader import load_json
+from hdx.utilities.path import temp_dir
+
+from hdx.scraper.hno.checkpoint import Checkpoint
+from hdx.scraper.hno.monitor_json import MonitorJSON
+from hdx.scraper.hno.plan import Plan
+
+
+class TestCheckpoint:
+    @pytest.fixture(scope="class")
+    @staticmethod
+    def input_dir():
+        return join("tests", "fixtures", "input")
+
+    @pytest.fixture(scope="class")
+    @staticmethod
+    def plan_json(input_dir):
+        return load_json(
+            join(
+                input_dir,
+                "1188-responsemonitoring-includecaseloaddisaggregation-true-includeindicatordisaggregation-false-disaggregationonlytotal-false.json",
+            )
+        )
+
+    def test_journal(self):
+        with temp_dir("TestHNOCheckpoint") as tempdir:
+            checkpoint = Checkpoint(tempdir)
+            key = Checkpoint.get_key("SDN", 1188)
+            assert checkpoint.get_stage(key) is None
+            checkpoint.record(key, "fetched", {"data": [1, 2]})
+            checkpoint.record(key, "transformed", ("a", {"b": 1}))
+            assert checkpoint.is_done(key, "fetched") is True
+            assert checkpoint.is_done(key, "published") is False
+
+            with open(join(tempdir, "checkpoint", "journal.jsonl"), "a") as fp:
+                fp.write('{"key": "AFG_1185", "sta')
+            checkpoint = Checkpoint(tempdir, resume=True)
+            assert checkpoint.get_stage(key) == "transformed"
+            assert checkpoint.get_stage("AFG_1185") is None
+            assert checkpoint.load(key, "fetched") == {"data": [1, 2]}
+            assert checkpoint.load(key, "transformed") == ("a", {"b": 1})
+            checkpoint.discard(key, "fetched")
+            assert checkpoint.load(key, "fetched") is None
+
+            checkpoint = Checkpoint(tempdir)
+            assert checkpoint.get_stage(key) is None
+
+    def test_restore(self, configuration, plan_json):
+        with HDXErrorHandler(write_to_hdx=False) as error_handler:
+            plan = Plan(configuration, 2024, error_handler)
+            _, rows = plan.process("SDN", "1188", MonitorJSON("", False), plan_json)
+            restored_plan = Plan(configuration, 2024, error_handler)
+            restored_plan.restore("SDN", rows, plan.get_highest_admin("SDN"))
+            assert restored_plan.get_global_rows() == plan.get_global_rows()
+            assert restored_plan.get_global_highest_admin() == 2
@@ -0,0 +1,62 @@
+from hdx.api.utilities.hdx_error_handler import HDXErrorHandler
+
+from hdx.scraper.hno.consistency import ConsistencyChecker
+from hdx.scraper.hno.error_aggregator import ErrorAggregator
+
+
+class TestConsistency:
+    @staticmethod
+    def get_row(in_need, targeted="", info=""):
+        return {
+            "Population": "",
+            "In Need": in_need,
+            "Targeted": targeted,
+            "Affected": "",
+            "Reached": "",
+            "Info": info,
+        }
+
+    def test_consistency(self, configuration):
+        rows = {
+            ("", "ALL", "Total", ""): self.get_row(100, 50),
+            ("XY01", "ALL", "Total", "total"): self.get_row(60, 40),
+            ("XY02", "ALL", "Total", "total"): self.get_row(50, 10),
+            # Under an admin 1 row so not summed at country level
+            ("XY01001", "ALL", "Total", "total"): self.get_row(61),
+            ("XY01002", "ALL", "Total", "total"): self.get_row("", 5),
+            # Under an admin 1 without a row so summed at country level
+            ("XY03001", "ALL", "Total", "total"): self.get_row(1),
+            ("", "EDU", "Education", "IDPs"): self.get_row(10, info="Unknown"),
+            ("XY01", "EDU", "Education", "IDPs"): self.get_row(10.05),
+            # No national row for this category
+            ("XY01", "EDU", "Education", "Refugees"): self.get_row(10),
+        }
+        parents = {
+            "XY01": "XY",
+            "XY02": "XY",
+            "XY01001": "XY01",
+            "XY01002": "XY01",
+            "XY03001": "XY03",
+            "XY03": "XY",
+        }
+        with HDXErrorHandler(write_to_hdx=False) as error_handler:
+            errors = ErrorAggregator(error_handler)
+            checker = ConsistencyChecker(configuration, errors)
+            infos = checker.check("XYZ", rows, parents)
+            assert infos == {
+                ("", "ALL", "Total", ""): {"In Need subnational sum 111 exceeds 100"},
+                ("XY01", "ALL", "Total", "total"): {
+                    "In Need subnational sum 61 exceeds 60"
+                },
+            }
+            assert errors.flush() == 2
+            assert error_handler.shared_errors["warning"][
+                "HumanitarianNeeds - HPC"
+            ] == {
+                "HumanitarianNeeds - HPC - caseload Total category  In Need subnational sum 111 exceeds 100 for country in XYZ",
+                "HumanitarianNeeds - HPC - caseload Total category total In Need subnational sum 61 exceeds 60 for XY01 in XYZ",
+            }
+
+        row = self.get_row(10, info="Unknown location 1")
+        ConsistencyChecker.add_infos(row, {"In Need subnational sum 11 exceeds 10"})
+        assert row["Info"] == "In Need subnational sum 11 exceeds 10|Unknown location 1"
@@ -0,0 +1,64 @@
+from os.path import join
+
+from hdx.utilities.path import temp_dir
+from hdx.utilities.saver import save_iterable
+
+from hdx.scraper.hno.csv_writer import get_admin_headers, write_csv
+
+
+class TestCSVWriter:
+    def test_get_admin_headers(self, configuration):
+        headers = tuple(configuration["headers"])
+        assert get_admin_headers(headers, 0, 5) == (
+            "Country ISO3",
+            "Description",
+            "Cluster",
+            "Category",
+            "Population",
+            "In Need",
+            "Targeted",
+            "Affected",
+            "Reached",
+            "Info",
+        )
+        assert get_admin_headers(headers[1:], 1, 5)[:3] == (
+            "Admin 1 PCode",
+            "Admin 1 Name",
+            "Description",
+        )
+        assert get_admin_headers(headers, 5, 5) == headers
+        # Projections are computed once for each set of headers and admin level
+        assert get_admin_headers(headers, 2, 5) is get_admin_headers(headers, 2, 5)
+
+    def test_write_csv(self):
+        headers = ("Country ISO3", "Admin 1 Name", "Description", "In Need", "Info")
+        rows = {
+            ("SDN", "Khartoum"): {
+                "Country ISO3": "SDN",
+                "Admin 1 Name": "Khartoum",
+                "Description": 'Said "needs", line\nbreak',
+                "In Need": 1.5,
+                "Info": "",
+            },
+            ("AFG", "Kabul"): {
+                "Country ISO3": "AFG",
+                "Admin 1 Name": "Kabul, Centre",
+                "Description": "Final HNRP Caseload",
+                "In Need": 23666389,
+                "Info": "No cluster|Negative",
+            },
+            ("AFG", ""): {
+                "Country ISO3": "AFG",
+                "Admin 1 Name": None,
+                "Description": "Dari دری",
+            },
+        }
+        with temp_dir("TestHNOCSVWriter") as tempdir:
+            path = join(tempdir, "tuples.csv")
+            assert write_csv(path, headers, rows) == 3
+            expected_path = join(tempdir, "frictionless.csv")
+            save_iterable(
+                expected_path, (rows[key] for key in sorted(rows)), list(headers)
+            )
+            with open(path, "rb") as fp, open(expected_path, "rb") as expected_fp:
+                assert fp.read() == expected_fp.read()
@@ -0,0 +1,78 @@
+import gzip
+import json
+
+from hdx.utilities.path import temp_dir
+
+from hdx.scraper.hno.diff import RowDiff
+
+
+class TestDiff:
+    def test_row_diff(self):
+        headers = ["Country ISO3", "Cluster", "In Need"]
+        rows = {
+            ("AFG", "", "EDU", "Education", ""): {
+                "Country ISO3": "AFG",
+                "Cluster": "EDU",
+                "In Need": 100,
+            },
+            ("AFG", "", "PRO", "Protection", ""): {
+                "Country ISO3": "AFG",
+                "Cluster": "PRO",
+                "In Need": 200,
+            },
+            ("SDN", "", "FSC", "Food", ""): {
+                "Country ISO3": "SDN",
+                "Cluster": "FSC",
+                "In Need": 300,
+            },
+        }
+        with temp_dir("TestHNODiff") as tempdir:
+            row_diff = RowDiff(tempdir, "hpc_hno_2024", headers)
+            assert row_diff.has_previous() is False
+            summary = row_diff.diff(rows)
+            assert summary == {
+                "AFG": {"added": 2, "removed": 0, "changed": 0},
+                "SDN": {"added": 1, "removed": 0, "changed": 0},
+            }
+            # Not committed so the next run still compares against nothing
+            row_diff = RowDiff(tempdir, "hpc_hno_2024", headers)
+            assert row_diff.has_previous() is False
+            row_diff.diff(rows)
+            row_diff.commit()
+            assert row_diff.has_previous() is True
+            assert row_diff.diff(rows) == {}
+
+            del rows[("AFG", "", "EDU", "Education", "")]
+            rows[("AFG", "", "PRO", "Protection", "")]["In Need"] = 250
+            rows[("SDN", "", "WSH", "Water", "")] = {
+                "Country ISO3": "SDN",
+                "Cluster": "WSH",
+                "In Need": 400,
+            }
+            summary = row_diff.diff(rows)
+            assert summary == {
+                "AFG": {"added": 0, "removed": 1, "changed": 1},
+                "SDN": {"added": 1, "removed": 0, "changed": 0},
+            }
+            with gzip.open(row_diff.changes_path, "rt") as fp:
+                changes = [json.loads(line) for line in fp]
+            assert changes == [
+                {
+                    "change": "removed",
+                    "key": ["AFG", "", "EDU", "Education", ""],
+                    "previous": ["AFG", "EDU", "100"],
+                    "current": None,
+                },
+                {
+                    "change": "changed",
+                    "key": ["AFG", "", "PRO", "Protection", ""],
+                    "previous": ["AFG", "PRO", "200"],
+                    "current": ["AFG", "PRO", "250"],
+                },
+                {
+                    "change": "added",
+                    "key": ["SDN", "", "WSH", "Water", ""],
+                    "previous": None,
+                    "current": ["SDN", "WSH", "400"],
+                },
+            ]
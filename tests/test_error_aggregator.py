@@ -0,0 +1,57 @@
+from hdx.api.utilities.hdx_error_handler import HDXErrorHandler
+
+from hdx.scraper.hno.error_aggregator import ErrorAggregator
+
+
+class TestErrorAggregator:
+    def test_error_aggregator(self):
+        with HDXErrorHandler(write_to_hdx=False) as expected_handler:
+            for i in range(3):
+                expected_handler.add_message(
+                    "HumanitarianNeeds",
+                    "HPC",
+                    "admin 3: AF0101001 ignored",
+                    message_type="warning",
+                )
+                expected_handler.add_missing_value_message(
+                    "HumanitarianNeeds", "hpc-hno", "cluster", "XYZ", err_to_hdx=True
+                )
+            expected_handler.add_message(
+                "HumanitarianNeeds", "HPC", "caseload {a} unknown cluster in AFG"
+            )
+
+        with HDXErrorHandler(write_to_hdx=False) as error_handler:
+            errors = ErrorAggregator(error_handler)
+            for i in range(3):
+                errors.add_message(
+                    "HumanitarianNeeds",
+                    "HPC",
+                    "admin {}: {} ignored",
+                    (3, "AF0101001"),
+                    message_type="warning",
+                )
+                errors.add_missing_value_message(
+                    "HumanitarianNeeds", "hpc-hno", "cluster", "XYZ", err_to_hdx=True
+                )
+            # Text without parameters is not formatted
+            errors.add_message(
+                "HumanitarianNeeds", "HPC", "caseload {a} unknown cluster in AFG"
+            )
+            assert errors.get_count() == 7
+            assert error_handler.shared_errors["warning"] == {}
+            assert errors.flush() == 3
+            assert errors.get_count() == 0
+            assert errors.flush() == 0
+        assert error_handler.shared_errors == expected_handler.shared_errors
+
+        # Messages are flushed to a new error handler once it is set
+        with HDXErrorHandler(write_to_hdx=False) as new_error_handler:
+            errors.add_message("HumanitarianNeeds", "HPC", "caseload unknown")
+            errors.set_error_handler(new_error_handler)
+            assert errors.flush() == 1
+            assert new_error_handler.shared_errors["error"] == {
+                "HumanitarianNeeds - HPC": {
+                    "HumanitarianNeeds - HPC - caseload unknown"
+                }
+            }
+        assert error_handler.shared_errors == expected_handler.shared_errors
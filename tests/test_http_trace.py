@@ -0,0 +1,112 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os.path import join
+from threading import Thread
+
+import pytest
+from hdx.utilities.downloader import Download
+from hdx.utilities.path import temp_dir
+from requests import Session
+
+from hdx.scraper.hno.http_trace import HTTPTrace, get_url_template
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.startswith("/missing"):
+            self.send_error(404)
+            return
+        body = json.dumps({"data": list(range(1000))}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+class TestHTTPTrace:
+    @pytest.fixture(scope="class")
+    @staticmethod
+    def url():
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        yield f"http://127.0.0.1:{server.server_port}"
+        server.shutdown()
+
+    def test_get_url_template(self):
+        assert (
+            get_url_template(
+                "https://api.hpc.tools/v2/public/plan/1185?content=entities&version=current"
+            )
+            == "https://api.hpc.tools/v2/public/plan/{id}?content&version"
+        )
+        assert (
+            get_url_template(
+                "https://data.humdata.org/dataset/cb963915-d7d1-4ffa-90dc-31277e24406f/resource/71a63c2f-ba2f-4fef-8bf9-e4259dc41610/download/global_pcodes.csv"
+            )
+            == "https://data.humdata.org/dataset/{id}/resource/{id}/download/global_pcodes.csv"
+        )
+
+    def test_http_trace(self, url):
+        with temp_dir("TestHNOHTTPTrace") as tempdir:
+            path = join(tempdir, "trace.jsonl")
+            http_trace = HTTPTrace(path)
+            with Download(
+                user_agent="test", rate_limit={"calls": 1, "period": 0.2}
+            ) as downloader:
+                http_trace.trace_session(downloader.session, "hpc")
+                http_trace.trace_downloader(downloader)
+                for plan_id in (1, 2):
+                    plan_json = downloader.download_json(f"{url}/plan/{plan_id}")
+                    assert len(plan_json["data"]) == 1000
+                with pytest.raises(Exception):
+                    downloader.download_json(f"{url}/missing")
+            session = Session()
+            http_trace.trace_session(session, "hdx_api")
+            response = session.get(f"{url}/api/action/package_show?id=test")
+            assert response.status_code == 200
+            http_trace.close()
+
+            records = list(HTTPTrace.read(path))
+            assert [
+                (record["service"], record["template"], record["status"])
+                for record in records
+            ] == [
+                ("hpc", f"{url}/plan/{{id}}", 200),
+                ("hpc", f"{url}/plan/{{id}}", 200),
+                ("hpc", f"{url}/missing", 404),
+                ("hdx_api", f"{url}/api/action/package_show?id", 200),
+            ]
+            assert records[0]["bytes"] == records[3]["bytes"] > 4000
+            assert records[0]["time"] >= records[0]["ttfb"] > 0
+            # Waiting on the rate limit of 1 call per 0.2 seconds
+            assert records[1]["wait"] > 0.1
+            assert records[3]["wait"] is None
+
+            summaries = HTTPTrace.summarise(path)
+            summary = {
+                summary["template"]: (
+                    summary["service"],
+                    summary["requests"],
+                    summary["errors"],
+                )
+                for summary in summaries
+            }
+            assert summary == {
+                f"{url}/plan/{{id}}": ("hpc", 2, 0),
+                f"{url}/missing": ("hpc", 1, 1),
+                f"{url}/api/action/package_show?id": ("hdx_api", 1, 0),
+            }
+            HTTPTrace.log_summary(path)
+            har_path = join(tempdir, "trace.har")
+            HTTPTrace.write_har(path, har_path)
+            with open(har_path) as fp:
+                entries = json.load(fp)["log"]["entries"]
+            assert len(entries) == 4
+            assert entries[1]["timings"]["blocked"] > 100
+            assert entries[3]["request"]["queryString"] == [
+                {"name": "id", "value": "test"}
+            ]
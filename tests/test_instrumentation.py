@@ -0,0 +1,42 @@
+import pytest
+
+from hdx.scraper.hno.instrumentation import Instruments, get_instrument
+from hdx.scraper.hno.memory_tracker import memory_snapshot
+from hdx.scraper.hno.profiling import profile
+
+
+class Instrument:
+    def __init__(self, name: str, finished: list, fail: bool = False) -> None:
+        self._name = name
+        self._finished = finished
+        self._fail = fail
+
+    def finish(self) -> None:
+        self._finished.append(self._name)
+        if self._fail:
+            raise ValueError(f"{self._name} failed")
+
+
+class TestInstrumentation:
+    def test_instruments(self):
+        finished = []
+        with Instruments() as instruments:
+            transport = instruments.add("transport", Instrument("transport", finished))
+            instruments.add("profiler", Instrument("profiler", finished, fail=True))
+            instruments.add("http_trace", Instrument("http_trace", finished))
+            assert get_instrument("transport") is transport
+            assert get_instrument("memory_tracker") is None
+        # Finished in reverse order despite one failing and then removed
+        assert finished == ["http_trace", "profiler", "transport"]
+        assert get_instrument("transport") is None
+        # Disabled instruments are no-ops
+        with profile("plan", "AFG"):
+            memory_snapshot("country AFG")
+
+        finished = []
+        with pytest.raises(RuntimeError):
+            with Instruments() as instruments:
+                instruments.add("http_trace", Instrument("http_trace", finished))
+                raise RuntimeError("Run failed")
+        assert finished == ["http_trace"]
+        assert get_instrument("http_trace") is None
@@ -0,0 +1,37 @@
+import json
+from os.path import join
+
+from hdx.utilities.path import temp_dir
+
+from hdx.scraper.hno.memory_tracker import MemoryTracker
+
+
+class TestMemoryTracker:
+    def test_memory_tracker(self):
+        with temp_dir("TestHNOMemoryTracker") as tempdir:
+            path = join(tempdir, "memory.jsonl")
+            memory_tracker = MemoryTracker(path, 5)
+            try:
+                report = memory_tracker.snapshot("start")
+                assert report["growth"] == []
+                rows = [{"In Need": i} for i in range(50000)]
+                report = memory_tracker.snapshot("rows")
+                assert report["current"] > 5000000
+                assert report["peak"] >= report["current"]
+                assert len(report["top"]) == 5
+                assert "test_memory_tracker.py" in report["growth"][0]["site"]
+                assert report["growth"][0]["size_diff"] > 5000000
+                assert report["growth"][0]["count_diff"] >= 50000
+                current = report["current"]
+                del rows
+                report = memory_tracker.snapshot("freed")
+                assert report["current"] < current - 5000000
+            finally:
+                memory_tracker.finish()
+            with open(path) as fp:
+                reports = [json.loads(line) for line in fp]
+            assert [report["stage"] for report in reports] == [
+                "start",
+                "rows",
+                "freed",
+            ]
@@ -0,0 +1,62 @@
+import gzip
+import json
+from copy import deepcopy
+from os import listdir
+from os.path import exists, join
+
+import pytest
+from hdx.api.utilities.hdx_error_handler import HDXErrorHandler
+from hdx.utilities.loader import load_json
+from hdx.utilities.path import temp_dir
+
+from hdx.scraper.hno.json_stream import JSONStreamWriter
+from hdx.scraper.hno.monitor_json import MonitorJSON
+from hdx.scraper.hno.plan import Plan
+from hdx.scraper.hno.progress_json import ProgressJSON
+
+
+class TestMonitorJSON:
+    @pytest.fixture(scope="class")
+    @staticmethod
+    def filename():
+        return "1188-responsemonitoring-includecaseloaddisaggregation-true-includeindicatordisaggregation-false-disaggregationonlytotal-false.json"
+
+    @pytest.fixture(scope="class")
+    @staticmethod
+    def plan_json(filename):
+        return load_json(join("tests", "fixtures", "input", filename))
+
+    def test_monitor_json(self, configuration, filename, plan_json):
+        with temp_dir("TestHNOMonitorJSON") as tempdir:
+            with HDXErrorHandler(write_to_hdx=False) as error_handler:
+                plan = Plan(configuration, 2024, error_handler)
+                monitor_json = MonitorJSON(tempdir, True, True)
+                plan.process("SDN", "1188", monitor_json, plan_json)
+            with gzip.open(join(tempdir, f"test_{filename}.gz"), "rt") as fp:
+                output = json.load(fp)
+            # The fixture was itself captured so should be reproduced
+            assert output == plan_json
+
+            progress_json = ProgressJSON(2024, tempdir, True)
+            progress_json.save()
+            output = load_json(join(tempdir, "test_progress-2024.json"))
+            assert output == {"data": {"plans": []}}
+
+    def test_monitor_json_failure(self, configuration, filename, plan_json):
+        with temp_dir("TestHNOMonitorJSONFailure") as tempdir:
+            path = join(tempdir, "test.json")
+            with pytest.raises(ValueError):
+                with JSONStreamWriter(path) as writer:
+                    writer.begin_object()
+                    raise ValueError("Write failed")
+            assert not exists(path)
+            assert not exists(f"{path}.tmp")
+
+            plan_json = deepcopy(plan_json)
+            del plan_json["data"]["lastPublishedDate"]
+            with HDXErrorHandler(write_to_hdx=False) as error_handler:
+                plan = Plan(configuration, 2024, error_handler)
+                monitor_json = MonitorJSON(tempdir, True, True)
+                with pytest.raises(KeyError):
+                    plan.process("SDN", "1188", monitor_json, plan_json)
+            assert listdir(tempdir) == []
@@ -0,0 +1,41 @@
+from os.path import join
+
+from hdx.utilities.path import temp_dir
+
+from hdx.scraper.hno.partitioned_csv import PartitionedCSV
+
+
+class TestPartitionedCSV:
+    def test_partitioned_csv(self):
+        headers = ["Country ISO3", "Cluster", "In Need"]
+        rows = {
+            ("AFG", "EDU"): {"Country ISO3": "AFG", "Cluster": "EDU", "In Need": 100},
+            ("AFG", "PRO"): {"Country ISO3": "AFG", "Cluster": "PRO", "In Need": None},
+            ("SDN", "FSC"): {"Country ISO3": "SDN", "Cluster": "FSC", "In Need": 300},
+        }
+        expected = (
+            "Country ISO3,Cluster,In Need\r\nAFG,EDU,100\r\nAFG,PRO,\r\nSDN,FSC,300\r\n"
+        )
+        with temp_dir("TestHNOPartitionedCSV") as tempdir:
+            path = join(tempdir, "hpc_hno_2024.csv")
+            partitioned_csv = PartitionedCSV(tempdir, "hpc_hno_2024")
+            assert partitioned_csv.write(path, headers, rows, set()) == 3
+            with open(path, newline="") as fp:
+                assert fp.read() == expected
+            partitioned_csv.commit()
+
+            # A country not marked as changed is copied from the last output
+            rows[("AFG", "EDU")]["In Need"] = 150
+            rows[("SDN", "FSC")]["In Need"] = 350
+            partitioned_csv = PartitionedCSV(tempdir, "hpc_hno_2024")
+            assert partitioned_csv.write(path, headers, rows, {"SDN"}) == 3
+            with open(path, newline="") as fp:
+                assert fp.read() == expected.replace("300", "350")
+
+            # Different headers mean every country is written
+            headers = ["Country ISO3", "In Need"]
+            assert partitioned_csv.write(path, headers, rows, {"SDN"}) == 3
+            with open(path, newline="") as fp:
+                assert fp.read() == (
+                    "Country ISO3,In Need\r\nAFG,150\r\nAFG,\r\nSDN,350\r\n"
+                )
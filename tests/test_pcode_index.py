@@ -0,0 +1,74 @@
+from os.path import join
+
+from hdx.api.utilities.hdx_error_handler import HDXErrorHandler
+from hdx.pipelineutils.reader import Read
+from hdx.utilities.path import temp_dir
+
+from hdx.scraper.hno.__main__ import setup_shared
+from hdx.scraper.hno.pcode_index import PcodeIndex
+
+
+class TestPcodeIndex:
+    def test_pcode_index(self):
+        pcode_index = PcodeIndex(["AF01", " SD01* ", ""])
+        assert "AF01" in pcode_index
+        assert "AF0101" not in pcode_index
+        assert "SD01" in pcode_index
+        # P-code prefixes are used when there are no parents
+        assert "SD01001" in pcode_index
+        assert "SD02001" not in pcode_index
+        assert "SD0" not in pcode_index
+
+        # Parents from the admin tables or plan locations are used first
+        pcode_index = PcodeIndex(["SD01*"], {"SD01": "SDN", "X2": "X1"})
+        assert "X2" not in pcode_index
+        pcode_index.add_parents({"SD01": "SD", "X1": "SD01"})
+        assert "X1" in pcode_index
+        assert "X2" in pcode_index
+        assert "SD" not in pcode_index
+        # A recorded parent chain is used even when it disagrees with the prefix
+        pcode_index = PcodeIndex(["SD01*"], {"SD01099": "SD02", "SD02099": "SD01"})
+        assert "SD01099" not in pcode_index
+        assert "SD02099" in pcode_index
+        assert "SD01001" in pcode_index
+
+        assert not PcodeIndex([])
+
+    def test_from_file(self):
+        with temp_dir("TestHNOPcodeIndex") as tempdir:
+            path = join(tempdir, "pcodes.txt")
+            with open(path, "w") as fp:
+                fp.write("# Khartoum and its localities\nSD01*\nAF01, AF02 # Kabul\n")
+            pcode_index = PcodeIndex.from_file(path)
+            assert "SD01001" in pcode_index
+            assert "AF02" in pcode_index
+            assert "AF0201" not in pcode_index
+
+    def test_setup_shared(self, configuration):
+        with HDXErrorHandler() as error_handler:
+            with temp_dir("TestHNOSetupShared") as tempdir:
+                Read.create_readers(
+                    tempdir, join("tests", "fixtures", "input"), tempdir, False, True
+                )
+                # A single year uses the admin tables for descendants of p-codes
+                pcodes, admins, sector = setup_shared(
+                    configuration,
+                    error_handler,
+                    2024,
+                    ["SDN"],
+                    "SD01*",
+                    "",
+                    False,
+                )
+                assert admins
+                assert sector.get_code("MPC") == "Cash"
+                assert PcodeIndex.get_parents(admins)["SD01001"] == "SD01"
+                assert "SD01001" in pcodes
+                assert "SD02001" not in pcodes
+
+                pcodes, admins, sector = setup_shared(
+                    configuration, error_handler, 2024, ["SDN"], "SD01", "", True
+                )
+                assert "SD01" in pcodes
+                assert admins is None
+                assert sector is None
@@ -0,0 +1,72 @@
+from copy import deepcopy
+from os.path import join
+
+import pytest
+from hdx.api.utilities.hdx_error_handler import HDXErrorHandler
+from hdx.utilities.loader import load_json
+from hdx.utilities.path import temp_dir
+
+from hdx.scraper.hno.monitor_json import MonitorJSON
+from hdx.scraper.hno.plan import Plan
+from hdx.scraper.hno.plan_index import PlanIndex, PlanIndexCache
+
+
+class TestPlanIndex:
+    @pytest.fixture(scope="class")
+    @staticmethod
+    def input_dir():
+        return join("tests", "fixtures", "input")
+
+    @pytest.fixture(scope="class")
+    @staticmethod
+    def plan_json(input_dir):
+        return load_json(
+            join(
+                input_dir,
+                "1188-responsemonitoring-includecaseloaddisaggregation-true-includeindicatordisaggregation-false-disaggregationonlytotal-false.json",
+            )
+        )
+
+    def test_plan_index(self, plan_json):
+        data = plan_json["data"]
+        plan_index = PlanIndex.from_data(data, 5, "SDN")
+        assert plan_index.get_location(25884957) == (2, "SD01001", "Jebel Awlia")
+        assert plan_index.get_location(1) is None
+        assert plan_index.get_parents() == {"SD01": "SD", "SD01001": "SD01"}
+        assert plan_index.clusters[None] == "ALL"
+        with pytest.raises(ValueError):
+            PlanIndex.from_data(data, 1, "SDN")
+
+        with temp_dir("TestHNOPlanIndex") as tempdir:
+            plan_index_cache = PlanIndexCache(tempdir)
+            assert plan_index_cache.get(1188, "2.15") is None
+            plan_index_cache.save(1188, "2.15", plan_index)
+            cached_plan_index = plan_index_cache.get(1188, "2.15")
+            assert cached_plan_index.to_json() == plan_index.to_json()
+            assert cached_plan_index.clusters == plan_index.clusters
+
+            new_data = deepcopy(data)
+            new_data["locations"][2]["name"] = "Jabal Aulia"
+            del new_data["locations"][1]
+            new_plan_index = PlanIndex.from_data(new_data, 5, "SDN")
+            assert new_plan_index.compare(plan_index) == {
+                "added": [],
+                "removed": [25884881],
+                "changed": [25884957],
+                "clusters": [],
+            }
+            plan_index_cache.save(1188, "2.16", new_plan_index)
+            assert plan_index_cache.get(1188, "2.15") is not None
+            plan_index_cache.save(1188, "2.17", new_plan_index)
+            # Only the previous version is kept for comparison
+            assert plan_index_cache.get(1188, "2.15") is None
+            assert plan_index_cache.get(1188, "2.16") is not None
+
+    def test_cached_process(self, configuration, plan_json):
+        with temp_dir("TestHNOPlanIndexProcess") as tempdir:
+            with HDXErrorHandler(write_to_hdx=False) as error_handler:
+                plan = Plan(configuration, 2024, error_handler, cache_dir=tempdir)
+                monitor_json = MonitorJSON(tempdir)
+                expected = plan.process("SDN", "1188", monitor_json, plan_json)
+                plan = Plan(configuration, 2024, error_handler, cache_dir=tempdir)
+                assert plan.process("SDN", "1188", monitor_json, plan_json) == expected
@@ -0,0 +1,59 @@
+import pstats
+from os import listdir
+from os.path import join
+from time import sleep
+
+import pytest
+from hdx.utilities.path import temp_dir
+
+from hdx.scraper.hno.profiling import Profiler
+
+
+class TestProfiling:
+    @staticmethod
+    def work() -> int:
+        total = 0
+        for i in range(300000):
+            total += i % 7
+        sleep(0.05)
+        return total
+
+    def test_profiler(self):
+        with temp_dir("TestHNOProfiling") as tempdir:
+            profile_dir = join(tempdir, "batch")
+            profiler = Profiler(profile_dir, "plan:AFG,plan:sdn,hapi", 0.001)
+            with profiler.profile("plan", "AFG"):
+                # Nested stages are not profiled separately
+                with profiler.profile("hapi", "AFG"):
+                    self.work()
+            with profiler.profile("plan", "SDN"):
+                pass
+            with profiler.profile("plan", "UKR"):
+                pass
+            with profiler.profile("publish", "AFG"):
+                pass
+            with profiler.profile("hapi"):
+                pass
+            filenames = sorted(listdir(profile_dir))
+            # Files are named by stage, country, process id and call number
+            names = [filename.rsplit("_", 2)[0] for filename in filenames]
+            assert names == [
+                "hapi",
+                "hapi",
+                "plan_AFG",
+                "plan_AFG",
+                "plan_SDN",
+                "plan_SDN",
+            ]
+            path = join(profile_dir, filenames[2]).rsplit(".", 1)[0]
+            stats = pstats.Stats(f"{path}.pstats")
+            assert any(function[2] == "work" for function in stats.stats)
+            with open(f"{path}.collapsed") as fp:
+                lines = fp.read().splitlines()
+            assert any("work (test_profiling.py:" in line for line in lines)
+            for line in lines:
+                _, count = line.rsplit(" ", 1)
+                assert int(count) > 0
+
+        with pytest.raises(ValueError):
+            Profiler(tempdir, "plans")
@@ -0,0 +1,117 @@
+from os.path import join
+
+from hdx.utilities.path import temp_dir
+
+from hdx.scraper.hno.query_index import QueryIndex, main
+
+
+class TestQueryIndex:
+    def test_query_index(self, capsys):
+        hno_headers = ["Country ISO3", "Admin 1 PCode", "Cluster", "In Need"]
+        hno_rows = {
+            ("SDN", "SD01", "EDU", "Education", ""): {
+                "Country ISO3": "SDN",
+                "Admin 1 PCode": "SD01",
+                "Cluster": "EDU",
+                "In Need": 100,
+            },
+        }
+        hapi_headers = [
+            "location_code",
+            "admin1_code",
+            "admin1_name",
+            "admin2_code",
+            "admin2_name",
+            "admin_level",
+            "sector_code",
+            "category",
+            "population_status",
+            "population",
+        ]
+
+        def hapi_row(admin1_code, sector_code, category, population_status, value):
+            return {
+                "location_code": "SDN",
+                "admin1_code": admin1_code,
+                "admin1_name": "Khartoum" if admin1_code == "SD01" else "Northern",
+                "admin2_code": "",
+                "admin2_name": "",
+                "admin_level": 1,
+                "sector_code": sector_code,
+                "category": category,
+                "population_status": population_status,
+                "population": value,
+            }
+
+        hapi_rows = {
+            1: hapi_row("SD01", "EDU", "total", "INN", 100),
+            2: hapi_row("SD01", "EDU", "Children", "INN", 60),
+            3: hapi_row("SD01", "FSC", "total", "INN", 200),
+            4: hapi_row("SD02", "EDU", "total", "INN", 0),
+            5: hapi_row("SD02", "EDU", "total", "TGT", 50),
+        }
+        with temp_dir("TestHNOQueryIndex") as tempdir:
+            path = join(tempdir, "hno.db")
+            with QueryIndex(path) as query_index:
+                query_index.build(2024, hno_headers, hno_rows, hapi_headers, hapi_rows)
+                hapi_rows[1] = hapi_row("SD01", "EDU", "total", "INN", 120)
+                query_index.build(2025, hno_headers, hno_rows, hapi_headers, hapi_rows)
+                # Rebuilding a year replaces its rows
+                query_index.build(2025, hno_headers, hno_rows, hapi_headers, hapi_rows)
+                assert query_index.query(
+                    "SELECT year, COUNT(*) AS rows FROM hapi GROUP BY year"
+                ) == [{"year": 2024, "rows": 5}, {"year": 2025, "rows": 5}]
+                assert query_index.query(
+                    "SELECT in_need FROM hno WHERE admin_1_pcode = ?", ("SD01",)
+                ) == [{"in_need": 100}, {"in_need": 100}]
+
+                expected = [
+                    {
+                        "admin1_code": "SD01",
+                        "admin1_name": "Khartoum",
+                        "admin2_code": None,
+                        "admin2_name": None,
+                        "sector_code": "EDU",
+                        "population": 120,
+                    },
+                    {
+                        "admin1_code": "SD01",
+                        "admin1_name": "Khartoum",
+                        "admin2_code": None,
+                        "admin2_name": None,
+                        "sector_code": "FSC",
+                        "population": 200,
+                    },
+                    {
+                        "admin1_code": "SD02",
+                        "admin1_name": "Northern",
+                        "admin2_code": None,
+                        "admin2_name": None,
+                        "sector_code": "EDU",
+                        "population": 0,
+                    },
+                ]
+                assert query_index.get_populations("SDN", admin_level=1) == expected
+                expected[0]["population"] = 100
+                assert query_index.get_populations("SDN", 2024) == expected
+                assert query_index.get_populations(
+                    "SDN", 2024, sector_code="EDU", category="Children"
+                ) == [
+                    {
+                        "admin1_code": "SD01",
+                        "admin1_name": "Khartoum",
+                        "admin2_code": None,
+                        "admin2_name": None,
+                        "sector_code": "EDU",
+                        "population": 60,
+                    }
+                ]
+
+                main([path, "SDN", "--year", "2024", "--sector", "FSC"])
+                assert capsys.readouterr().out == (
+                    "admin1_code\tadmin1_name\tadmin2_code\tadmin2_name\t"
+                    "sector_code\tpopulation\r\n"
+                    "SD01\tKhartoum\t\t\tFSC\t200\r\n"
+                )
+                main([path, "--sql", "SELECT category FROM hapi WHERE population = 0"])
+                assert capsys.readouterr().out == "category\r\ntotal\r\ntotal\r\n"
@@ -0,0 +1,101 @@
+import json
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+import pytest
+from hdx.utilities.dateparse import now_utc
+from hdx.utilities.downloader import Download, DownloadError
+from requests import Response
+
+from hdx.scraper.hno.rate_controller import RateController
+
+
+class MockHPCHandler(BaseHTTPRequestHandler):
+    """Returns the statuses queued in responses before succeeding"""
+
+    responses = []
+    calls = 0
+
+    def do_GET(self):
+        MockHPCHandler.calls += 1
+        if self.responses:
+            status, headers = self.responses.pop(0)
+        else:
+            status, headers = 200, {}
+        body = json.dumps({"status": status}).encode("utf-8")
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestRateController:
+    @pytest.fixture(scope="class")
+    @staticmethod
+    def url():
+        server = ThreadingHTTPServer(("127.0.0.1", 0), MockHPCHandler)
+        thread = Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield f"http://127.0.0.1:{server.server_address[1]}/plan"
+        server.shutdown()
+        server.server_close()
+
+    def test_get_retry_after(self):
+        response = Response()
+        assert RateController.get_retry_after(response) is None
+        response.headers["Retry-After"] = "7"
+        assert RateController.get_retry_after(response) == 7
+        response.headers["Retry-After"] = format_datetime(now_utc(), usegmt=True)
+        assert RateController.get_retry_after(response) == 0
+        response.headers["Retry-After"] = "soon"
+        assert RateController.get_retry_after(response) is None
+
+    def test_rate_controller(self, url):
+        sleeps = []
+        now = [0]
+
+        def sleep_fn(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+
+        rate_controller = RateController(
+            "hpc_bearer",
+            initial_rate=2,
+            max_rate=2.2,
+            max_retries=3,
+            clock=lambda: now[0],
+            sleep_fn=sleep_fn,
+        )
+        with Download(user_agent="test") as downloader:
+            rate_controller.wrap(downloader)
+            MockHPCHandler.responses = [(429, {"Retry-After": "3"}), (503, {})]
+            MockHPCHandler.calls = 0
+            assert downloader.download_json(url) == {"status": 200}
+            assert MockHPCHandler.calls == 3
+            # Retry-After is honoured then there is exponential backoff
+            assert sleeps == [3, 2]
+            assert rate_controller.get_rate() == pytest.approx(0.6)
+            # The slot was reserved at the rate in force after the 503
+            assert downloader.download_json(url) == {"status": 200}
+            assert sleeps == [3, 2, 2]
+            assert rate_controller.get_rate() == pytest.approx(0.7)
+
+            MockHPCHandler.responses = [(404, {})]
+            MockHPCHandler.calls = 0
+            with pytest.raises(DownloadError):
+                downloader.download_json(url)
+            assert MockHPCHandler.calls == 1
+
+            MockHPCHandler.responses = [(502, {})] * 4
+            MockHPCHandler.calls = 0
+            with pytest.raises(DownloadError):
+                downloader.download_json(url)
+            assert MockHPCHandler.calls == 4
+            assert rate_controller.get_rate() == 0.1
@@ -0,0 +1,88 @@
+import gzip
+from os.path import join
+
+import pytest
+from hdx.utilities.path import temp_dir
+from requests import Request, Response, Session
+
+from hdx.scraper.hno.resource_compression import (
+    compress_body,
+    compressed_uploads,
+    gzip_file,
+)
+
+
+class TestResourceCompression:
+    @pytest.fixture(scope="class")
+    @staticmethod
+    def input_path():
+        return join("tests", "fixtures", "hdx_hapi_humanitarian_needs_global_2024.csv")
+
+    def test_gzip(self, input_path):
+        with open(input_path, "rb") as fp:
+            data = fp.read()
+        with temp_dir("TestHNOResourceCompression") as tempdir:
+            outputs = []
+            for threads in (1, 4):
+                output_path = join(tempdir, f"output_{threads}.csv.gz")
+                gzip_file(input_path, output_path, threads=threads, chunk_size=10000)
+                with open(output_path, "rb") as fp:
+                    outputs.append(fp.read())
+            # Output is reproducible whatever the number of threads
+            assert outputs[0] == outputs[1]
+            assert gzip.decompress(outputs[0]) == data
+            assert len(outputs[0]) < len(data) / 5
+
+            output_path = join(tempdir, "empty.csv.gz")
+            empty_path = join(tempdir, "empty.csv")
+            open(empty_path, "wb").close()
+            gzip_file(empty_path, output_path)
+            with open(output_path, "rb") as fp:
+                assert gzip.decompress(fp.read()) == b""
+
+    def test_compressed_uploads(self, input_path):
+        with open(input_path, "rb") as fp:
+            data = fp.read()
+        session = Session()
+        requests = []
+
+        def send(request, **kwargs):
+            requests.append(request)
+            return Response()
+
+        session.send = send
+        with compressed_uploads(session, "gzip"):
+            with open(input_path, "rb") as fp:
+                session.post(
+                    "http://hdx/api/action/resource_update",
+                    data={"id": "1"},
+                    files={"upload": fp},
+                )
+            session.post("http://hdx/api/action/package_update", json={"id": "1"})
+        assert session.send is send
+        session.post("http://hdx/api/action/resource_update", files={"upload": b"a,b"})
+        upload, update, uncompressed_upload = requests
+        # Only file uploads are compressed
+        assert upload.headers["Content-Encoding"] == "gzip"
+        assert upload.headers["Content-Length"] == str(len(upload.body))
+        body = gzip.decompress(upload.body)
+        assert data in body
+        assert len(upload.body) < len(body) / 5
+        assert "Content-Encoding" not in update.headers
+        assert "Content-Encoding" not in uncompressed_upload.headers
+
+        with pytest.raises(ValueError):
+            with compressed_uploads(session, "brotli"):
+                pass
+
+    def test_zstd(self, input_path):
+        zstandard = pytest.importorskip("zstandard")
+        with open(input_path, "rb") as fp:
+            data = fp.read()
+        request = Request(
+            "POST", "http://hdx/api/action/resource_create", files={"upload": data}
+        ).prepare()
+        body = request.body
+        compress_body(request, "zstd")
+        assert request.headers["Content-Encoding"] == "zstd"
+        assert zstandard.ZstdDecompressor().decompress(request.body) == body
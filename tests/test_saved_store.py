@@ -0,0 +1,66 @@
+from glob import glob
+from os.path import getmtime, join
+from shutil import copyfile
+
+import pytest
+from hdx.pipelineutils.reader import Read
+from hdx.utilities.downloader import Download, DownloadError
+from hdx.utilities.loader import load_json
+from hdx.utilities.path import temp_dir
+
+from hdx.scraper.hno.saved_store import SavedStore, StoredRead
+
+
+class TestSavedStore:
+    @pytest.fixture(scope="class")
+    @staticmethod
+    def input_dir():
+        return join("tests", "fixtures", "input")
+
+    def test_saved_store(self, input_dir):
+        with temp_dir("TestHNOSavedStore") as tempdir:
+            store_dir = join(tempdir, "store")
+            # The same payload under two urls eg. the same plan in two years
+            plan_path = join(
+                input_dir,
+                "1188-responsemonitoring-includecaseloaddisaggregation-true-includeindicatordisaggregation-false-disaggregationonlytotal-false.json",
+            )
+            copy_path = join(tempdir, "copy.json")
+            copyfile(plan_path, copy_path)
+            csv_path = join(input_dir, "download-global-pcode-lengths.csv")
+            with Download(user_agent="test") as downloader:
+                reader = Read(downloader, tempdir, tempdir, tempdir)
+                store = SavedStore(store_dir, decoded=True)
+                saving_reader = StoredRead(reader, store, True, False)
+                expected_json = saving_reader.download_json(plan_path)
+                assert saving_reader.download_json(copy_path) == expected_json
+                expected_header, expected_rows = saving_reader.get_tabular_rows(
+                    csv_path, dict_form=True
+                )
+                expected_rows = list(expected_rows)
+                assert len(glob(join(store_dir, "blobs", "*", "*.gz"))) == 2
+                assert store.get_digest(plan_path) == store.get_digest(copy_path)
+
+                assert len(glob(join(store_dir, "decoded", "*.pkl"))) == 2
+                store = SavedStore(store_dir, decoded=True)
+                using_reader = StoredRead(reader, store, False, True)
+                assert using_reader.download_json(copy_path) == load_json(plan_path)
+                header, rows = using_reader.get_tabular_rows(csv_path, dict_form=True)
+                assert header == expected_header
+                assert list(rows) == expected_rows
+                # Blobs are still readable without parsed forms, which are not
+                # kept by default
+                store = SavedStore(store_dir)
+                using_reader = StoredRead(reader, store, False, True)
+                assert using_reader.download_json(plan_path) == expected_json
+                header, rows = using_reader.get_tabular_rows(csv_path, dict_form=True)
+                assert list(rows) == expected_rows
+                # Files are decompressed once and the same path returned after
+                path = using_reader.download_file(csv_path)
+                with open(path, "rb") as fp, open(csv_path, "rb") as expected_fp:
+                    assert fp.read() == expected_fp.read()
+                mtime = getmtime(path)
+                assert using_reader.download_file(csv_path) == path
+                assert getmtime(path) == mtime
+                with pytest.raises(DownloadError):
+                    using_reader.download_json(join(tempdir, "missing.json"))
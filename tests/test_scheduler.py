@@ -0,0 +1,116 @@
+from hdx.api.utilities.hdx_error_handler import HDXErrorHandler
+from hdx.utilities.path import temp_dir
+
+from hdx.scraper.hno.plan import Plan
+from hdx.scraper.hno.scheduler import Scheduler
+
+
+class VersionedPlan(Plan):
+    """Plan whose published versions are set directly"""
+
+    versions = {}
+
+    def get_plan_version(self, plan_id: str | int) -> tuple | None:
+        return self.versions.get(plan_id)
+
+
+class TestScheduler:
+    @staticmethod
+    def get_plan_json(attachments: int) -> dict:
+        return {
+            "data": {
+                "caseloads": [{"disaggregatedAttachments": [{}] * attachments}],
+            }
+        }
+
+    def test_scheduler(self, configuration):
+        plans = [
+            {"iso3": "AFG", "id": 1},
+            {"iso3": "SDN", "id": 2},
+            {"iso3": "UKR", "id": 3},
+        ]
+        now = [0]
+
+        def clock():
+            return now[0]
+
+        with temp_dir("TestHNOScheduler") as tempdir:
+            with HDXErrorHandler(write_to_hdx=False) as error_handler:
+                plan = VersionedPlan(configuration, 2024, error_handler)
+                plan.versions = {1: (11, "a"), 2: (21, "b"), 3: (31, "c")}
+                scheduler = Scheduler(tempdir, 2024, plan, 8, clock)
+                # Without history, all plans are changed and none are deferred
+                assert scheduler.order(plans) == plans
+                scheduler.start()
+                for plan_id_country, seconds in zip(plans, (10, 2, 5)):
+                    countryiso3 = plan_id_country["iso3"]
+                    plan_id = plan_id_country["id"]
+                    now[0] += 20
+                    assert scheduler.should_defer(countryiso3, plan_id) is False
+                    scheduler.save(
+                        countryiso3,
+                        plan_id,
+                        (None, {countryiso3: plan_id}, 1),
+                        self.get_plan_json(plan_id),
+                    )
+                    scheduler.record_time(countryiso3, plan_id, seconds)
+                scheduler.commit()
+
+                plan.versions[2] = (22, "d")
+                plans.append({"iso3": "YEM", "id": 4})
+                plan.versions[4] = (41, "e")
+                scheduler = Scheduler(tempdir, 2024, plan, 8, clock)
+                assert scheduler.is_changed("AFG", 1) is False
+                assert scheduler.is_changed("SDN", 2) is True
+                # Changed and new plans first then the longest first
+                assert [x["iso3"] for x in scheduler.order(plans)] == [
+                    "YEM",
+                    "SDN",
+                    "AFG",
+                    "UKR",
+                ]
+                now[0] = 0
+                scheduler.start()
+                now[0] = 3
+                assert scheduler.should_defer("YEM", 4) is False
+                assert scheduler.should_defer("SDN", 2) is False
+                # 3 + 10 seconds exceeds the budget of 8
+                assert scheduler.should_defer("AFG", 1) is True
+                assert scheduler.should_defer("UKR", 3) is False
+                assert scheduler.get_deferred() == ["AFG"]
+                assert scheduler.has_rows("AFG", 1) is True
+                assert scheduler.has_rows("YEM", 4) is False
+                assert scheduler.load("AFG", 1) == (None, {"AFG": 1}, 1)
+                scheduler.record_time("UKR", 3, 7)
+                assert scheduler.get_expected_time("UKR", 3) == 6
+                scheduler.commit()
+
+                # Without a budget nothing is deferred
+                scheduler = Scheduler(tempdir, 2024, plan, None, clock)
+                now[0] = 100
+                assert scheduler.should_defer("AFG", 1) is False
+
+                # Rows stored with other settings eg. p-codes are not reused
+                versions = plan.versions
+                plan = VersionedPlan(
+                    configuration, 2024, error_handler, pcodes_to_process=["AF01*"]
+                )
+                plan.versions = versions
+                scheduler = Scheduler(tempdir, 2024, plan, 8, clock)
+                assert scheduler.is_changed("AFG", 1) is True
+                assert scheduler.has_rows("AFG", 1) is False
+                assert scheduler.should_defer("AFG", 1) is False
+                # As are rows from other consistency checks which add to Info
+                tolerance = configuration["consistency"]["tolerance"]
+                configuration["consistency"]["tolerance"] = 0.5
+                try:
+                    plan = VersionedPlan(configuration, 2024, error_handler)
+                    plan.versions = versions
+                finally:
+                    configuration["consistency"]["tolerance"] = tolerance
+                scheduler = Scheduler(tempdir, 2024, plan, 8, clock)
+                assert scheduler.is_changed("AFG", 1) is True
+                plan = VersionedPlan(configuration, 2024, error_handler)
+                plan.versions = versions
+                scheduler = Scheduler(tempdir, 2024, plan, 8, clock)
+                assert scheduler.is_changed("AFG", 1) is False
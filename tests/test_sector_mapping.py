@@ -0,0 +1,67 @@
+import json
+from os.path import join
+
+import pytest
+from hdx.pipelineutils.reader import Read
+from hdx.utilities.path import temp_dir
+
+from hdx.scraper.hno.sector_mapping import (
+    SectorMapping,
+    check_sector_mapping,
+    compile_sector_mapping,
+    load_sector_mapping,
+    start_sector_mapping_check,
+)
+
+
+class TestSectorMapping:
+    @pytest.fixture(scope="class")
+    @staticmethod
+    def fixtures_dir():
+        return join("tests", "fixtures")
+
+    def test_sector_mapping(self, configuration, fixtures_dir):
+        with temp_dir("TestHNOSectorMapping") as tempdir:
+            Read.create_readers(
+                tempdir, join(fixtures_dir, "input"), tempdir, False, True
+            )
+            path = join(tempdir, "sector_mapping.json")
+            mapping = compile_sector_mapping(path)
+            with open(
+                join(fixtures_dir, "sector_mapping.json"), encoding="utf-8"
+            ) as fp:
+                assert json.load(fp) == mapping
+            assert mapping["source"]["last_modified"] == "2026-04-09T08:44:08.407850"
+
+            sector_mapping = load_sector_mapping(path)
+            assert sector_mapping.get_code("ALL") == "Intersectoral"
+            assert sector_mapping.get_code("MPC") == "Cash"
+            assert sector_mapping.get_code("COV19") is None
+            assert sector_mapping.get_name("PRO-CPN") == "Child Protection"
+            assert sector_mapping.get_name("XXX", "") == ""
+            # Names other than HPC cluster codes are matched as Sector would
+            assert sector_mapping.get_code("Water Sanitation Hygiene") == "WSH"
+            assert sector_mapping.get_code("eau hygiene") == "WSH"
+
+            # The packaged mapping is compiled from the same coordination groups
+            assert load_sector_mapping().source == mapping["source"]
+            # Without a precompiled mapping, nothing is downloaded
+            missing_path = join(tempdir, "missing.json")
+            with pytest.raises(FileNotFoundError):
+                load_sector_mapping(missing_path)
+            assert check_sector_mapping(missing_path) is False
+
+            assert check_sector_mapping(path) is True
+            mapping["source"]["last_modified"] = "2025-01-01T00:00:00"
+            with open(path, "w", encoding="utf-8") as fp:
+                json.dump(mapping, fp)
+            assert check_sector_mapping(path) is False
+            thread = start_sector_mapping_check(path)
+            thread.join(10)
+            assert not thread.is_alive()
+
+            mapping["format_version"] = 0
+            with open(path, "w", encoding="utf-8") as fp:
+                json.dump(mapping, fp)
+            with pytest.raises(ValueError):
+                SectorMapping.from_file(path)
@@ -0,0 +1,154 @@
+from multiprocessing import get_context
+from os.path import join
+
+import pytest
+from hdx.api.utilities.hdx_error_handler import HDXErrorHandler
+from hdx.pipelineutils.reader import Read
+from hdx.utilities.dateparse import parse_date
+from hdx.utilities.loader import load_json
+from hdx.utilities.path import temp_dir
+
+from hdx.scraper.hno.dataset_generator import DatasetGenerator
+from hdx.scraper.hno.hapi_output import HAPIOutput
+from hdx.scraper.hno.monitor_json import MonitorJSON
+from hdx.scraper.hno.plan import Plan
+from hdx.scraper.hno.shards import (
+    Shards,
+    get_shard_index,
+    parse_shard,
+    select_plans,
+)
+from hdx.scraper.hno.timeperiod_helper import TimePeriodHelper
+
+plan_ids_countries = [{"id": 1185, "iso3": "AFG"}, {"id": 1188, "iso3": "SDN"}]
+
+
+def run_plans(configuration, input_dir, plans, admins):
+    with HDXErrorHandler(write_to_hdx=False) as error_handler:
+        plan = Plan(configuration, 2024, error_handler)
+        timeperiod_helper = TimePeriodHelper(configuration, 2024)
+        hapi_output = HAPIOutput(
+            configuration,
+            timeperiod_helper,
+            error_handler,
+            DatasetGenerator.global_name,
+        )
+        hapi_output.setup_admins(admins)
+        countries_with_data = []
+        for plan_id_country in plans:
+            countryiso3 = plan_id_country["iso3"]
+            plan_id = plan_id_country["id"]
+            json = load_json(
+                join(
+                    input_dir,
+                    f"{plan_id}-responsemonitoring-includecaseloaddisaggregation-true-includeindicatordisaggregation-false-disaggregationonlytotal-false.json",
+                )
+            )
+            _, rows = plan.process(countryiso3, plan_id, MonitorJSON("", False), json)
+            hapi_output.process(countryiso3, rows)
+            countries_with_data.append(countryiso3)
+    return plan, hapi_output, countries_with_data
+
+
+def run_shard(configuration, input_dir, admins, shard_dir, shard_index, shard_count):
+    plans = select_plans(plan_ids_countries, shard_index, shard_count)
+    plan, hapi_output, countries_with_data = run_plans(
+        configuration, input_dir, plans, admins
+    )
+    Shards(shard_dir, 2024, shard_count, "test").write(
+        shard_index, plan, hapi_output, countries_with_data
+    )
+
+
+class TestShards:
+    @pytest.fixture(scope="class")
+    @staticmethod
+    def input_dir():
+        return join("tests", "fixtures", "input")
+
+    def test_parse_shard(self):
+        assert parse_shard("2/4") == (1, 4)
+        with pytest.raises(ValueError):
+            parse_shard("5/4")
+        with pytest.raises(ValueError):
+            parse_shard("abc")
+
+    def test_shards(self, configuration, input_dir):
+        shard_count = 4
+        # The fixture countries must land in different shards for the test to be
+        # meaningful. The other shards are empty.
+        assert get_shard_index("AFG", shard_count) != get_shard_index(
+            "SDN", shard_count
+        )
+        with temp_dir("TestHNOShards") as tempdir:
+            Read.create_readers(
+                tempdir,
+                input_dir,
+                tempdir,
+                False,
+                True,
+                today=parse_date("09/10/2024"),
+            )
+            with HDXErrorHandler(write_to_hdx=False) as error_handler:
+                hapi_output = HAPIOutput(
+                    configuration,
+                    TimePeriodHelper(configuration, 2024),
+                    error_handler,
+                    DatasetGenerator.global_name,
+                    ["AFG", "SDN"],
+                )
+                hapi_output.setup_admins()
+                admins = hapi_output.get_admins()
+            shard_dir = join(tempdir, "shards")
+            shards = Shards(shard_dir, 2024, shard_count, "test")
+            with HDXErrorHandler(write_to_hdx=False) as error_handler:
+                with pytest.raises(ValueError):
+                    shards.merge(Plan(configuration, 2024, error_handler), None)
+
+            context = get_context("fork")
+            processes = [
+                context.Process(
+                    target=run_shard,
+                    args=(configuration, input_dir, admins, shard_dir, i, shard_count),
+                )
+                for i in range(shard_count)
+            ]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+                assert process.exitcode == 0
+
+            # Shards from another run are refused
+            with HDXErrorHandler(write_to_hdx=False) as error_handler:
+                with pytest.raises(ValueError):
+                    Shards(shard_dir, 2024, shard_count, "other").merge(
+                        Plan(configuration, 2024, error_handler), None
+                    )
+
+            expected_plan, expected_hapi_output, expected_countries = run_plans(
+                configuration, input_dir, plan_ids_countries, admins
+            )
+            with HDXErrorHandler(write_to_hdx=False) as error_handler:
+                plan = Plan(configuration, 2024, error_handler)
+                timeperiod_helper = TimePeriodHelper(configuration, 2024)
+                hapi_output = HAPIOutput(
+                    configuration,
+                    timeperiod_helper,
+                    error_handler,
+                    DatasetGenerator.global_name,
+                )
+                countries_with_data = shards.merge(plan, hapi_output)
+            assert countries_with_data == expected_countries
+            assert plan.get_global_rows() == expected_plan.get_global_rows()
+            assert list(plan.get_global_rows()) == sorted(
+                expected_plan.get_global_rows()
+            )
+            assert plan.get_global_highest_admin() == 2
+            assert (
+                hapi_output.get_global_rows() == expected_hapi_output.get_global_rows()
+            )
+            assert (
+                hapi_output.get_negative_rounded_values()
+                == expected_hapi_output.get_negative_rounded_values()
+            )
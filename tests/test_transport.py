@@ -0,0 +1,116 @@
+import gzip
+import json
+import ssl
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os.path import join
+from shutil import which
+from threading import Thread
+
+import pytest
+from hdx.utilities.downloader import Download
+from hdx.utilities.path import temp_dir
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+from hdx.scraper.hno.transport import PooledTransport
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        body = json.dumps({"data": list(range(2000))}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+class TestTransport:
+    @pytest.fixture(scope="class")
+    @staticmethod
+    def server():
+        if not which("openssl"):
+            pytest.skip("openssl is needed to make a certificate")
+        with temp_dir("TestHNOTransport") as tempdir:
+            cert_path = join(tempdir, "cert.pem")
+            key_path = join(tempdir, "key.pem")
+            subprocess.run(
+                [
+                    "openssl",
+                    "req",
+                    "-x509",
+                    "-newkey",
+                    "rsa:2048",
+                    "-nodes",
+                    "-days",
+                    "1",
+                    "-subj",
+                    "/CN=127.0.0.1",
+                    "-addext",
+                    "subjectAltName=IP:127.0.0.1",
+                    "-keyout",
+                    key_path,
+                    "-out",
+                    cert_path,
+                ],
+                check=True,
+                capture_output=True,
+            )
+            server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(cert_path, key_path)
+            server.socket = context.wrap_socket(server.socket, server_side=True)
+            Thread(target=server.serve_forever, daemon=True).start()
+            yield f"https://127.0.0.1:{server.server_port}", cert_path
+            server.shutdown()
+
+    def test_transport(self, server, monkeypatch):
+        url, cert_path = server
+        # requests prefers CA bundles in the environment to a session's verify
+        for name in ("REQUESTS_CA_BUNDLE", "CURL_CA_BUNDLE"):
+            monkeypatch.delenv(name, raising=False)
+        transport = PooledTransport(maxsize=2, hosts={"127.0.0.1": 1})
+        with (
+            Download(user_agent="test", verify=cert_path) as hpc_basic,
+            Download(user_agent="test", verify=cert_path) as hpc_bearer,
+        ):
+            retries = hpc_basic.session.adapters["https://"].max_retries
+            ckan_session = Session()
+            ckan_session.verify = cert_path
+            for session in (hpc_basic.session, hpc_bearer.session, ckan_session):
+                transport.mount(session)
+            # Retries are kept for each session
+            assert hpc_basic.session.adapters["https://"].max_retries is retries
+            # Sessions with settings the shared pools cannot honour are left alone
+            blocking_session = Session()
+            blocking_adapter = HTTPAdapter(pool_block=True)
+            blocking_session.mount("https://", blocking_adapter)
+            assert transport.mount(blocking_session) is False
+            assert blocking_session.adapters["https://"] is blocking_adapter
+            for _ in range(2):
+                for downloader in (hpc_basic, hpc_bearer):
+                    plan_json = downloader.download_json(f"{url}/plan/1")
+                    assert len(plan_json["data"]) == 2000
+                response = ckan_session.get(f"{url}/api/action/package_show")
+                assert len(response.json()["data"]) == 2000
+        port = int(url.rsplit(":", 1)[1])
+        pool = transport.poolmanager.connection_from_host("127.0.0.1", port, "https")
+        assert pool.pool.maxsize == 1
+        summary = transport.get_summary()
+        # One connection kept alive and reused by all sessions
+        assert summary["requests"] == 6
+        assert summary["connections"] == 1
+        assert summary["compressed_responses"] == 6
+        assert summary["decoded_bytes"] > summary["received_bytes"] * 2
+        transport.log_summary()
+        transport.poolmanager.clear()
+        assert transport.get_summary()["requests"] == 6
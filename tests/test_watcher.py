@@ -0,0 +1,187 @@
+from os.path import join
+
+import pytest
+from hdx.api.utilities.hdx_error_handler import HDXErrorHandler
+from hdx.pipelineutils.reader import Read
+from hdx.utilities.dateparse import parse_date
+from hdx.utilities.path import temp_dir
+
+from hdx.scraper.hno.dataset_generator import DatasetGenerator
+from hdx.scraper.hno.hapi_output import HAPIOutput
+from hdx.scraper.hno.monitor_json import MonitorJSON
+from hdx.scraper.hno.plan import Plan
+from hdx.scraper.hno.timeperiod_helper import TimePeriodHelper
+from hdx.scraper.hno.watcher import Watcher
+
+
+class BumpedPlan(Plan):
+    """Plan whose published versions can be bumped to simulate a new version"""
+
+    bumped = set()
+
+    def download(self, plan_id: str) -> dict | None:
+        json = super().download(plan_id)
+        if plan_id in self.bumped:
+            json["data"]["lastPublishedVersion"] += "1"
+        return json
+
+
+class TestWatcher:
+    @pytest.fixture(scope="class")
+    @staticmethod
+    def input_dir():
+        return join("tests", "fixtures", "input")
+
+    def test_watcher(self, configuration, input_dir):
+        with temp_dir("TestHNOWatcher") as tempdir:
+            Read.create_readers(
+                tempdir,
+                input_dir,
+                tempdir,
+                False,
+                True,
+                today=parse_date("09/10/2024"),
+            )
+            with HDXErrorHandler(write_to_hdx=False) as error_handler:
+                plan = BumpedPlan(configuration, 2024, error_handler)
+                hapi_output = HAPIOutput(
+                    configuration,
+                    TimePeriodHelper(configuration, 2024),
+                    error_handler,
+                    DatasetGenerator.global_name,
+                    ["AFG", "SDN"],
+                )
+                hapi_output.setup_admins()
+                processed = []
+                published = []
+
+                def process_country(countryiso3, plan_id, json):
+                    processed.append(countryiso3)
+                    _, rows = plan.process(
+                        countryiso3, plan_id, MonitorJSON("", False), json
+                    )
+                    hapi_output.process(countryiso3, rows)
+                    return bool(rows)
+
+                def publish_global(countries_with_data):
+                    published.append((countries_with_data, len(plan.get_global_rows())))
+
+                now = [0]
+                watcher = Watcher(
+                    plan,
+                    hapi_output,
+                    process_country,
+                    publish_global,
+                    2024,
+                    input_dir,
+                    poll_interval=60,
+                    debounce=100,
+                    recheck_interval=1000,
+                    clock=lambda: now[0],
+                )
+                assert watcher.poll() == ["AFG", "SDN"]
+                assert watcher.get_countries_with_data() == ["AFG", "SDN"]
+                no_rows = len(plan.get_global_rows())
+                no_hapi_rows = len(hapi_output.get_global_rows())
+                assert watcher.publish_global_if_due() is False
+                now[0] = 60
+                # Progress entries unchanged so nothing is downloaded
+                assert watcher.poll() == []
+                assert watcher.publish_global_if_due() is False
+                now[0] = 100
+                assert watcher.publish_global_if_due() is True
+                assert published == [(["AFG", "SDN"], no_rows)]
+
+                BumpedPlan.bumped.add(1188)
+                now[0] = 200
+                # Progress entries still unchanged so the new version is not seen
+                assert watcher.poll() == []
+                now[0] = 1000
+                assert watcher.poll() == ["SDN"]
+                assert processed == ["AFG", "SDN", "SDN"]
+                assert len(plan.get_global_rows()) == no_rows
+                assert len(hapi_output.get_global_rows()) == no_hapi_rows
+                now[0] = 1100
+                assert watcher.publish_global_if_due() is True
+                assert published[-1] == (["AFG", "SDN"], no_rows)
+
+                now[0] = 2000
+                assert watcher.poll() == []
+                watcher.run(max_polls=1)
+                assert len(published) == 2
+                watcher.stop()
+                watcher.run()
+                assert len(published) == 2
+
+    def test_watcher_failures(self, configuration, input_dir):
+        with temp_dir("TestHNOWatcherFailures") as tempdir:
+            Read.create_readers(
+                tempdir,
+                input_dir,
+                tempdir,
+                False,
+                True,
+                today=parse_date("09/10/2024"),
+            )
+            with HDXErrorHandler(write_to_hdx=False) as error_handler:
+                plan = Plan(configuration, 2024, error_handler)
+                hapi_output = HAPIOutput(
+                    configuration,
+                    TimePeriodHelper(configuration, 2024),
+                    error_handler,
+                    DatasetGenerator.global_name,
+                    ["AFG", "SDN"],
+                )
+                hapi_output.setup_admins()
+                failing = {"AFG"}
+                published = []
+
+                def process_country(countryiso3, plan_id, json):
+                    _, rows = plan.process(
+                        countryiso3, plan_id, MonitorJSON("", False), json
+                    )
+                    if countryiso3 in failing:
+                        raise ValueError(f"{countryiso3} failed")
+                    hapi_output.process(countryiso3, rows)
+                    return bool(rows)
+
+                def publish_global(countries_with_data):
+                    if not published:
+                        published.append(None)
+                        raise ValueError("Publishing failed")
+                    published.append(countries_with_data)
+
+                now = [0]
+                watcher = Watcher(
+                    plan,
+                    hapi_output,
+                    process_country,
+                    publish_global,
+                    2024,
+                    input_dir,
+                    poll_interval=60,
+                    debounce=100,
+                    recheck_interval=1000,
+                    clock=lambda: now[0],
+                )
+                # The failing country does not stop the others being processed
+                assert watcher.poll() == ["AFG", "SDN"]
+                assert watcher.get_countries_with_data() == ["SDN"]
+                assert {row[0] for row in plan.get_global_rows()} == {"SDN"}
+                now[0] = 60
+                # The failing country is retried even though it has not changed
+                assert watcher.poll() == ["AFG"]
+                assert watcher.get_countries_with_data() == ["SDN"]
+                failing.clear()
+                now[0] = 120
+                assert watcher.poll() == ["AFG"]
+                assert watcher.get_countries_with_data() == ["AFG", "SDN"]
+                now[0] = 180
+                assert watcher.poll() == []
+                now[0] = 220
+                # A failed rebuild is retried after the debounce period
+                assert watcher.publish_global_if_due() is False
+                assert watcher.get_seconds_until_global() == 100
+                now[0] = 320
+                assert watcher.publish_global_if_due() is True
+                assert published == [None, ["AFG", "SDN"]]
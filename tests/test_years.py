@@ -0,0 +1,15 @@
+from hdx.utilities.dateparse import parse_date
+
+from hdx.scraper.hno.__main__ import get_years
+
+
+class TestYears:
+    def test_get_years(self, monkeypatch):
+        today = parse_date("2026-10-19")
+        monkeypatch.delenv("YEAR", raising=False)
+        assert get_years(None, "", today) == [2026]
+        assert get_years("2024", "", today) == [2024]
+        monkeypatch.setenv("YEAR", "2023")
+        assert get_years(None, "", today) == [2023]
+        assert get_years("2024", "2020-2022", today) == [2020, 2021, 2022]
+        assert get_years(None, "2024,2020-2021,2024", today) == [2020, 2021, 2024]